@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # Developer Management Tool - Comprehensive developer workspace management
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, stream_with_context, send_from_directory
 from flask_login import LoginManager, login_required, current_user
 import requests
 import os
@@ -8,6 +8,26 @@ import psycopg2
 import paramiko
 from src.api_endpoints import api_bp
 from src.database import db
+from src.pg_pool import pg_manager, MAINTENANCE_DB
+from src.settings_cache import SettingsCache, SETTINGS_VERSION_KEY
+from src.filestore_index import FilestoreIndex
+from src.db_snapshot import DatabaseSnapshotRefresher, filter_snapshots, page_snapshots
+from src.enterprise import extend_licenses
+from src.record_count import record_counter
+from src.size_history import SizeHistory
+from src.restore import find_dump_member, restore_zip, restore_dump_file, restore_tar_zst, TAR_ZST_SUFFIX
+from src.operations import Operation, operations
+from src.clone import clone_database as run_clone
+from src.backup import backup_database as run_backup, backup_filename, BackupError, CONTAINERS as BACKUP_CONTAINERS, DUMP_FORMATS
+from src.trash import FilestoreTrash
+from src.drop import terminate_sessions, drop_database as run_drop
+from src.uploads import ChunkedUploads, UploadError
+from src.local_sources import SourceError, source_roots, resolve as resolve_source
+from src.restore_cache import RestoreCache
+from src.dedup import FilestoreDeduplicator
+from src.integrity import check_filestore as run_filestore_check
+from src.filestore_gc import collect_garbage as run_filestore_gc, GRACE_SECONDS as GC_GRACE_SECONDS
+from src.ssh_registry import SSHRegistry, parse_tags, SORT_KEYS as SERVER_SORT_KEYS, DEFAULT_PAGE_SIZE as SERVERS_PAGE_SIZE
 import subprocess
 import json
 import re
@@ -16,11 +36,12 @@ import tempfile
 import shutil
 import glob
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
 import logging
 import importlib.metadata
 import importlib.util
-from models import Project, Task, TaskNote, ProjectServer, ProjectDatabase, Setting, User
+from models import Project, Task, TaskNote, ProjectServer, ProjectDatabase, Setting, User, DatabaseSnapshot
 from auth import check_subscription_status, subscription_required, premium_feature_required, get_subscription_portal_url
 from src.portal_auth import get_portal_user_status, premium_required
 from flask_sock import Sock
@@ -106,61 +127,93 @@ def get_portal_user_status():
 # Global settings
 SSH_CONFIG_DIR = os.path.expanduser("~/.ssh/config.d")
 FILESTORE_DIR = os.path.expanduser("~/.local/share/Odoo/filestore")
+DATA_DIR = os.path.expanduser("~/.local/share/odoo-developer-tools")
+BACKUP_DIR = os.path.join(DATA_DIR, "backups")
 
 # Ensure necessary directories exist
 os.makedirs(SSH_CONFIG_DIR, exist_ok=True)
 os.makedirs(FILESTORE_DIR, exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
+os.makedirs(BACKUP_DIR, exist_ok=True)
+
+# config.d is parsed once and re-read only when files change
+ssh_registry = SSHRegistry(SSH_CONFIG_DIR)
+
+# Filestore sizes are maintained incrementally instead of walked per request
+filestore_index = FilestoreIndex(FILESTORE_DIR, state_path=os.path.join(DATA_DIR, 'filestore_index.json'))
+
+# Dropped filestores are renamed into a trash directory and deleted in the background
+filestore_trash = FilestoreTrash(FILESTORE_DIR)
+
+# Large backups are uploaded in resumable chunks instead of one request
+chunked_uploads = ChunkedUploads(app.config['UPLOAD_FOLDER'])
+
+# Pristine copies of restored backups, keyed by backup hash, for fast repeat restores
+restore_cache = RestoreCache(os.path.join(DATA_DIR, 'restore_cache'))
+
+# Identical attachments across database filestores are hardlinked to a single copy
+filestore_dedup = FilestoreDeduplicator(FILESTORE_DIR, os.path.join(DATA_DIR, 'filestore_dedup.sqlite'))
 
 # === Helper Functions ===
 
+def load_settings():
+    """Load all settings from the database"""
+    return {setting.key: setting.value for setting in Setting.query.all()}
+
+def load_settings_version():
+    """Get the settings version counter from the database"""
+    setting = Setting.query.filter_by(key=SETTINGS_VERSION_KEY).first()
+    return setting.value if setting else None
+
+def bump_settings_version():
+    """Increment the settings version counter (commit is left to the caller)"""
+    setting = Setting.query.filter_by(key=SETTINGS_VERSION_KEY).first()
+    if setting:
+        setting.value = str(int(setting.value or 0) + 1)
+    else:
+        setting = Setting(key=SETTINGS_VERSION_KEY, value='1',
+                          description='Incremented whenever settings change')
+        db.session.add(setting)
+
+settings_cache = SettingsCache(load_settings, load_settings_version)
+
 def get_setting(key, default=None):
-    """Get a setting value from the database"""
+    """Get a setting value from the in-memory settings snapshot"""
     try:
-        setting = Setting.query.filter_by(key=key).first()
-        return setting.value if setting else default
+        return settings_cache.get(key, default)
     except Exception as e:
         logger.error(f"Error getting setting {key}: {str(e)}")
         return default
 
+def get_connection_params():
+    """Get PostgreSQL connection settings from the database"""
+    return {
+        'user': get_setting('postgres_user', 'postgres'),
+        'password': get_setting('postgres_password', ''),
+        'host': get_setting('postgres_host', '127.0.0.1'),
+        'port': get_setting('postgres_port', '5432')
+    }
+
 def get_db_connection():
-    """Create a connection to PostgreSQL using settings from the database"""
+    """Get a pooled connection to the PostgreSQL maintenance database.
+
+    Calling close() on the returned connection hands it back to the pool.
+    """
     try:
-        # Get PostgreSQL connection settings from database
+        # Get settings with defaults if not set
         with app.app_context():
-            # Get settings with defaults if not set
-            user = get_setting('postgres_user', 'postgres')
-            password = get_setting('postgres_password', '')
-            host = get_setting('postgres_host', '127.0.0.1')
-            port = get_setting('postgres_port', '5432')
-
-        logger.info(f"Attempting to connect to PostgreSQL at {host}:{port} as user {user}")
-
-        # Build connection string based on whether password is provided
-        if password:
-            conn = psycopg2.connect(
-                dbname="postgres",
-                user=user,
-                password=password,
-                host=host,
-                port=port
-            )
-        else:
-            # Use peer authentication (no password)
-            conn = psycopg2.connect(
-                dbname="postgres",
-                user=user,
-                host=host,
-                port=port
-            )
-            
-        conn.autocommit = True
-        logger.info("Successfully connected to PostgreSQL")
-        return conn
+            conn_params = get_connection_params()
+
+        return pg_manager.getconn(MAINTENANCE_DB, conn_params)
     except Exception as e:
         logger.error(f"Database connection error: {str(e)}")
         flash(f'Could not connect to PostgreSQL: {str(e)}', 'danger')
         return None
 
+def get_database_connection(db_name):
+    """Get a pooled connection to a specific database"""
+    return pg_manager.getconn(db_name, get_connection_params())
+
 def format_size(size_bytes):
     """Format size in bytes to human-readable format"""
     if size_bytes > 1073741824:  # 1 GB
@@ -180,50 +233,55 @@ def get_dir_size(path):
                 pass
     return total_size
 
+def get_filestore_size(db_name):
+    """Get the filestore size of a database in bytes, or None if it has no filestore"""
+    filestore_index.ensure_started()
+    size = filestore_index.size(db_name)
+    if size is None and not filestore_index.ready:
+        # Index not built yet; measure this one directly
+        filestore_path = os.path.join(FILESTORE_DIR, db_name)
+        if os.path.exists(filestore_path):
+            size = get_dir_size(filestore_path)
+    return size
+
+# Database metadata is kept in a persisted snapshot refreshed in the background
+snapshot_refresher = DatabaseSnapshotRefresher(app, DatabaseSnapshot, get_connection_params, get_filestore_size)
+
+# Size samples taken from the snapshot on a schedule, for growth sparklines
+size_history = SizeHistory(os.path.join(DATA_DIR, 'size_history'), app, DatabaseSnapshot, get_connection_params)
+
+def format_age(timestamp):
+    """Format how long ago a (naive UTC) datetime was, e.g. '5 min ago'"""
+    if not timestamp:
+        return "never"
+    seconds = max(0, int((datetime.utcnow() - timestamp).total_seconds()))
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60} min ago"
+    if seconds < 86400:
+        return f"{seconds // 3600} h ago"
+    return f"{seconds // 86400} d ago"
+
+def snapshot_to_dict(snapshot):
+    """Convert a DatabaseSnapshot into the row format used by the databases page"""
+    filestore_bytes = snapshot.filestore_bytes
+    return {
+        'name': snapshot.name,
+        'owner': snapshot.owner,
+        'version': snapshot.version,
+        'expiration_date': snapshot.expiration_date,
+        'size': format_size(snapshot.size_bytes or 0),
+        'filestore_size': format_size(filestore_bytes) if filestore_bytes is not None else "N/A",
+        'is_enterprise': snapshot.is_enterprise,
+        'probe_status': snapshot.probe_status,
+        'refreshed_at': snapshot.refreshed_at.isoformat() if snapshot.refreshed_at else None,
+        'refreshed_ago': format_age(snapshot.refreshed_at)
+    }
+
 def get_ssh_servers():
     """Get list of SSH servers from config files"""
-    if not os.path.exists(SSH_CONFIG_DIR):
-        return []
-        
-    # List all .conf files in the SSH config directory
-    config_files = [f for f in os.listdir(SSH_CONFIG_DIR) if f.endswith('.conf')]
-    
-    servers = []
-    for conf_file in config_files:
-        file_path = os.path.join(SSH_CONFIG_DIR, conf_file)
-        with open(file_path, 'r') as f:
-            content = f.read()
-            
-        # Parse the SSH config file
-        host = None
-        hostname = None
-        user = None
-        port = "22"  # Default
-        key_file = None
-        
-        for line in content.splitlines():
-            line = line.strip()
-            if line.startswith('Host '):
-                host = line.split(' ', 1)[1].strip()
-            elif line.startswith('HostName '):
-                hostname = line.split(' ', 1)[1].strip()
-            elif line.startswith('User '):
-                user = line.split(' ', 1)[1].strip()
-            elif line.startswith('Port '):
-                port = line.split(' ', 1)[1].strip()
-            elif line.startswith('IdentityFile '):
-                key_file = line.split(' ', 1)[1].strip()
-        
-        if host and hostname:
-            servers.append({
-                'host': host,
-                'hostname': hostname,
-                'user': user or "",
-                'port': port,
-                'key_file': key_file or ""
-            })
-    
-    return servers
+    return ssh_registry.servers()
 
 def update_main_ssh_config():
     """Ensure the main SSH config includes the config.d directory"""
@@ -310,9 +368,17 @@ def index():
 # === SSH Server Routes ===
 @app.route('/servers')
 def ssh_servers():
-    """Remote Server management page"""
-    servers = get_ssh_servers()
-    return render_template('ssh.html', servers=servers)
+    """Remote Server management page; the first page is rendered, the rest comes from /api/servers"""
+    query = request.args.get('q', '').strip()
+    tag = request.args.get('tag', '').strip()
+    sort = request.args.get('sort', 'host')
+    if sort not in SERVER_SORT_KEYS:
+        sort = 'host'
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    servers, total = ssh_registry.search(query=query, tag=tag, sort=sort, descending=order == 'desc',
+                                         limit=SERVERS_PAGE_SIZE)
+    return render_template('ssh.html', servers=servers, total=total, tags=ssh_registry.tags(),
+                           query=query, tag=tag, sort=sort, order=order, page_size=SERVERS_PAGE_SIZE)
 
 @app.route('/servers/add', methods=['GET', 'POST'])
 def add_ssh_server():
@@ -326,6 +392,7 @@ def add_ssh_server():
         auth_method = request.form.get('auth_method', 'key')
         key_file = request.form.get('key_file', '').strip() if auth_method == 'key' else ''
         password = request.form.get('password', '').strip() if auth_method == 'password' else ''
+        tags = ', '.join(parse_tags(request.form.get('tags', '')))
         
         # Validate inputs
         if not host or not hostname:
@@ -347,12 +414,13 @@ def add_ssh_server():
                     'port': port,
                     'auth_method': auth_method,
                     'key_file': key_file,
-                    'password': password
+                    'password': password,
+                    'tags': tags
                 }
                 return render_template('ssh_add.html', overwrite=True, 
                                       host=host, hostname=hostname, 
                                       user=user, port=port, auth_method=auth_method,
-                                      key_file=key_file, password=password)
+                                      key_file=key_file, password=password, tags=tags)
         
         # Write the configuration file
         with open(config_file, 'w') as f:
@@ -361,6 +429,8 @@ def add_ssh_server():
             if user:
                 f.write(f"    User {user}\n")
             f.write(f"    Port {port}\n")
+            if tags:
+                f.write(f"    # Tags: {tags}\n")
             
             # Authentication settings
             if auth_method == 'key' and key_file:
@@ -372,6 +442,7 @@ def add_ssh_server():
                 # Store password in a safer way in a real-world application
                 # For this demo, we'll add it as a comment (NOT recommended for production)
                 f.write(f"    # Password: {password}\n")
+        ssh_registry.invalidate()
         
         # Update main SSH config if needed
         update_main_ssh_config()
@@ -387,7 +458,8 @@ def add_ssh_server():
                               hostname=overwrite_data.get('hostname', ''), 
                               user=overwrite_data.get('user', ''),
                               port=overwrite_data.get('port', '22'),
-                              key_file=overwrite_data.get('key_file', ''))
+                              key_file=overwrite_data.get('key_file', ''),
+                              tags=overwrite_data.get('tags', ''))
     
     return render_template('ssh_add.html')
 
@@ -404,8 +476,7 @@ def delete_ssh_server(host):
             return redirect(url_for('ssh_servers'))
             
         # Get server details for display
-        servers = get_ssh_servers()
-        server = next((s for s in servers if s['host'] == host), None)
+        server = ssh_registry.get(host)
         
         if not server:
             flash(f"SSH server {host} not found.", "danger")
@@ -417,6 +488,7 @@ def delete_ssh_server(host):
         
         # If POST request, process deletion
         os.remove(config_file)
+        ssh_registry.invalidate()
         
         # Ensure the main SSH config includes the config.d directory
         update_main_ssh_config()
@@ -431,25 +503,22 @@ def delete_ssh_server(host):
 @app.route('/servers/generate_command/<host>', methods=['GET'])
 def generate_ssh_command(host):
     """Generate a Remote Server command for the client to execute"""
-    servers = get_ssh_servers()
-    
-    # Find the server with matching host
-    for server in servers:
-        if server.get('host') == host:
-            # Build ssh command with appropriate flags
-            command = f"ssh {server.get('host')}"
-            
-            # Add authentication info to command response
-            auth_type = 'key' if server.get('identity_file') else 'password'
-            response = {
-                'command': command,
-                'auth_type': auth_type,
-                'host': server.get('host'),
-                'user': server.get('user', ''),
-                'hostname': server.get('hostname', '')
-            }
-            
-            return jsonify(response)
+    server = ssh_registry.get(host)
+    if server:
+        # Build ssh command with appropriate flags
+        command = f"ssh {server.get('host')}"
+        
+        # Add authentication info to command response
+        auth_type = 'key' if server.get('key_file') else 'password'
+        response = {
+            'command': command,
+            'auth_type': auth_type,
+            'host': server.get('host'),
+            'user': server.get('user', ''),
+            'hostname': server.get('hostname', '')
+        }
+        
+        return jsonify(response)
     
     return jsonify({'error': 'Server not found'})
 
@@ -507,15 +576,7 @@ def ssh_server_details(host):
     portal_status = get_portal_user_status()
     is_premium = portal_status and portal_status.get('is_premium', False)
     
-    servers = get_ssh_servers()
-    
-    # Find the specific server
-    server = None
-    for s in servers:
-        if s['host'] == host:
-            server = s
-            break
-    
+    server = ssh_registry.get(host)
     if not server:
         flash(f'SSH server "{host}" not found', 'danger')
         return redirect(url_for('ssh_servers'))
@@ -535,16 +596,7 @@ def edit_ssh_server(host):
         flash('This feature requires a premium subscription', 'warning')
         return redirect(url_for('settings'))
     
-    # Get all servers
-    servers = get_ssh_servers()
-    
-    # Find the specific server
-    server = None
-    for s in servers:
-        if s['host'] == host:
-            server = s
-            break
-    
+    server = ssh_registry.get(host)
     if not server:
         flash(f'SSH server "{host}" not found', 'danger')
         return redirect(url_for('ssh_servers'))
@@ -558,6 +610,7 @@ def edit_ssh_server(host):
         auth_method = request.form.get('auth_method', 'key')
         key_file = request.form.get('key_file', '').strip() if auth_method == 'key' else ''
         password = request.form.get('password', '').strip() if auth_method == 'password' else ''
+        tags = ', '.join(parse_tags(request.form.get('tags', '')))
         
         # Validate inputs
         if not new_host or not hostname:
@@ -580,6 +633,8 @@ def edit_ssh_server(host):
             if user:
                 f.write(f"    User {user}\n")
             f.write(f"    Port {port}\n")
+            if tags:
+                f.write(f"    # Tags: {tags}\n")
             
             # Authentication settings
             if auth_method == 'key' and key_file:
@@ -595,6 +650,7 @@ def edit_ssh_server(host):
         # Rename config file if hostname changed
         if new_host != host:
             os.rename(config_file, new_config_file)
+        ssh_registry.invalidate()
         
         # Update main SSH config if needed
         update_main_ssh_config()
@@ -606,539 +662,704 @@ def edit_ssh_server(host):
 
 # === Database Routes ===
 
+# Rows rendered with the /databases page; further rows are fetched page by page
+DATABASES_PAGE_SIZE = 100
+
 @app.route('/databases')
 def list_databases():
-    """List all Odoo databases"""
-    conn = get_db_connection()
-    
-    if not conn:
-        return render_template('databases.html', databases=[])
-    
+    """List all Odoo databases from the metadata snapshot"""
+    snapshot_refresher.ensure_started()
+    size_history.ensure_started()
+    filestore_trash.ensure_started()
+    
+    query = filter_snapshots(DatabaseSnapshot)
+    total = query.count()
+    if not total and snapshot_refresher.last_refresh is None:
+        # First visit: build the snapshot now instead of showing an empty page
+        try:
+            snapshot_refresher.refresh()
+            total = query.count()
+        except Exception as e:
+            logger.error(f"Error listing databases: {str(e)}")
+            flash(f'Error listing databases: {str(e)}', 'danger')
+            return render_template('databases.html', databases=[])
+    
+    if snapshot_refresher.last_error:
+        flash(f'Could not refresh database information: {snapshot_refresher.last_error}', 'warning')
+    elif not total:
+        flash('No databases found. Please check your PostgreSQL connection settings.', 'warning')
+    
+    # Render the first page; the rest is loaded progressively from /api/databases
+    snapshots, next_cursor = page_snapshots(query, DatabaseSnapshot, limit=DATABASES_PAGE_SIZE)
+    databases = [snapshot_to_dict(snapshot) for snapshot in snapshots]
+    last_refreshed = db.session.query(db.func.max(DatabaseSnapshot.refreshed_at)).scalar()
+    
+    return render_template('databases.html', databases=databases,
+                           total_databases=total,
+                           next_cursor=next_cursor,
+                           last_refreshed=format_age(last_refreshed) if last_refreshed else None)
+
+@app.route('/databases/refresh', methods=['POST'])
+def refresh_databases():
+    """Refresh the metadata snapshot of all databases"""
     try:
-        cursor = conn.cursor()
-        
-        # Get all databases with size
-        cursor.execute("""
-            SELECT 
-                d.datname AS database_name, 
-                u.usename AS owner,
-                pg_database_size(d.datname) AS size_bytes
-            FROM 
-                pg_database d
-                JOIN pg_user u ON d.datdba = u.usesysid
-            WHERE 
-                d.datname NOT IN ('postgres', 'template0', 'template1')
-            ORDER BY 
-                d.datname
-        """)
-        
-        db_rows = cursor.fetchall()
-        databases = []
-        
-        for db_name, owner, size_bytes in db_rows:
-            # Format database size
-            db_size = format_size(size_bytes)
-            
-            # Check if it's an Odoo database and get version
-            odoo_version = "Not Odoo DB"
-            is_enterprise = False
-            expiration_date = None
-            
-            try:
-                # Try to connect to the specific database
-                db_conn = psycopg2.connect(
-                    dbname=db_name,
-                    user=get_setting('postgres_user', 'postgres'),
-                    password=get_setting('postgres_password', ''),
-                    host=get_setting('postgres_host', '127.0.0.1'),
-                    port=get_setting('postgres_port', '5432')
-                )
-                db_cursor = db_conn.cursor()
-                
-                # Check if it's an Odoo database
-                db_cursor.execute("""
-                    SELECT 1 FROM information_schema.tables
-                    WHERE table_name = 'ir_module_module'
-                """)
-                
-                if db_cursor.fetchone():
-                    # Get Odoo version from base module
-                    db_cursor.execute("""
-                        SELECT latest_version FROM ir_module_module
-                        WHERE name = 'base' LIMIT 1
-                    """)
-                    version_row = db_cursor.fetchone()
-                    if version_row:
-                        odoo_version = version_row[0]
-                    
-                    # Check if it's Enterprise
-                    db_cursor.execute("""
-                        SELECT 1 FROM ir_module_module
-                        WHERE name = 'web_enterprise' AND state = 'installed'
-                    """)
-                    is_enterprise = bool(db_cursor.fetchone())
-                    
-                    # Try to get the expiration date for enterprise databases
-                    if is_enterprise:
-                        try:
-                            db_cursor.execute("""
-                                SELECT value FROM ir_config_parameter
-                                WHERE key = 'database.expiration_date'
-                            """)
-                            date_row = db_cursor.fetchone()
-                            if date_row:
-                                expiration_date = date_row[0]
-                        except Exception as e:
-                            logger.error(f"Error getting expiration date for {db_name}: {str(e)}")
-                
-                db_cursor.close()
-                db_conn.close()
-            except Exception as e:
-                logger.error(f"Error checking database {db_name}: {str(e)}")
-                # Continue with default values if we can't check the database
-            
-            # Get filestore size
-            filestore_path = os.path.join(FILESTORE_DIR, db_name)
-            if os.path.exists(filestore_path):
-                filestore_bytes = get_dir_size(filestore_path)
-                filestore_size = format_size(filestore_bytes)
-            else:
-                filestore_size = "N/A"
-            
-            # Add database to list
-            databases.append({
-                'name': db_name,
-                'owner': owner,
-                'version': odoo_version,
-                'expiration_date': expiration_date,
-                'size': db_size,
-                'filestore_size': filestore_size,
-                'is_enterprise': is_enterprise
-            })
-        
-        cursor.close()
-        conn.close()
-        
-        if not databases:
-            flash('No databases found. Please check your PostgreSQL connection settings.', 'warning')
-        
-        return render_template('databases.html', databases=databases)
-        
+        probed = snapshot_refresher.refresh()
+        return jsonify({'success': True, 'probed': probed})
     except Exception as e:
-        logger.error(f"Error listing databases: {str(e)}")
-        flash(f'Error listing databases: {str(e)}', 'danger')
-        return render_template('databases.html', databases=[])
+        logger.error(f"Error refreshing databases: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/databases/<db_name>/refresh', methods=['POST'])
+def refresh_database(db_name):
+    """Re-probe a single database and return its updated row"""
+    try:
+        snapshot_refresher.refresh([db_name], force=True)
+        snapshot = DatabaseSnapshot.query.filter_by(name=db_name).first()
+        if not snapshot:
+            return jsonify({'success': False, 'message': f'Database {db_name} not found'}), 404
+        return jsonify({'success': True, 'database': snapshot_to_dict(snapshot)})
+    except Exception as e:
+        logger.error(f"Error refreshing database {db_name}: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def estimate_backup_bytes(db_name):
+    """Rough amount of data a backup reads: database size plus filestore size"""
+    snapshot = DatabaseSnapshot.query.filter_by(name=db_name).first()
+    return (snapshot.size_bytes if snapshot else 0) + (get_filestore_size(db_name) or 0)
+
+def backup_job(operation, db_name, conn_params, container, dump_format, estimated_bytes):
+    """Back up a database into BACKUP_DIR for download; the file name is added as a result"""
+    filestore_path = filestore_path_of(db_name)
+    filename = backup_filename(db_name, container)
+    path = os.path.join(BACKUP_DIR, filename)
+    try:
+        message = run_backup(operation, db_name, conn_params, filestore_path, open(path, 'wb'),
+                             container=container, dump_format=dump_format, work_dir=BACKUP_DIR,
+                             estimated_bytes=estimated_bytes)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    operation.add_result({'filename': filename, 'size': os.path.getsize(path)})
+    return message
+
+def backup_before_drop(operation, db_name, conn_params, estimated_bytes):
+    """Back up a database into BACKUP_DIR; returns the backup path"""
+    path = os.path.join(BACKUP_DIR, backup_filename(db_name))
+    try:
+        run_backup(operation, db_name, conn_params, filestore_path_of(db_name), open(path, 'wb'),
+                   work_dir=BACKUP_DIR, estimated_bytes=estimated_bytes)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        raise BackupError(f'Backup failed, database was not dropped: {str(e)}') from e
+    return path
+
+@app.route('/databases/backup/<db_name>', methods=['GET', 'POST'])
+def backup_database(db_name):
+    """Write an Odoo-compatible backup of a database and its filestore, then offer it for download"""
+    if not is_known_database(db_name):
+        return unknown_database(db_name)
+    
+    values = request.form if request.method == 'POST' else request.args
+    container = values.get('format', 'zip')
+    dump_format = values.get('dump', 'plain' if container == 'zip' else 'directory')
+    if container not in BACKUP_CONTAINERS or dump_format not in DUMP_FORMATS:
+        if wants_json():
+            return jsonify({'success': False, 'message': 'Invalid backup format'}), 400
+        flash('Invalid backup format', 'danger')
+        return redirect(url_for('list_databases'))
+    
+    if request.method == 'POST':
+        # The backup runs in the background, not inside this request
+        operation = operations.start('backup-database', f'Back up {db_name}', backup_job, db_name,
+                                     get_connection_params(), container, dump_format,
+                                     estimate_backup_bytes(db_name))
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Backup of "{db_name}" started; it is saved to {BACKUP_DIR}', 'info')
+        return redirect(url_for('list_databases'))
+    
+    return render_template('backup_database.html', db_name=db_name, container=container, dump_format=dump_format,
+                           containers=BACKUP_CONTAINERS, dump_formats=DUMP_FORMATS)
+
+@app.route('/databases/backups/<path:filename>')
+def download_backup(filename):
+    """Download a finished backup from BACKUP_DIR"""
+    return send_from_directory(BACKUP_DIR, filename, as_attachment=True)
+
+def is_known_database(db_name):
+    """Whether ``db_name`` is in the database inventory"""
+    return DatabaseSnapshot.query.filter_by(name=db_name).first() is not None
+
+def unknown_database(db_name):
+    """Response for a database name that isn't in the inventory"""
+    message = f'Database "{db_name}" not found'
+    if wants_json():
+        return jsonify({'success': False, 'message': message}), 404
+    flash(message, 'danger')
+    return redirect(url_for('list_databases'))
+
+def filestore_path_of(db_name):
+    """Filestore directory of ``db_name``; refuses names resolving outside FILESTORE_DIR"""
+    path = os.path.join(FILESTORE_DIR, db_name)
+    if os.path.dirname(os.path.realpath(path)) != os.path.realpath(FILESTORE_DIR):
+        raise ValueError(f'Invalid database name: {db_name}')
+    return path
+
+def trash_dropped_database(db_name):
+    """Forget a dropped database and move its filestore to the trash; returns the trash entry"""
+    # Renaming is instant; the space is reclaimed in the background. The trash measures what
+    # unlinking frees itself, since hardlinked (deduplicated) files free nothing
+    entry = filestore_trash.move(filestore_path_of(db_name), db_name)
+    snapshot_refresher.forget(db_name)
+    record_counter.invalidate(db_name)
+    return entry
+
+def drop_job(operation, db_name, conn_params, backup_first, estimated_bytes):
+    """Drop a database and move its filestore to the trash, optionally backing it up first"""
+    backup_path = None
+    if backup_first:
+        backup_path = backup_before_drop(operation, db_name, conn_params, estimated_bytes)
+    
+    operation.update(phase='Dropping database')
+    terminate_sessions([db_name], conn_params)
+    run_drop(db_name, conn_params)
+    
+    operation.update(phase='Moving filestore to the trash')
+    entry = trash_dropped_database(db_name)
+    
+    message = f'Database "{db_name}" has been dropped'
+    if entry:
+        message += ', its filestore is being reclaimed in the background'
+    if backup_path:
+        message += f' (backup saved to {backup_path})'
+    return message
+
+# Concurrent DROP DATABASE statements in a bulk drop
+BULK_DROP_WORKERS = 4
+
+def bulk_drop_job(operation, db_names, conn_params, backup_first, estimated_bytes):
+    """Drop several databases: one termination pass, then drops on a small thread pool"""
+    operation.update(phase=f'Terminating sessions on {len(db_names)} databases', items_total=len(db_names))
+    terminated = terminate_sessions(db_names, conn_params)
+    operation.update(phase=f'Dropping {len(db_names)} databases')
+    
+    def drop_one(db_name):
+        try:
+            backup_path = None
+            if backup_first:
+                backup_path = backup_before_drop(Operation('backup-database', f'Back up {db_name}'),
+                                                 db_name, conn_params, estimated_bytes.get(db_name))
+            run_drop(db_name, conn_params)
+            entry = trash_dropped_database(db_name)
+            result = {
+                'database': db_name,
+                'status': 'success',
+                'filestore_trashed': entry is not None,
+                'filestore_bytes': entry.bytes_total if entry else None,
+                'backup': backup_path,
+            }
+        except Exception as e:
+            logger.error(f"Error dropping database {db_name}: {str(e)}")
+            result = {'database': db_name, 'status': 'error', 'message': str(e)}
+        operation.add_result(result, items_done=1)
+        return result
+    
+    with ThreadPoolExecutor(max_workers=BULK_DROP_WORKERS, thread_name_prefix='bulk-drop') as executor:
+        results = list(executor.map(drop_one, db_names))
+    
+    failed = sum(1 for result in results if result['status'] != 'success')
+    message = f'Dropped {len(results) - failed} of {len(results)} databases ({terminated} sessions terminated)'
+    if failed:
+        message += f', {failed} failed'
+    return message
 
 @app.route('/databases/drop/<db_name>', methods=['GET', 'POST'])
 def drop_database(db_name):
     """Drop a database and its filestore"""
+    if not is_known_database(db_name):
+        return unknown_database(db_name)
+    
     if request.method == 'POST':
-        try:
-            # Connect to PostgreSQL
-            conn = get_db_connection()
-            if not conn:
-                flash('Could not connect to PostgreSQL', 'danger')
-                return redirect(url_for('list_databases'))
-            
+        backup_first = get_setting('auto_backup_before_drop') == 'true'
+        operation = operations.start('drop-database', f'Drop {db_name}', drop_job, db_name,
+                                     get_connection_params(), backup_first,
+                                     estimate_backup_bytes(db_name) if backup_first else None)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Dropping "{db_name}" started', 'info')
+        return redirect(url_for('list_databases'))
+    
+    # Confirmation page
+    return render_template('drop_database.html', db_name=db_name,
+                           backup_first=get_setting('auto_backup_before_drop') == 'true')
+
+@app.route('/databases/drop_bulk', methods=['GET', 'POST'])
+def drop_databases():
+    """Drop several databases and their filestores at once"""
+    names = selected_databases() if request.method == 'POST' else list(dict.fromkeys(request.args.getlist('databases')))
+    known = {snapshot.name for snapshot in DatabaseSnapshot.query.filter(DatabaseSnapshot.name.in_(names)).all()}
+    db_names = [name for name in names if name in known]
+    backup_first = get_setting('auto_backup_before_drop') == 'true'
+    
+    if not db_names:
+        if wants_json():
+            return jsonify({'success': False, 'message': 'No databases selected'}), 400
+        flash('No databases selected', 'warning')
+        return redirect(url_for('list_databases'))
+    
+    if request.method == 'POST':
+        estimated_bytes = {name: estimate_backup_bytes(name) for name in db_names} if backup_first else {}
+        operation = operations.start('drop-databases', f'Drop {len(db_names)} databases', bulk_drop_job,
+                                     db_names, get_connection_params(), backup_first, estimated_bytes)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Dropping {len(db_names)} databases started', 'info')
+        return redirect(url_for('list_databases'))
+    
+    return render_template('drop_databases.html', db_names=db_names, backup_first=backup_first)
+
+def wants_json():
+    """Whether the client asked for a JSON response (the page's fetch/XHR calls do)"""
+    return request.accept_mimetypes.best == 'application/json'
+
+def restore_cache_limit():
+    """Restore cache size in bytes from the settings (0 disables the cache)"""
+    try:
+        return max(float(get_setting('restore_cache_size_gb', '20')), 0) * 1024 ** 3
+    except ValueError:
+        return 0
+
+def restore_job(operation, db_name, filepath, backup_kind, deactivate_cron, deactivate_mail, reset_admin,
+                remove_file=True, use_cache=True, source_name=None):
+    """Restore a saved backup into ``db_name``, reporting progress on ``operation``.
+
+    Uploaded files are removed afterwards; server-side sources (``remove_file=False``) are kept.
+    With ``use_cache`` a backup restored before is cloned from the restore cache instead.
+    """
+    backup = None
+    try:
+        with app.app_context():
+            conn_params = get_connection_params()
+            restore_cache.max_bytes = restore_cache_limit()
+        
+        cache_key = None
+        if use_cache and restore_cache.max_bytes:
+            operation.update(phase='Hashing backup')
+            cache_key = restore_cache.key_for(filepath, progress=operation)
+        
+        # Drop the database if it exists
+        operation.update(phase='Creating database')
+        pg_manager.close_pool(db_name)
+        with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
             cursor = conn.cursor()
-            
-            # First terminate all connections to the database
-            cursor.execute(f"""
+            cursor.execute("""
                 SELECT pg_terminate_backend(pid) 
                 FROM pg_stat_activity 
-                WHERE datname = '{db_name}'
-            """)
-            
-            # Drop the database
+                WHERE datname = %s
+            """, (db_name,))
             cursor.execute(f"DROP DATABASE IF EXISTS \"{db_name}\"")
-            
-            # Remove the filestore if it exists
-            filestore_path = os.path.join(FILESTORE_DIR, db_name)
-            if os.path.exists(filestore_path):
-                shutil.rmtree(filestore_path)
-                
             cursor.close()
-            conn.close()
+        filestore_path = filestore_path_of(db_name)
+        filestore_trash.move(filestore_path, db_name)
+        
+        cached = cache_key is not None and restore_cache.restore_from(
+            cache_key, db_name, conn_params, filestore_path, progress=operation)
+        if cached:
+            logger.info(f"Restored {db_name} from the restore cache ({cache_key[:16]})")
+        else:
+            # Create new database
+            with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"CREATE DATABASE \"{db_name}\" TEMPLATE template0 ENCODING 'UTF8'")
+                cursor.close()
             
-            flash(f'Database "{db_name}" and its filestore have been dropped', 'success')
-        except Exception as e:
-            flash(f'Error dropping database: {str(e)}', 'danger')
+            # Restore the SQL dump (and the filestore, written in place while psql loads)
+            if backup_kind == 'dump':
+                dump_format = restore_dump_file(filepath, db_name, conn_params, progress=operation)
+                logger.info(f"Restored {db_name} from a {dump_format} dump")
+            else:
+                if backup_kind == 'tar.zst':
+                    stats = restore_tar_zst(filepath, db_name, conn_params, filestore_path,
+                                            work_dir=app.config['UPLOAD_FOLDER'], progress=operation)
+                else:
+                    backup = zipfile.ZipFile(filepath)
+                    stats = restore_zip(backup, db_name, conn_params, filestore_path,
+                                        work_dir=app.config['UPLOAD_FOLDER'], progress=operation)
+                logger.info(f"Restored {db_name} from a {stats['format']} dump with "
+                            f"{stats['filestore_files']} filestore files ({format_size(stats['filestore_bytes'])})")
+            
+            # Keep the restore as it came out of the backup, before the options below change it
+            if cache_key is not None:
+                restore_cache.store(cache_key, db_name, conn_params, filestore_path,
+                                    source_name=source_name, progress=operation)
+        
+        # Post-restore operations
+        operation.update(phase='Applying settings')
+        with pg_manager.connection(db_name, conn_params) as conn:
+            cursor = conn.cursor()
         
-        return redirect(url_for('list_databases'))
-    
-    # Confirmation page
-    return render_template('drop_database.html', db_name=db_name)
+            if deactivate_cron:
+                cursor.execute("UPDATE ir_cron SET active = false")
+        
+            if deactivate_mail:
+                cursor.execute("UPDATE ir_mail_server SET active = false")
+                cursor.execute("UPDATE fetchmail_server SET active = false")
+        
+            if reset_admin:
+                cursor.execute("""
+                    UPDATE res_users
+                    SET password = 'admin', login = 'admin'
+                    WHERE id = 2
+                """)
+        
+            cursor.close()
+        
+        operation.update(phase='Finalizing')
+        snapshot_refresher.refresh([db_name], force=True)
+        record_counter.invalidate(db_name)
+        if cached:
+            return f'Database "{db_name}" has been successfully restored from the restore cache'
+        return f'Database "{db_name}" has been successfully restored'
+    finally:
+        # Clean up
+        if backup is not None:
+            backup.close()
+        if remove_file and os.path.exists(filepath):
+            os.remove(filepath)
 
 @app.route('/databases/restore', methods=['GET', 'POST'])
 def restore_database():
     """Restore a database from backup"""
     if request.method == 'POST':
-        # Check if the post request has the file part
-        if 'backup_file' not in request.files:
-            flash('No file part', 'danger')
+        def reject(message):
+            if wants_json():
+                return jsonify({'success': False, 'message': message}), 400
+            flash(message, 'danger')
             return redirect(request.url)
-            
-        file = request.files['backup_file']
         
-        # If user does not select file, browser also submits an empty part without filename
-        if file.filename == '':
-            flash('No selected file', 'danger')
-            return redirect(request.url)
-            
-        if file:
-            # Check if the file is a .dump file
-            is_dump_file = file.filename.lower().endswith('.dump')
-            # Get form data
-            db_name = request.form.get('db_name', '').strip()
-            
-            # Validate database name
-            if not re.match(r'^[a-zA-Z0-9_]+$', db_name):
-                flash('Database name can only contain letters, numbers, and underscores', 'danger')
-                return redirect(request.url)
+        # A backup already on this machine, a completed chunked upload, or a regular file part
+        source_path = request.form.get('source_path', '').strip()
+        upload_id = request.form.get('upload_id', '').strip()
+        file = request.files.get('backup_file')
+        if not source_path and not upload_id:
+            # Check if the post request has the file part
+            if file is None:
+                return reject('No file part')
             
-            # Get options
-            deactivate_cron = 'deactivate_cron' in request.form
-            deactivate_mail = 'deactivate_mail' in request.form
-            reset_admin = 'reset_admin' in request.form
-            
-            # Save the file
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            filename = secure_filename(f"{timestamp}_{file.filename}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            # If user does not select file, browser also submits an empty part without filename
+            if file.filename == '':
+                return reject('No selected file')
+        
+        # Get form data
+        db_name = request.form.get('db_name', '').strip()
+        
+        # Validate database name
+        if not re.match(r'^[a-zA-Z0-9_]+$', db_name):
+            return reject('Database name can only contain letters, numbers, and underscores')
+        
+        # Get options
+        deactivate_cron = 'deactivate_cron' in request.form
+        deactivate_mail = 'deactivate_mail' in request.form
+        reset_admin = 'reset_admin' in request.form
+        use_cache = 'use_cache' in request.form
+        
+        # Save the file; the restore runs in the background, after this request has ended
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        if source_path:
+            # Read in place: no upload and no copy
+            try:
+                filepath = resolve_source(source_path, source_roots(get_setting('restore_source_dirs')))
+            except SourceError as e:
+                return reject(str(e))
+            original_name = os.path.basename(filepath)
+        elif upload_id:
+            try:
+                original_name = chunked_uploads.status(upload_id)['filename']
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(f"{timestamp}_{original_name}"))
+                upload = chunked_uploads.complete(upload_id, filepath)
+                if upload['sha256']:
+                    # Hashed while the chunks arrived; the restore cache needn't read the file again
+                    restore_cache.remember(filepath, upload['sha256'])
+            except UploadError as e:
+                return reject(str(e))
+        else:
+            original_name = file.filename
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(f"{timestamp}_{original_name}"))
             file.save(filepath)
-            
+        
+        # A .dump file, a tar.zst backup written by this tool, or a zip
+        error = None
+        if original_name.lower().endswith('.dump'):
+            backup_kind = 'dump'
+        elif original_name.lower().endswith(TAR_ZST_SUFFIX):
+            backup_kind = 'tar.zst'
+            if not shutil.which('zstd'):
+                error = 'zstd is not installed on this server; it is needed to restore .tar.zst backups'
+        else:
+            backup_kind = 'zip'
             try:
-                # Create temp directory for extraction
-                temp_dir = tempfile.mkdtemp()
-                
-                # Handle direct .dump files or ZIP archives differently
-                if is_dump_file:
-                    # Use the uploaded .dump file directly
-                    dump_file = filepath
-                    dump_found = True
-                    has_filestore = False  # Direct .dump files don't have filestore
-                else:
-                    # Extract the backup zip
-                    try:
-                        with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                            zip_ref.extractall(temp_dir)
-                    except zipfile.BadZipFile:
-                        flash('The uploaded file is not a valid ZIP archive. Please upload a proper ZIP file containing SQL dump or a direct .dump file.', 'danger')
-                        shutil.rmtree(temp_dir)
-                        os.remove(filepath)
-                        return redirect(request.url)
-                    
-                    # Look for the SQL dump file (both dump.sql and *.dump formats)
-                    dump_file = os.path.join(temp_dir, "dump.sql")
-                    dump_found = os.path.exists(dump_file)
-                    
-                    # If dump.sql not found, look for *.dump files
-                    if not dump_found:
-                        dump_files = glob.glob(os.path.join(temp_dir, "*.dump"))
-                        if dump_files:
-                            dump_file = dump_files[0]  # Use the first dump file found
-                            dump_found = True
-                    
-                    if not dump_found:
-                        flash('Invalid backup: No SQL dump file (dump.sql or *.dump) found in the backup file', 'danger')
-                        shutil.rmtree(temp_dir)
-                        os.remove(filepath)
-                        return redirect(request.url)
-                
-                # Check for filestore directory or filestore.zip (for backward compatibility)
-                filestore_dir = os.path.join(temp_dir, "filestore")
-                filestore_zip = os.path.join(temp_dir, "filestore.zip")
-                has_filestore_dir = os.path.exists(filestore_dir) and os.path.isdir(filestore_dir)
-                has_filestore_zip = os.path.exists(filestore_zip)
-                has_filestore = has_filestore_dir or has_filestore_zip
-                
-                # Connect to PostgreSQL
-                conn = get_db_connection()
-                if not conn:
-                    flash('Could not connect to PostgreSQL', 'danger')
-                    shutil.rmtree(temp_dir)
-                    os.remove(filepath)
-                    return redirect(request.url)
-                
-                cursor = conn.cursor()
-                
-                # Drop the database if it exists
-                cursor.execute(f"""
-                    SELECT pg_terminate_backend(pid) 
-                    FROM pg_stat_activity 
-                    WHERE datname = '{db_name}'
-                """)
-                cursor.execute(f"DROP DATABASE IF EXISTS \"{db_name}\"")
-                
-                # Create new database
-                cursor.execute(f"CREATE DATABASE \"{db_name}\" TEMPLATE template0 ENCODING 'UTF8'")
-                cursor.close()
-                conn.close()
-                
-                # Restore the SQL dump
-                subprocess.run(["psql", "-U", "postgres", "-d", db_name, "-f", dump_file])
-                
-                # Handle filestore if it exists
-                if has_filestore:
-                    filestore_path = os.path.join(FILESTORE_DIR, db_name)
-                    
-                    # Remove existing filestore if it exists
-                    if os.path.exists(filestore_path):
-                        shutil.rmtree(filestore_path)
-                    
-                    # Create the directory
-                    os.makedirs(filestore_path, exist_ok=True)
-                    
-                    # Copy filestore directory or extract filestore zip
-                    if has_filestore_dir:
-                        # Copy the filestore directory contents
-                        for item in os.listdir(filestore_dir):
-                            source = os.path.join(filestore_dir, item)
-                            destination = os.path.join(filestore_path, item)
-                            if os.path.isdir(source):
-                                shutil.copytree(source, destination)
-                            else:
-                                shutil.copy2(source, destination)
-                    elif has_filestore_zip:
-                        # Extract the filestore zip
-                        with zipfile.ZipFile(filestore_zip, 'r') as zip_ref:
-                            zip_ref.extractall(filestore_path)
-                
-                # Post-restore operations
-                # Connect to the restored database
-                conn = psycopg2.connect(dbname=db_name, user="postgres")
-                conn.autocommit = True
-                cursor = conn.cursor()
-                
-                if deactivate_cron:
-                    cursor.execute("UPDATE ir_cron SET active = false")
-                
-                if deactivate_mail:
-                    cursor.execute("UPDATE ir_mail_server SET active = false")
-                    cursor.execute("UPDATE fetchmail_server SET active = false")
-                
-                if reset_admin:
-                    cursor.execute("""
-                        UPDATE res_users
-                        SET password = 'admin', login = 'admin'
-                        WHERE id = 2
-                    """)
-                
-                cursor.close()
-                conn.close()
-                
-                flash(f'Database "{db_name}" has been successfully restored', 'success')
-                
-            except Exception as e:
-                flash(f'Error restoring database: {str(e)}', 'danger')
-            finally:
-                # Clean up
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-            
-            return redirect(url_for('list_databases'))
+                with zipfile.ZipFile(filepath) as backup:
+                    if not find_dump_member(backup):
+                        error = 'Invalid backup: No SQL dump file (dump.sql or *.dump) found in the backup file'
+            except zipfile.BadZipFile:
+                error = 'The uploaded file is not a valid ZIP archive. Please upload a proper ZIP file containing SQL dump, a .tar.zst backup or a direct .dump file.'
+        if error:
+            if not source_path:
+                os.remove(filepath)
+            return reject(error)
+        
+        operation = operations.start('restore-database', f'Restore {db_name}', restore_job,
+                                     db_name, filepath, backup_kind,
+                                     deactivate_cron, deactivate_mail, reset_admin,
+                                     remove_file=not source_path, use_cache=use_cache,
+                                     source_name=original_name)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Restore of "{db_name}" started; it will appear in the list when it completes', 'info')
+        return redirect(url_for('list_databases'))
     
-    return render_template('restore_database.html')
+    return render_template('restore_database.html',
+                           source_roots=source_roots(get_setting('restore_source_dirs')))
 
-@app.route('/databases/extend_enterprise', methods=['GET', 'POST'])
-@app.route('/databases/extend_enterprise/<db_name>', methods=['GET', 'POST'])
-def extend_enterprise(db_name=None):
-    """Extend Odoo Enterprise license expiration date for selected databases"""
-    # Get enterprise databases for display in the GET request
-    enterprise_dbs = []
+def clone_job(operation, source, target, conn_params):
+    """Clone ``source`` into ``target`` and add the copy to the inventory"""
+    operation.update(bytes_total=get_filestore_size(source) or 0)
+    message = run_clone(operation, source, target, conn_params, FILESTORE_DIR)
+    operation.update(phase='Finalizing')
+    snapshot_refresher.refresh([target], force=True)
+    return message
+
+@app.route('/databases/clone/<db_name>', methods=['GET', 'POST'])
+def clone_database(db_name):
+    """Clone a database and its filestore"""
+    if request.method == 'POST':
+        def reject(message):
+            if wants_json():
+                return jsonify({'success': False, 'message': message}), 400
+            flash(message, 'danger')
+            return redirect(request.url)
+        
+        new_db_name = request.form.get('new_db_name', '').strip()
+        
+        # Validate database name
+        if not re.match(r'^[a-zA-Z0-9_]+$', new_db_name):
+            return reject('Database name can only contain letters, numbers, and underscores')
+        
+        try:
+            conn_params = get_connection_params()
+            with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT datname FROM pg_database WHERE datname = ANY(%s)", ([db_name, new_db_name],))
+                existing = {row[0] for row in cursor.fetchall()}
+                cursor.close()
+        except Exception as e:
+            return reject(f'Could not connect to PostgreSQL: {str(e)}')
+        
+        if db_name not in existing:
+            return reject(f'Database "{db_name}" does not exist')
+        if new_db_name in existing:
+            return reject(f'Database "{new_db_name}" already exists')
+        if os.path.exists(filestore_path_of(new_db_name)):
+            return reject(f'A filestore directory for "{new_db_name}" already exists; remove it or choose another name')
+        
+        operation = operations.start('clone-database', f'Clone {db_name} to {new_db_name}', clone_job,
+                                     db_name, new_db_name, conn_params)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Cloning "{db_name}" to "{new_db_name}" started', 'info')
+        return redirect(url_for('list_databases'))
     
-    # Connect to PostgreSQL
-    try:
-        # Get PostgreSQL connection settings directly to show in debug log
-        postgres_user = get_setting('postgres_user', 'postgres')
-        postgres_host = get_setting('postgres_host', '127.0.0.1')
-        postgres_port = get_setting('postgres_port', '5432')
-                
-        conn = get_db_connection()
-        if not conn:
-            error_msg = 'Could not connect to PostgreSQL. Please check your database settings.'
-            flash(error_msg, 'danger')
-            logger.error(error_msg)
-            return render_template('extend_enterprise.html', enterprise_dbs=[])
-    except Exception as e:
-        error_msg = f'PostgreSQL connection error: {str(e)}'
-        flash(error_msg, 'danger')
-        logger.error(error_msg)
-        return render_template('extend_enterprise.html', enterprise_dbs=[])
+    return render_template('clone_database.html', db_name=db_name, new_db_name=f"{db_name}_copy")
+
+def check_filestore_job(operation, db_name, conn_params, verify):
+    """Check the filestore of ``db_name`` against its attachments"""
+    if verify:
+        operation.update(bytes_total=get_filestore_size(db_name) or 0)
+    counts = run_filestore_check(db_name, conn_params, filestore_path_of(db_name),
+                                 progress=operation, verify=verify)
+    problems = counts['missing'] + counts['corrupt'] + counts['unreferenced']
+    if not problems:
+        return f"All {counts['referenced']} attachment files of \"{db_name}\" are present" + \
+            (' and intact' if verify else '')
+    return (f"{counts['missing']} missing, {counts['corrupt']} corrupt and {counts['unreferenced']} "
+            f"unreferenced files in the filestore of \"{db_name}\"")
+
+@app.route('/databases/check_filestore/<db_name>', methods=['GET', 'POST'])
+def check_filestore(db_name):
+    """Check a database's filestore for missing, corrupt and unreferenced files"""
+    if not is_known_database(db_name):
+        return unknown_database(db_name)
     
-    cursor = conn.cursor()
+    if request.method == 'POST':
+        verify = 'verify' in request.form
+        operation = operations.start('check-filestore', f'Check filestore of {db_name}', check_filestore_job,
+                                     db_name, get_connection_params(), verify)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Filestore check of "{db_name}" started', 'info')
+        return redirect(url_for('list_databases'))
     
-    # Get all databases
-    cursor.execute("SELECT datname FROM pg_database WHERE datistemplate = false")
-    databases = [row[0] for row in cursor.fetchall() if row[0] not in ('postgres', 'template0', 'template1')]
+    return render_template('check_filestore.html', db_name=db_name)
+
+def gc_filestore_job(operation, db_name, conn_params, dry_run):
+    """Find, and unless ``dry_run`` trash, the unreferenced files of ``db_name``'s filestore"""
+    counts = run_filestore_gc(db_name, conn_params, filestore_path_of(db_name), filestore_trash,
+                              dry_run=dry_run, progress=operation)
+    size = format_size(counts['reclaimable_bytes'])
+    if dry_run:
+        message = f"{counts['candidates']} unreferenced files, {size} reclaimable (dry run, nothing was moved)"
+    else:
+        message = f"Moved {counts['candidates']} unreferenced files to the trash, {size} will be reclaimed"
+    if counts['recent']:
+        message += f"; {counts['recent']} recent files were kept"
+    if counts['rescued']:
+        message += f"; {counts['rescued']} files were referenced again before they could be moved"
+    if counts['errors']:
+        message += f"; {counts['errors']} files could not be moved, see the log"
+    return message
+
+@app.route('/databases/gc_filestore/<db_name>', methods=['GET', 'POST'])
+def gc_filestore(db_name):
+    """Move filestore files no attachment references to the trash"""
+    if not is_known_database(db_name):
+        return unknown_database(db_name)
     
-    # Check each database for Odoo Enterprise
-    for dbs_name in databases:
-        try:
-            # Use complete connection settings from the database
-            postgres_user = get_setting('postgres_user', 'postgres')
-            postgres_password = get_setting('postgres_password', '')
-            postgres_host = get_setting('postgres_host', '127.0.0.1')
-            postgres_port = get_setting('postgres_port', '5432')
-            
-            # Connect with appropriate parameters based on whether password is set
-            if postgres_password:
-                db_conn = psycopg2.connect(
-                    dbname=dbs_name,
-                    user=postgres_user,
-                    password=postgres_password,
-                    host=postgres_host,
-                    port=postgres_port
-                )
-            else:
-                db_conn = psycopg2.connect(
-                    dbname=dbs_name,
-                    user=postgres_user,
-                    host=postgres_host,
-                    port=postgres_port
-                )
-            db_cursor = db_conn.cursor()
-            
-            # Check if it's an Odoo database with enterprise module
-            db_cursor.execute("""
-                SELECT 1 FROM information_schema.tables
-                WHERE table_name = 'ir_module_module'
-            """)
-            
-            if db_cursor.fetchone():
-                # Check for enterprise module
-                db_cursor.execute("""
-                    SELECT 1 FROM ir_module_module
-                    WHERE name = 'web_enterprise' AND state = 'installed'
-                """)
-                
-                if db_cursor.fetchone():
-                    # Get current expiration date
-                    expiration_date = None
-                    try:
-                        db_cursor.execute("""
-                            SELECT value FROM ir_config_parameter
-                            WHERE key = 'database.expiration_date'
-                        """)
-                        row = db_cursor.fetchone()
-                        if row:
-                            expiration_date = row[0]
-                    except:
-                        pass
-                    
-                    # Add database to the list
-                    enterprise_dbs.append({
-                        'name': dbs_name,
-                        'expiration_date': expiration_date
-                    })
-            
-            db_cursor.close()
-            db_conn.close()
-        except Exception as e:
-            logger.error(f"Error checking database {dbs_name}: {str(e)}")
-            # Skip databases that can't be accessed
-            pass
+    if request.method == 'POST':
+        dry_run = 'dry_run' in request.form
+        operation = operations.start('gc-filestore', f'Collect garbage in the filestore of {db_name}',
+                                     gc_filestore_job, db_name, get_connection_params(), dry_run)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash(f'Filestore garbage collection of "{db_name}" started', 'info')
+        return redirect(url_for('list_databases'))
     
-    cursor.close()
-    conn.close()
+    return render_template('gc_filestore.html', db_name=db_name, grace_hours=GC_GRACE_SECONDS // 3600)
+
+def dedup_job(operation):
+    """Hardlink duplicate attachments across all filestores"""
+    counts = filestore_dedup.run(progress=operation)
+    logger.info(f"Filestore deduplication: {counts}")
+    message = (f"Linked {counts['linked']} duplicate files, {format_size(counts['bytes_saved'])} freed "
+               f"({counts['examined']} of {counts['files']} files examined)")
+    if counts['errors']:
+        message += f"; {counts['errors']} files could not be linked, see the log"
+    return message
+
+@app.route('/filestores/dedup', methods=['GET', 'POST'])
+def dedup_filestores():
+    """Deduplicate filestores with hardlinks"""
+    if request.method == 'POST':
+        operation = operations.start('dedup-filestores', 'Deduplicate filestores', dedup_job)
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'operation_id': operation.id,
+                'events_url': url_for('api.operation_events', operation_id=operation.id)
+            })
+        flash('Filestore deduplication started', 'info')
+        return redirect(url_for('list_databases'))
     
+    stats = filestore_dedup.stats()
+    if stats:
+        stats['logical_size'] = format_size(stats['logical_bytes'])
+        stats['disk_size'] = format_size(stats['disk_bytes'])
+        stats['saved_size'] = format_size(stats['saved_bytes'])
+        stats['last_run'] = datetime.fromtimestamp(stats['last_run_at']).strftime('%Y-%m-%d %H:%M') if stats['last_run_at'] else None
+    return render_template('dedup_filestores.html', stats=stats)
+
+def get_enterprise_databases():
+    """List Enterprise databases with their expiration dates from the metadata snapshot"""
+    snapshot_refresher.ensure_started()
+    query = filter_snapshots(DatabaseSnapshot, enterprise=True)
+    if snapshot_refresher.last_refresh is None and not DatabaseSnapshot.query.count():
+        # Nothing cached yet: build the snapshot once
+        snapshot_refresher.refresh()
+    return [
+        {'name': snapshot.name, 'expiration_date': snapshot.expiration_date}
+        for snapshot in query.order_by(DatabaseSnapshot.name).all()
+    ]
+
+def selected_databases():
+    """Databases selected in the extension form, without duplicates"""
+    return list(dict.fromkeys(request.form.getlist('databases')))
+
+def refresh_extended_snapshots(results):
+    """Re-probe extended databases so the inventory shows their new expiration dates"""
+    extended = [result['database'] for result in results if result['status'] == 'success']
+    if not extended:
+        return
+    try:
+        snapshot_refresher.refresh(extended, force=True)
+    except Exception as e:
+        logger.error(f"Error refreshing extended databases: {str(e)}")
+
+@app.route('/databases/extend_enterprise', methods=['GET', 'POST'])
+@app.route('/databases/extend_enterprise/<db_name>', methods=['GET', 'POST'])
+def extend_enterprise(db_name=None):
+    """Extend Odoo Enterprise license expiration date for selected databases"""
     # Process POST request for extending licenses
     if request.method == 'POST':
-        results = []
-        selected_dbs = request.form.getlist('databases')
+        selected_dbs = selected_databases()
         
         if not selected_dbs:
             flash('No databases selected for extension', 'warning')
-            return render_template('extend_enterprise.html', enterprise_dbs=enterprise_dbs, pre_selected_db=db_name)
+            return redirect(url_for('extend_enterprise', db_name=db_name))
         
-        # Extend the expiration for each selected database
-        for selected_db_name in selected_dbs:
-            try:
-                # Use the user settings for the database connection
-                if get_setting('postgres_password', ''):
-                    db_conn = psycopg2.connect(
-                        dbname=selected_db_name,
-                        user=get_setting('postgres_user', 'postgres'),
-                        password=get_setting('postgres_password', ''),
-                        host=get_setting('postgres_host', '127.0.0.1'),
-                        port=get_setting('postgres_port', '5432')
-                    )
-                else:
-                    db_conn = psycopg2.connect(
-                        dbname=selected_db_name,
-                        user=get_setting('postgres_user', 'postgres'),
-                        host=get_setting('postgres_host', '127.0.0.1'),
-                        port=get_setting('postgres_port', '5432')
-                    )
-                db_conn.autocommit = True
-                db_cursor = db_conn.cursor()
-                
-                # Get the current expiration date
-                db_cursor.execute("""
-                    SELECT value FROM ir_config_parameter
-                    WHERE key = 'database.expiration_date'
-                """)
-                row = db_cursor.fetchone()
-                
-                old_date = "Unknown"
-                if row:
-                    # Current expiration date exists, extend it by 20 days
-                    try:
-                        old_date = row[0]
-                        current_date = datetime.strptime(row[0], "%Y-%m-%d")
-                    except ValueError:
-                        # If date format is wrong, use today
-                        current_date = datetime.now()
-                else:
-                    # No expiration date set, use today
-                    current_date = datetime.now()
-                
-                # Add 20 days
-                new_date = current_date + timedelta(days=20)
-                new_date_str = new_date.strftime("%Y-%m-%d")
-                
-                # Update the expiration date
-                db_cursor.execute("""
-                    UPDATE ir_config_parameter
-                    SET value = %s
-                    WHERE key = 'database.expiration_date'
-                """, (new_date_str,))
-                
-                # If the parameter doesn't exist, create it
-                if db_cursor.rowcount == 0:
-                    db_cursor.execute("""
-                        INSERT INTO ir_config_parameter (key, value)
-                        VALUES ('database.expiration_date', %s)
-                    """, (new_date_str,))
-                
-                results.append({
-                    'database': selected_db_name,
-                    'old_date': old_date,
-                    'new_date': new_date_str,
-                    'status': 'success'
-                })
-                
-                db_cursor.close()
-                db_conn.close()
-            except Exception as e:
-                results.append({
-                    'database': selected_db_name,
-                    'status': 'error',
-                    'message': str(e)
-                })
-        
-        cursor.close()
-        conn.close()
-        
-        if not selected_dbs:
-            flash('No databases were selected for extension', 'warning')
-        else:
-            flash(f'Extended license for {len(selected_dbs)} database(s)', 'success')
+        # Extend the selected databases concurrently
+        results = sorted(extend_licenses(selected_dbs, get_connection_params()),
+                         key=lambda result: result['database'])
+        refresh_extended_snapshots(results)
         
+        flash(f'Extended license for {len(selected_dbs)} database(s)', 'success')
         return render_template('extend_enterprise_results.html', results=results)
     
+    # Enterprise databases come from the cached inventory instead of a scan
+    try:
+        enterprise_dbs = get_enterprise_databases()
+    except Exception as e:
+        error_msg = f'PostgreSQL connection error: {str(e)}'
+        flash(error_msg, 'danger')
+        logger.error(error_msg)
+        return render_template('extend_enterprise.html', enterprise_dbs=[])
+    
     if not enterprise_dbs:
         flash('No Odoo Enterprise databases found', 'warning')
     
@@ -1151,6 +1372,25 @@ def extend_enterprise(db_name=None):
     
     return render_template('extend_enterprise.html', enterprise_dbs=enterprise_dbs, pre_selected_db=db_name)
 
+@app.route('/databases/extend_enterprise/stream', methods=['POST'])
+def extend_enterprise_stream():
+    """Extend licenses concurrently, streaming one JSON line per database as it finishes"""
+    selected_dbs = selected_databases()
+    conn_params = get_connection_params()
+    
+    def generate():
+        results = []
+        yield json.dumps({'type': 'start', 'total': len(selected_dbs)}) + '\n'
+        for result in extend_licenses(selected_dbs, conn_params):
+            results.append(result)
+            yield json.dumps(dict(result, type='result')) + '\n'
+        refresh_extended_snapshots(results)
+        succeeded = sum(1 for result in results if result['status'] == 'success')
+        yield json.dumps({'type': 'done', 'succeeded': succeeded, 'failed': len(results) - succeeded}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # === Project Routes ===
 @app.route('/projects')
 def projects():
@@ -1219,8 +1459,7 @@ def view_project(project_id):
         else:
             database_types[db_type] = 1
     
-    # Get available servers and databases for the modals
-    available_servers = get_ssh_servers()
+    # Servers for the link modal are searched through /api/servers
     
     # Get all databases for the database modal
     conn = get_db_connection()
@@ -1243,7 +1482,6 @@ def view_project(project_id):
                           upcoming_tasks=upcoming_tasks[:5],  # Show only 5 upcoming tasks
                           server_roles=server_roles,
                           database_types=database_types,
-                          available_servers=available_servers,
                           available_databases=available_databases,
                           now=datetime.now())  # Add current datetime for comparisons
 
@@ -1587,6 +1825,25 @@ def unlink_database(project_id, database_id):
     return redirect(url_for('view_project', project_id=project_id))
 
 # === Settings Routes ===
+SETTING_DESCRIPTIONS = {
+    'postgres_user': 'Default PostgreSQL username',
+    'postgres_password': 'PostgreSQL password (empty for peer authentication)',
+    'postgres_host': 'PostgreSQL server hostname',
+    'postgres_port': 'PostgreSQL server port',
+    'filestore_dir': 'Directory where Odoo filestore folders are stored',
+    'upload_folder': 'Temporary directory for file uploads',
+    'ssh_config_dir': 'Directory for SSH configuration files',
+    'restore_source_dirs': 'Server directories backups can be restored from in place (one per line)',
+    'restore_cache_size_gb': 'Disk space for pristine copies of restored backups, in GB (0 disables)',
+    'default_odoo_version': 'Default Odoo version for new projects',
+    'auto_backup_before_drop': 'Create a backup before dropping a database',
+    'dark_mode': 'Use dark theme for the application',
+}
+
+def get_setting_description(key):
+    """Description stored with a setting when it is first saved"""
+    return SETTING_DESCRIPTIONS.get(key, '')
+
 @app.route('/settings', methods=['GET', 'POST'])
 def settings():
     """Application settings page"""
@@ -1615,6 +1872,8 @@ def settings():
             ('filestore_dir', request.form.get('filestore_dir', FILESTORE_DIR)),
             ('upload_folder', request.form.get('upload_folder', app.config['UPLOAD_FOLDER'])),
             ('ssh_config_dir', request.form.get('ssh_config_dir', SSH_CONFIG_DIR)),
+            ('restore_source_dirs', request.form.get('restore_source_dirs', '').strip()),
+            ('restore_cache_size_gb', request.form.get('restore_cache_size_gb', '20').strip() or '0'),
             
             # Application settings
             ('default_odoo_version', request.form.get('default_odoo_version', '17.0')),
@@ -1633,7 +1892,10 @@ def settings():
                 new_setting = Setting(key=key, value=value, description=description)
                 db.session.add(new_setting)
         
+        # Let every worker know its settings snapshot is stale
+        bump_settings_version()
         db.session.commit()
+        settings_cache.invalidate()
         flash('Settings saved successfully', 'success')
         return redirect(url_for('settings'))
     
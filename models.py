@@ -172,3 +172,23 @@ class OdooInstallation(db.Model):
 
     def __repr__(self):
         return f'<OdooInstallation {self.id}>'
+
+# Cached metadata for local PostgreSQL databases, refreshed in the background
+class DatabaseSnapshot(db.Model):
+    __tablename__ = 'database_snapshots'
+    
+    oid = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # pg_database.oid
+    name = db.Column(db.String(100), nullable=False, index=True)
+    owner = db.Column(db.String(100))
+    size_bytes = db.Column(db.BigInteger, default=0)
+    filestore_bytes = db.Column(db.BigInteger)  # None when the database has no filestore
+    version = db.Column(db.String(50))
+    is_enterprise = db.Column(db.Boolean, default=False)
+    expiration_date = db.Column(db.String(50))
+    probe_status = db.Column(db.String(20), default='ok')  # ok, timeout, error
+    change_marker = db.Column(db.String(100))  # activity counters at the time of the last probe
+    probed_at = db.Column(db.DateTime)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DatabaseSnapshot {self.name}>'
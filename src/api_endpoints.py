@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
 # API Endpoints for Odoo Developer Tools UI
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 import psycopg2
 import requests
 import logging
 import os
 import json
+import re
+import time
+from models import DatabaseSnapshot
+from src.db_snapshot import filter_snapshots, page_snapshots, DEFAULT_PAGE_SIZE
+from src.pg_pool import pg_manager
+from src.record_count import record_counter, MODES as RECORD_COUNT_MODES
+from src.operations import operations
+from src.uploads import UploadError
+from src.local_sources import SourceError, source_roots, list_directory
+from src.ssh_registry import DEFAULT_PAGE_SIZE as SERVERS_PAGE_SIZE
 
 # Create a blueprint for API endpoints
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -18,56 +28,356 @@ DJANGO_PORTAL_URL = os.getenv('DJANGO_PORTAL_URL', 'http://127.0.0.1:8000')
 # API endpoint to get the record count for a database
 @api_bp.route('/database/<db_name>/record_count', methods=['GET'])
 def get_database_record_count(db_name):
-    """Get the total number of records in an Odoo database"""
+    """Get the number of records in an Odoo database.
+
+    ``mode=estimate`` (default) answers from the catalog statistics in one
+    query; ``mode=exact`` counts every table in parallel. Results are cached,
+    pass ``refresh=1`` to recompute.
+    """
+    mode = request.args.get('mode', 'estimate')
+    try:
+        if mode not in RECORD_COUNT_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Use one of: {', '.join(RECORD_COUNT_MODES)}")
+        refresh = parse_bool_arg(request.args.get('refresh')) or False
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
     try:
         from app import get_connection_params
-        # Get the database connection settings
-        conn_params = get_connection_params()
-        
-        # Connect to the database
-        conn = psycopg2.connect(
-            dbname=db_name,
-            user=conn_params['user'],
-            password=conn_params['password'],
-            host=conn_params['host'],
-            port=conn_params['port']
-        )
-        cursor = conn.cursor()
+        result = record_counter.count(db_name, get_connection_params(), mode=mode, refresh=refresh)
+        return jsonify(dict(result, success=True))
         
-        # Count records in all Odoo models (tables that start with 'ir_' or 'res_')
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' AND 
-                  (table_name LIKE 'ir_%' OR 
-                   table_name LIKE 'res_%')
-        """)
+    except Exception as e:
+        logger.error(f"Error counting records in database {db_name}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"Error counting records: {str(e)}"
+        }), 500
+
+
+# API endpoint to inspect the PostgreSQL connection pools
+@api_bp.route('/postgres/pool', methods=['GET'])
+def get_postgres_pool_stats():
+    """Get connection pool statistics"""
+    return jsonify({
+        'success': True,
+        'stats': pg_manager.stats()
+    })
+
+
+# Fields the database inventory can return. Filestore columns are only
+# computed when explicitly requested.
+INVENTORY_FIELDS = (
+    'name', 'owner', 'version', 'is_enterprise', 'expiration_date', 'size_bytes', 'size',
+    'filestore_bytes', 'filestore_size', 'probe_status', 'refreshed_at'
+)
+DEFAULT_INVENTORY_FIELDS = (
+    'name', 'owner', 'version', 'is_enterprise', 'expiration_date', 'size_bytes', 'size',
+    'probe_status', 'refreshed_at'
+)
+SIZE_UNITS = {
+    '': 1, 'B': 1,
+    'K': 1024, 'KB': 1024,
+    'M': 1024 ** 2, 'MB': 1024 ** 2,
+    'G': 1024 ** 3, 'GB': 1024 ** 3,
+    'T': 1024 ** 4, 'TB': 1024 ** 4
+}
+
+def parse_bool_arg(value):
+    """Parse a true/false query argument; None when not given"""
+    if value is None or value == '':
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+def parse_size_arg(value):
+    """Parse a size such as '1048576', '500MB' or '2GB' into bytes; None when not given"""
+    if not value:
+        return None
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?B?)\s*$', value.upper())
+    if not match or match.group(2) not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+def inventory_row(snapshot, fields):
+    """Build one inventory entry with only the requested fields"""
+    from app import format_size, get_filestore_size
+    row = {}
+    filestore_bytes = None
+    if 'filestore_bytes' in fields or 'filestore_size' in fields:
+        filestore_bytes = get_filestore_size(snapshot.name)
+    for field in fields:
+        if field == 'size':
+            row[field] = format_size(snapshot.size_bytes or 0)
+        elif field == 'filestore_bytes':
+            row[field] = filestore_bytes
+        elif field == 'filestore_size':
+            row[field] = format_size(filestore_bytes) if filestore_bytes is not None else "N/A"
+        elif field == 'refreshed_at':
+            row[field] = snapshot.refreshed_at.isoformat() if snapshot.refreshed_at else None
+        else:
+            row[field] = getattr(snapshot, field)
+    return row
+
+# API endpoint for the paginated, filterable database inventory
+@api_bp.route('/databases', methods=['GET'])
+def get_database_inventory():
+    """Get one page of the database inventory.
+
+    Query arguments: name (substring or glob), version (prefix), enterprise,
+    owner, min_size/max_size (bytes or e.g. 500MB), fields (comma separated),
+    limit and cursor (from the previous page's next_cursor).
+    """
+    try:
+        from app import snapshot_refresher
+        snapshot_refresher.ensure_started()
         
-        tables = cursor.fetchall()
-        total_records = 0
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] \
+            or list(DEFAULT_INVENTORY_FIELDS)
+        unknown = [f for f in fields if f not in INVENTORY_FIELDS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'message': f"Unknown fields: {', '.join(unknown)}"
+            }), 400
+        if 'name' not in fields:
+            fields.insert(0, 'name')
         
-        # Count records in each table
-        for table in tables:
-            table_name = table[0]
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
-            total_records += count
+        try:
+            query = filter_snapshots(
+                DatabaseSnapshot,
+                name=request.args.get('name', '').strip(),
+                version=request.args.get('version', '').strip(),
+                enterprise=parse_bool_arg(request.args.get('enterprise')),
+                owner=request.args.get('owner', '').strip(),
+                min_size=parse_size_arg(request.args.get('min_size')),
+                max_size=parse_size_arg(request.args.get('max_size'))
+            )
+            total = query.count()
+            snapshots, next_cursor = page_snapshots(
+                query, DatabaseSnapshot,
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
-        conn.close()
+        return jsonify({
+            'success': True,
+            'databases': [inventory_row(snapshot, fields) for snapshot in snapshots],
+            'total': total,
+            'next_cursor': next_cursor,
+            'last_refresh': snapshot_refresher.last_refresh
+        })
+        
+    except Exception as e:
+        logger.error(f"Error listing database inventory: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"Error listing databases: {str(e)}"
+        }), 500
+
+
+# API endpoint for database growth sparklines
+@api_bp.route('/databases/size_history', methods=['GET'])
+def get_database_size_history():
+    """Get size history arrays for databases.
+
+    Query arguments: names (comma separated, default all), points (most
+    recent samples per database) and since (unix timestamp).
+    """
+    try:
+        from app import size_history
+        size_history.ensure_started()
+        
+        names = [n.strip() for n in request.args.get('names', '').split(',') if n.strip()]
+        points = request.args.get('points', type=int)
+        since = request.args.get('since', type=int)
+        
+        query = DatabaseSnapshot.query
+        if names:
+            query = query.filter(DatabaseSnapshot.name.in_(names))
         
         return jsonify({
             'success': True,
-            'record_count': total_records
+            'interval': size_history.interval,
+            'history': {
+                snapshot.name: size_history.sparkline(snapshot.oid, since=since, points=points)
+                for snapshot in query.all()
+            }
         })
         
     except Exception as e:
-        logger.error(f"Error counting records in database {db_name}: {str(e)}")
+        logger.error(f"Error reading database size history: {str(e)}")
         return jsonify({
             'success': False,
-            'message': f"Error counting records: {str(e)}"
+            'message': f"Error reading size history: {str(e)}"
         }), 500
 
 
+# Operation progress: at most this many events per second, and a keep-alive comment when idle
+OPERATION_EVENTS_PER_SECOND = 4
+OPERATION_KEEPALIVE = 15
+# Each stream holds a server thread; it is closed after this long and the browser reconnects
+OPERATION_STREAM_SECONDS = 60
+# Reconnect delay (ms) the browser is told to use
+OPERATION_STREAM_RETRY_MS = 1000
+
+# API endpoint to list background operations
+@api_bp.route('/operations', methods=['GET'])
+def list_operations():
+    """Get all running and recently finished background operations"""
+    return jsonify({
+        'success': True,
+        'operations': [operation.to_dict() for operation in operations.list()]
+    })
+
+# API endpoint to get the state of one background operation
+@api_bp.route('/operations/<operation_id>', methods=['GET'])
+def get_operation(operation_id):
+    """Get the current progress of a background operation"""
+    operation = operations.get(operation_id)
+    if not operation:
+        return jsonify({'success': False, 'message': 'Operation not found'}), 404
+    return jsonify({'success': True, 'operation': operation.to_dict()})
+
+# API endpoint streaming operation progress as server-sent events
+@api_bp.route('/operations/<operation_id>/events', methods=['GET'])
+def operation_events(operation_id):
+    """Stream progress of a background operation until it finishes"""
+    operation = operations.get(operation_id)
+    if not operation:
+        return jsonify({'success': False, 'message': 'Operation not found'}), 404
+    
+    def generate():
+        version = None
+        deadline = time.monotonic() + OPERATION_STREAM_SECONDS
+        yield f"retry: {OPERATION_STREAM_RETRY_MS}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Not finished yet; EventSource reconnects and gets the current state first
+                break
+            current = operation.wait(version, timeout=min(OPERATION_KEEPALIVE, remaining))
+            if current == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            yield f"data: {json.dumps(operation.to_dict())}\n\n"
+            if operation.finished:
+                break
+            # Coalesce bursts of counter updates
+            time.sleep(1.0 / OPERATION_EVENTS_PER_SECOND)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def upload_error_response(error):
+    data = {'success': False, 'message': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    return jsonify(data), error.status
+
+# API endpoint to start a resumable chunked upload
+@api_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a chunked upload; expects JSON {"filename": ..., "size": ...}"""
+    from app import chunked_uploads
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = chunked_uploads.create(data.get('filename'), data.get('size'))
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'success': True, **upload})
+
+# API endpoints for one chunked upload: offset to resume from, append a chunk, abort
+@api_bp.route('/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def chunked_upload(upload_id):
+    """Get the resume offset (GET), append the request body at ?offset= (PUT) or abort (DELETE).
+
+    PUT bodies are raw bytes; an X-Chunk-SHA256 header is checked against them.
+    """
+    from app import chunked_uploads
+    try:
+        if request.method == 'DELETE':
+            chunked_uploads.abort(upload_id)
+            return jsonify({'success': True})
+        if request.method == 'PUT':
+            offset = request.args.get('offset', type=int)
+            if offset is None:
+                return jsonify({'success': False, 'message': 'Missing offset'}), 400
+            upload = chunked_uploads.append(upload_id, offset, request.stream, request.content_length,
+                                            sha256=request.headers.get('X-Chunk-SHA256'))
+        else:
+            upload = chunked_uploads.status(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'success': True, **upload})
+
+# API endpoint to browse backups in the whitelisted server directories
+@api_bp.route('/restore_sources', methods=['GET'])
+def browse_restore_sources():
+    """List a whitelisted directory (?path=), or the whitelisted directories themselves"""
+    from app import get_setting
+    roots = source_roots(get_setting('restore_source_dirs'))
+    path = request.args.get('path', '').strip()
+    if not path:
+        return jsonify({
+            'success': True,
+            'path': None,
+            'parent': None,
+            'entries': [{'name': root, 'path': root, 'type': 'directory'} for root in roots]
+        })
+    try:
+        return jsonify({'success': True, **list_directory(path, roots)})
+    except (SourceError, OSError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+# API endpoint for the searchable, paginated SSH server list
+@api_bp.route('/servers', methods=['GET'])
+def get_ssh_server_list():
+    """Get one page of SSH servers.
+
+    Query arguments: q (words matched against alias, hostname, user and
+    tags), tag (exact, case-insensitive), sort (host, hostname, user or
+    port), order (asc or desc), limit and offset.
+    """
+    from app import ssh_registry
+    try:
+        offset = request.args.get('offset', 0, type=int)
+        servers, total = ssh_registry.search(
+            query=request.args.get('q', '').strip(),
+            tag=request.args.get('tag', '').strip(),
+            sort=request.args.get('sort', 'host'),
+            descending=request.args.get('order', 'asc') == 'desc',
+            offset=offset,
+            limit=request.args.get('limit', SERVERS_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    next_offset = offset + len(servers)
+    return jsonify({
+        'success': True,
+        'servers': [{**server, 'tags': list(server['tags'])} for server in servers],
+        'total': total,
+        'next_offset': next_offset if next_offset < total else None,
+        'tags': ssh_registry.tags()
+    })
+
+# API endpoint for dropped filestores still being reclaimed
+@api_bp.route('/trash', methods=['GET'])
+def get_trash_status():
+    """Get reclaimable bytes and reclaim progress of dropped filestores"""
+    from app import filestore_trash
+    filestore_trash.ensure_started()
+    return jsonify({'success': True, **filestore_trash.status()})
+
+
 # API endpoint to fetch all available Odoo versions
 @api_bp.route('/odoo/versions', methods=['GET'])
 def get_odoo_versions():
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# Odoo-compatible backups streamed straight from pg_dump and the filestore
+
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+from psycopg2 import errors
+
+from src.pg_pool import pg_manager
+from src.restore import pg_command_env, restore_jobs
+
+logger = logging.getLogger(__name__)
+
+CONTAINERS = ('zip', 'tar.zst')
+DUMP_FORMATS = ('plain', 'directory')
+
+CHUNK_SIZE = 1024 * 1024
+# Fast deflate: backups are bound by compression speed, not size
+ZIP_COMPRESS_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+class BackupError(Exception):
+    """Raised when a backup can't be produced"""
+
+
+class _CountingWriter:
+    """Forwards writes and reports the bytes written as bytes_out"""
+
+    def __init__(self, raw, progress):
+        self.raw = raw
+        self.progress = progress
+
+    def write(self, data):
+        self.raw.write(data)
+        self.progress.add(bytes_out=len(data))
+        return len(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+class _CountingReader:
+    """Reports the bytes read through it as bytes_done"""
+
+    def __init__(self, raw, progress):
+        self.raw = raw
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if data:
+            self.progress.add(bytes_done=len(data))
+        return data
+
+
+def odoo_manifest(db_name, conn_params):
+    """Build the manifest.json Odoo writes into its backups; None for non-Odoo databases"""
+    with pg_manager.connection(db_name, conn_params) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT name, latest_version FROM ir_module_module WHERE state = 'installed'")
+            modules = dict(cursor.fetchall())
+        except errors.UndefinedTable:
+            return None
+        finally:
+            cursor.close()
+        pg_version = f"{conn.server_version // 10000}.{conn.server_version % 10000}"
+
+    version = modules.get('base') or ''
+    major_version = '.'.join(version.split('.')[:2])
+    return {
+        'odoo_dump': '1',
+        'db_name': db_name,
+        'version': major_version,
+        'version_info': [int(part) if part.isdigit() else part for part in major_version.split('.')] + [0, 'final', 0, ''],
+        'major_version': major_version,
+        'pg_version': pg_version,
+        'modules': modules,
+    }
+
+
+def _filestore_files(filestore_path):
+    """Yield (path, archive name, size) for every filestore file"""
+    for dirpath, dirnames, filenames in os.walk(filestore_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(path, filestore_path).replace(os.sep, '/')
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            yield path, f"filestore/{relative}", size
+
+
+def _dump_files(dump_dir):
+    for filename in sorted(os.listdir(dump_dir)):
+        path = os.path.join(dump_dir, filename)
+        yield path, f"dump/{filename}", os.path.getsize(path)
+
+
+def _check_pg_dump(process, stderr_file):
+    returncode = process.wait()
+    if returncode != 0:
+        stderr_file.seek(0)
+        message = stderr_file.read().decode('utf-8', 'replace').strip().splitlines()
+        raise BackupError(f"pg_dump exited with status {returncode}: {message[-1] if message else 'no output'}")
+
+
+def _start_directory_dump(db_name, conn_params, dump_dir, jobs, stderr_file):
+    """Start a parallel directory-format pg_dump in the background"""
+    args, env = pg_command_env(conn_params)
+    return subprocess.Popen(
+        ['pg_dump', '--no-owner', '--format=directory', f'--jobs={jobs}', *args, '-f', dump_dir, db_name],
+        stdout=subprocess.DEVNULL, stderr=stderr_file, env=env
+    )
+
+
+def _write_zip(out, progress, db_name, conn_params, filestore_path, manifest, dump_format, jobs, work_dir):
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, allowZip64=True,
+                         compresslevel=ZIP_COMPRESS_LEVEL) as archive, \
+            tempfile.TemporaryFile() as stderr_file:
+
+        def add_file(path, name, size, compress_type=zipfile.ZIP_DEFLATED):
+            # write() keeps the file's mtime and takes the compression level; open() on a ZipInfo would not
+            archive.write(path, name, compress_type=compress_type, compresslevel=ZIP_COMPRESS_LEVEL)
+            progress.add(files_done=1, bytes_done=size)
+
+        if manifest:
+            archive.writestr('manifest.json', json.dumps(manifest, indent=4))
+
+        if dump_format == 'plain':
+            # Odoo's own layout: dump.sql streamed from pg_dump into the zip, no file on disk
+            progress.update(phase='Dumping database')
+            args, env = pg_command_env(conn_params)
+            process = subprocess.Popen(['pg_dump', '--no-owner', *args, db_name],
+                                       stdout=subprocess.PIPE, stderr=stderr_file, env=env)
+            try:
+                with archive.open('dump.sql', 'w', force_zip64=True) as member:
+                    shutil.copyfileobj(_CountingReader(process.stdout, progress), member, CHUNK_SIZE)
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                process.stdout.close()
+            _check_pg_dump(process, stderr_file)
+
+            progress.update(phase='Archiving filestore')
+            for path, name, size in _filestore_files(filestore_path):
+                add_file(path, name, size)
+            return
+
+        # Directory format: pg_dump --jobs works in the background while the filestore is archived
+        with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+            dump_dir = os.path.join(temp_dir, 'dump')
+            process = _start_directory_dump(db_name, conn_params, dump_dir, jobs, stderr_file)
+            try:
+                progress.update(phase=f'Dumping database ({jobs} jobs) and archiving filestore')
+                for path, name, size in _filestore_files(filestore_path):
+                    add_file(path, name, size)
+                progress.update(phase='Waiting for pg_dump')
+                _check_pg_dump(process, stderr_file)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+            progress.update(phase='Archiving database dump')
+            for path, name, size in _dump_files(dump_dir):
+                # pg_dump already compressed these
+                add_file(path, name, size, compress_type=zipfile.ZIP_STORED)
+                os.remove(path)
+
+
+def _write_tar_zst(out, progress, db_name, conn_params, filestore_path, manifest, jobs, work_dir):
+    if not shutil.which('zstd'):
+        raise BackupError('zstd is not installed; use the zip format instead')
+
+    zstd = subprocess.Popen(['zstd', '-q', '-T0', f'-{ZSTD_LEVEL}', '-c'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    pump_error = []
+
+    def pump():
+        try:
+            for chunk in iter(lambda: zstd.stdout.read(CHUNK_SIZE), b''):
+                out.write(chunk)
+        except Exception as e:
+            pump_error.append(e)
+            zstd.kill()
+
+    pump_thread = threading.Thread(target=pump, name='backup-zstd', daemon=True)
+    pump_thread.start()
+
+    try:
+        # tar needs every member's size up front, so the dump always uses directory format here
+        with tarfile.open(fileobj=zstd.stdin, mode='w|') as archive, \
+                tempfile.TemporaryFile() as stderr_file, \
+                tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+
+            def add_file(path, name, size):
+                info = archive.gettarinfo(path, name)
+                with open(path, 'rb') as source:
+                    archive.addfile(info, _CountingReader(source, progress))
+                progress.add(files_done=1)
+
+            if manifest:
+                data = json.dumps(manifest, indent=4).encode()
+                info = tarfile.TarInfo('manifest.json')
+                info.size = len(data)
+                info.mtime = time.time()
+                archive.addfile(info, io.BytesIO(data))
+
+            dump_dir = os.path.join(temp_dir, 'dump')
+            process = _start_directory_dump(db_name, conn_params, dump_dir, jobs, stderr_file)
+            try:
+                progress.update(phase=f'Dumping database ({jobs} jobs) and archiving filestore')
+                for path, name, size in _filestore_files(filestore_path):
+                    add_file(path, name, size)
+                progress.update(phase='Waiting for pg_dump')
+                _check_pg_dump(process, stderr_file)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+            progress.update(phase='Archiving database dump')
+            for path, name, size in _dump_files(dump_dir):
+                add_file(path, name, size)
+                os.remove(path)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            zstd.stdin.close()
+        except BrokenPipeError:
+            pass
+        zstd.wait()
+        pump_thread.join()
+
+    if pump_error:
+        raise pump_error[0]
+    if zstd.returncode != 0:
+        raise BackupError(f"zstd exited with status {zstd.returncode}")
+
+
+def backup_filename(db_name, container='zip'):
+    """File name for a backup, e.g. mydb_2024-01-31_12-00-00.zip"""
+    return f"{db_name}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.{container}"
+
+
+def backup_database(progress, db_name, conn_params, filestore_path, out, container='zip',
+                    dump_format='plain', jobs=None, work_dir=None, estimated_bytes=None):
+    """Write a backup of ``db_name`` and its filestore to the file object ``out``.
+
+    ``zip`` backups use Odoo's layout (dump.sql, filestore/, manifest.json)
+    and can be restored by Odoo itself; with ``dump_format='directory'`` the
+    dump is a parallel pg_dump folder instead. ``tar.zst`` backups always use
+    the directory format and are compressed by a multi-threaded zstd.
+    ``progress`` (an Operation) receives bytes_done (read), bytes_out
+    (written) and files_done counters.
+    """
+    jobs = jobs or restore_jobs()
+
+    counted_out = _CountingWriter(out, progress)
+    try:
+        if container not in CONTAINERS:
+            raise BackupError(f"Unknown backup format: {container}")
+        if dump_format not in DUMP_FORMATS:
+            raise BackupError(f"Unknown dump format: {dump_format}")
+        progress.update(phase='Reading database manifest', bytes_total=estimated_bytes or 0)
+        manifest = odoo_manifest(db_name, conn_params)
+        if container == 'zip':
+            _write_zip(counted_out, progress, db_name, conn_params, filestore_path, manifest,
+                       dump_format, jobs, work_dir)
+        else:
+            _write_tar_zst(counted_out, progress, db_name, conn_params, filestore_path, manifest,
+                           jobs, work_dir)
+    finally:
+        out.close()
+
+    state = progress.to_dict()
+    written = state['counters'].get('bytes_out', 0)
+    return (f'Backed up "{db_name}": {written / 1048576:.1f} MB written at '
+            f'{written / state["elapsed"] / 1048576:.1f} MB/s ({state["files_per_second"]:.0f} filestore files/s)')
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Database cloning with CREATE DATABASE ... TEMPLATE and a fast filestore copy
+
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from psycopg2 import errors
+
+from src.fastcopy import copy_tree
+from src.pg_pool import pg_manager, MAINTENANCE_DB
+
+logger = logging.getLogger(__name__)
+
+# Clients (Odoo workers, cron) may reconnect between terminate and CREATE; retry that many times
+TEMPLATE_ATTEMPTS = 5
+TEMPLATE_RETRY_DELAY = 0.5
+
+TERMINATE_QUERY = """
+    SELECT pg_terminate_backend(pid)
+    FROM pg_stat_activity
+    WHERE datname = %s AND pid <> pg_backend_pid()
+"""
+
+
+class CloneError(Exception):
+    """Raised when a database can't be cloned"""
+
+
+def create_from_template(source, target, conn_params):
+    """Create ``target`` as a copy of ``source``, kicking out sessions on the source first.
+
+    PostgreSQL 15+ defaults to WAL-logging every block of the copy; FILE_COPY
+    copies the data files directly, which is much faster for big databases.
+    """
+    pg_manager.close_pool(source)
+    with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+        cursor = conn.cursor()
+        strategy = " STRATEGY = FILE_COPY" if conn.server_version >= 150000 else ""
+        for attempt in range(1, TEMPLATE_ATTEMPTS + 1):
+            cursor.execute(TERMINATE_QUERY, (source,))
+            try:
+                cursor.execute(f'CREATE DATABASE "{target}" TEMPLATE "{source}"{strategy}')
+                break
+            except errors.ObjectInUse:
+                if attempt == TEMPLATE_ATTEMPTS:
+                    raise
+                logger.warning(f"{source} is still in use, retrying clone ({attempt}/{TEMPLATE_ATTEMPTS})")
+                time.sleep(TEMPLATE_RETRY_DELAY)
+        cursor.close()
+
+
+def reset_database_uuid(db_name, conn_params):
+    """Give a cloned Odoo database its own database.uuid, as Odoo's own duplicate does"""
+    with pg_manager.connection(db_name, conn_params) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE ir_config_parameter SET value = %s
+                WHERE key = 'database.uuid'
+            """, (str(uuid.uuid1()),))
+        except errors.UndefinedTable:
+            # Not an Odoo database
+            pass
+        finally:
+            cursor.close()
+
+
+def drop_partial_clone(target, conn_params, filestore_path):
+    """Remove what a failed clone left behind (the filestore it created included)"""
+    try:
+        pg_manager.close_pool(target)
+        with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+            cursor = conn.cursor()
+            cursor.execute(TERMINATE_QUERY, (target,))
+            cursor.execute(f'DROP DATABASE IF EXISTS "{target}"')
+            cursor.close()
+        if os.path.exists(filestore_path):
+            shutil.rmtree(filestore_path)
+    except Exception as e:
+        logger.error(f"Error cleaning up failed clone {target}: {str(e)}")
+
+
+def clone_database(operation, source, target, conn_params, filestore_dir, copy_mode='auto'):
+    """Clone database ``source`` and its filestore to ``target``, reporting on ``operation``"""
+    source_filestore = os.path.join(filestore_dir, source)
+    target_filestore = os.path.join(filestore_dir, target)
+    # Copying into a leftover directory would mix files, and a failure would then delete it
+    if os.path.exists(target_filestore):
+        raise CloneError(f'A filestore for "{target}" already exists at {target_filestore}')
+
+    operation.update(phase=f'Creating {target} from template {source}')
+    create_from_template(source, target, conn_params)
+    try:
+        reset_database_uuid(target, conn_params)
+        if not os.path.isdir(source_filestore):
+            return f'Database "{source}" has been cloned to "{target}"'
+
+        operation.update(phase='Copying filestore')
+        stats = copy_tree(source_filestore, target_filestore, mode=copy_mode, progress=operation)
+    except Exception:
+        drop_partial_clone(target, conn_params, target_filestore)
+        raise
+
+    methods = ', '.join(f"{count} by {method}" for method, count in stats.methods.items())
+    return f'Database "{source}" has been cloned to "{target}" ({stats.files} filestore files: {methods or "none"})'
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Concurrent metadata probing for Odoo databases
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from psycopg2 import errors
+
+from src.pg_pool import pg_manager
+
+logger = logging.getLogger(__name__)
+
+# Probes are network/IO bound, so the pool can be wider than the CPU count
+DEFAULT_MAX_WORKERS = 16
+# Overall budget for one probe batch (seconds); slower databases come back partial
+DEFAULT_TIMEOUT = 20
+# Per-database limit so a stuck backend can't hold a worker forever
+STATEMENT_TIMEOUT_MS = 10000
+
+# Version, enterprise flag and expiration date in a single round trip.
+# Non-Odoo databases raise UndefinedTable, which is how they are detected.
+ODOO_METADATA_QUERY = """
+    SELECT
+        (SELECT latest_version FROM ir_module_module
+         WHERE name = 'base' LIMIT 1),
+        EXISTS(SELECT 1 FROM ir_module_module
+               WHERE name = 'web_enterprise' AND state = 'installed'),
+        (SELECT value FROM ir_config_parameter
+         WHERE key = 'database.expiration_date' LIMIT 1)
+"""
+
+
+def default_probe_result(status='ok'):
+    """Return the metadata used when a database can't be (fully) probed"""
+    return {
+        'version': "Not Odoo DB",
+        'is_enterprise': False,
+        'expiration_date': None,
+        'filestore_bytes': None,
+        'probe_status': status,
+    }
+
+
+def probe_odoo_metadata(conn):
+    """Read Odoo version, enterprise flag and expiration date from an open connection"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ODOO_METADATA_QUERY)
+        version, is_enterprise, expiration_date = cursor.fetchone()
+    except errors.UndefinedTable:
+        return None
+    finally:
+        cursor.close()
+
+    return {
+        'version': version or "Not Odoo DB",
+        'is_enterprise': bool(is_enterprise),
+        'expiration_date': expiration_date if is_enterprise else None,
+    }
+
+
+def probe_database(db_name, conn_params, filestore_size=None):
+    """Probe a single database and look up its filestore size"""
+    result = default_probe_result()
+
+    try:
+        with pg_manager.connection(db_name, conn_params, statement_timeout=STATEMENT_TIMEOUT_MS) as conn:
+            metadata = probe_odoo_metadata(conn)
+        if metadata:
+            result.update(metadata)
+    except Exception as e:
+        logger.error(f"Error checking database {db_name}: {str(e)}")
+        result['probe_status'] = 'error'
+
+    if filestore_size:
+        result['filestore_bytes'] = filestore_size(db_name)
+
+    return result
+
+
+def probe_databases(db_names, conn_params, filestore_size=None,
+                    max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT):
+    """Probe many databases concurrently.
+
+    ``filestore_size`` is called with a database name and returns its
+    filestore size in bytes (or None).
+
+    Returns a dict keyed by database name. Databases that don't finish
+    within ``timeout`` seconds get default values with ``probe_status`` set
+    to 'timeout', so the caller never waits longer than the budget.
+    """
+    results = {}
+    if not db_names:
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(db_names)),
+                                  thread_name_prefix='db-probe')
+    try:
+        futures = {
+            executor.submit(probe_database, name, conn_params, filestore_size): name
+            for name in db_names
+        }
+        done, not_done = wait(futures, timeout=timeout)
+
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Error probing database {name}: {str(e)}")
+                results[name] = default_probe_result('error')
+
+        for future in not_done:
+            name = futures[future]
+            logger.warning(f"Probing database {name} timed out after {timeout}s")
+            results[name] = default_probe_result('timeout')
+    finally:
+        # Don't block the request on stragglers; they finish on their own timeouts
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# Background refresher for the persisted database metadata snapshot
+
+import base64
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from src.database import db
+from src.db_probe import probe_databases
+from src.pg_pool import pg_manager, MAINTENANCE_DB
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background refreshes
+DEFAULT_INTERVAL = 60
+
+# Inventory paging limits
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Sizes for every database, plus tuple counters that move whenever data changes.
+# Our own read-only probes don't touch these counters.
+CATALOG_QUERY = """
+    SELECT
+        d.oid,
+        d.datname,
+        r.rolname,
+        pg_database_size(d.oid),
+        COALESCE(s.tup_inserted + s.tup_updated + s.tup_deleted, 0),
+        s.stats_reset
+    FROM
+        pg_database d
+        LEFT JOIN pg_roles r ON d.datdba = r.oid
+        LEFT JOIN pg_stat_database s ON s.datid = d.oid
+    WHERE
+        d.datname NOT IN ('postgres', 'template0', 'template1')
+        -- Databases nobody can connect to (e.g. restore cache templates) can't be probed or used
+        AND d.datallowconn
+        {name_filter}
+    ORDER BY
+        d.datname
+"""
+
+
+class DatabaseSnapshotRefresher:
+    """Keeps a DatabaseSnapshot row per pg_database oid up to date.
+
+    Sizes are refreshed on every pass; the (more expensive) Odoo metadata probe
+    only runs for databases that are new, renamed, or whose activity counters
+    changed since they were last probed.
+    """
+
+    def __init__(self, app, model, get_conn_params, filestore_size, interval=DEFAULT_INTERVAL):
+        self.app = app
+        self.model = model
+        self.get_conn_params = get_conn_params
+        self.filestore_size = filestore_size
+        self.interval = interval
+        self.last_refresh = None
+        self.last_error = None
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def ensure_started(self):
+        """Start the background refresher once"""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='db-snapshot', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self, names=None, force=False):
+        """Refresh snapshots for all databases (or only ``names``).
+
+        With ``force`` every selected database is probed again, changed or not.
+        Returns the names of the databases that were probed.
+        """
+        with self._refresh_lock, self.app.app_context():
+            try:
+                probed = self._refresh(names, force)
+                self.last_error = None
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                raise
+            self.last_refresh = time.time()
+            return probed
+
+    def forget(self, db_name):
+        """Remove the snapshot of a dropped database"""
+        with self.app.app_context():
+            self.model.query.filter_by(name=db_name).delete()
+            db.session.commit()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Database snapshot refresh failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def _refresh(self, names, force):
+        conn_params = self.get_conn_params()
+        catalog = self._read_catalog(conn_params, names)
+
+        query = self.model.query
+        if names is not None:
+            oids = [row[0] for row in catalog]
+            query = query.filter(db.or_(self.model.name.in_(names), self.model.oid.in_(oids)))
+        existing = {snapshot.oid: snapshot for snapshot in query.all()}
+
+        # Only probe what actually changed
+        to_probe = []
+        for oid, name, owner, size_bytes, marker in catalog:
+            snapshot = existing.get(oid)
+            if force or snapshot is None or snapshot.name != name or \
+                    snapshot.change_marker != marker or snapshot.probe_status != 'ok':
+                to_probe.append(name)
+        probes = probe_databases(to_probe, conn_params)
+
+        now = datetime.utcnow()
+        for oid, name, owner, size_bytes, marker in catalog:
+            snapshot = existing.pop(oid, None)
+            if snapshot is None:
+                snapshot = self.model(oid=oid)
+                db.session.add(snapshot)
+            snapshot.name = name
+            snapshot.owner = owner
+            snapshot.size_bytes = size_bytes
+            snapshot.filestore_bytes = self.filestore_size(name)
+            snapshot.refreshed_at = now
+
+            probe = probes.get(name)
+            if probe is None:
+                continue
+            snapshot.probe_status = probe['probe_status']
+            if probe['probe_status'] != 'ok':
+                # Keep the last good metadata; the marker stays stale so we retry next pass
+                if snapshot.version is None:
+                    snapshot.version = probe['version']
+                continue
+            snapshot.version = probe['version']
+            snapshot.is_enterprise = probe['is_enterprise']
+            snapshot.expiration_date = probe['expiration_date']
+            snapshot.change_marker = marker
+            snapshot.probed_at = now
+
+        # Whatever is left no longer exists (dropped, or recreated under a new oid)
+        for snapshot in existing.values():
+            db.session.delete(snapshot)
+
+        db.session.commit()
+        return to_probe
+
+    def _read_catalog(self, conn_params, names):
+        name_filter = "AND d.datname = ANY(%s)" if names is not None else ""
+        with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+            cursor = conn.cursor()
+            cursor.execute(CATALOG_QUERY.format(name_filter=name_filter),
+                           (list(names),) if names is not None else None)
+            rows = cursor.fetchall()
+            cursor.close()
+
+        return [
+            (oid, name, owner, size_bytes, f"{tuples}:{stats_reset.isoformat() if stats_reset else ''}")
+            for oid, name, owner, size_bytes, tuples, stats_reset in rows
+        ]
+
+
+# === Inventory queries ===
+
+def encode_cursor(snapshot):
+    """Build an opaque pagination cursor pointing just after ``snapshot``"""
+    raw = json.dumps([snapshot.name, snapshot.oid]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(); raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, oid = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(name), int(oid)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def name_pattern(pattern):
+    """Translate a search term into a LIKE pattern.
+
+    Terms with ``*``/``?`` wildcards are matched as globs, anything else as a
+    case-insensitive substring.
+    """
+    escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    if '*' in pattern or '?' in pattern:
+        return escaped.replace('*', '%').replace('?', '_')
+    return f"%{escaped}%"
+
+
+def filter_snapshots(model, name=None, version=None, enterprise=None, owner=None,
+                     min_size=None, max_size=None):
+    """Build a DatabaseSnapshot query with the inventory filters applied"""
+    query = model.query
+    if name:
+        query = query.filter(model.name.ilike(name_pattern(name), escape='\\'))
+    if version:
+        query = query.filter(model.version.like(f"{version}%"))
+    if enterprise is not None:
+        query = query.filter(model.is_enterprise == enterprise)
+    if owner:
+        query = query.filter(model.owner == owner)
+    if min_size is not None:
+        query = query.filter(model.size_bytes >= min_size)
+    if max_size is not None:
+        query = query.filter(model.size_bytes <= max_size)
+    return query
+
+
+def page_snapshots(query, model, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Fetch one page of ``query`` in (name, oid) order.
+
+    Uses keyset pagination, so deep pages cost the same as the first one.
+    Returns (snapshots, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if cursor:
+        name, oid = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            model.name > name,
+            db.and_(model.name == name, model.oid > oid)
+        ))
+    snapshots = query.order_by(model.name, model.oid).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(snapshots) > limit:
+        snapshots = snapshots[:limit]
+        next_cursor = encode_cursor(snapshots[-1])
+    return snapshots, next_cursor
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Cross-database filestore deduplication: identical attachments become hardlinks to one inode
+
+import errno
+import filecmp
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# Odoo stores attachments as <filestore>/<db>/<sha1[:2]>/<sha1>
+ATTACHMENT_NAME = re.compile(r'^[0-9a-f]{40}$')
+# Files changed more recently than this may still be written; they are left for the next run
+SETTLE_SECONDS = 60
+COMMIT_EVERY = 2000
+PROGRESS_EVERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    run INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    checksum TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (checksum, size, dev)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class DedupError(Exception):
+    """Raised when a deduplication run can't start"""
+
+
+class FilestoreDeduplicator:
+    """Replaces identical attachments across database filestores with hardlinks.
+
+    The checksum -> inode index lives in SQLite next to the other state
+    files. A file whose path, inode, size and mtime are unchanged since the
+    last run is not looked at again, so later runs only cost a directory
+    walk plus the new files. Contents are compared byte for byte before
+    linking: the name being the SHA-1 is Odoo's convention, not a guarantee.
+    Linking is safe because Odoo never rewrites an attachment in place.
+    """
+
+    def __init__(self, root, index_path):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self._running = threading.Lock()
+
+    def stats(self):
+        """Logical and on-disk bytes of the indexed attachments, as of the last run"""
+        if not os.path.exists(self.index_path):
+            return None
+        with closing(self._connect()) as db:
+            files, logical = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+            physical = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT dev, ino, size FROM files)").fetchone()[0]
+            last_run = db.execute("SELECT value FROM meta WHERE key = 'last_run_at'").fetchone()
+        return {
+            'files': files,
+            'logical_bytes': logical,
+            'disk_bytes': physical,
+            'saved_bytes': logical - physical,
+            'last_run_at': last_run[0] if last_run else None,
+        }
+
+    def run(self, progress=None):
+        """Deduplicate all filestores; returns the counts of this run"""
+        if not self._running.acquire(blocking=False):
+            raise DedupError('Deduplication is already running')
+        try:
+            with closing(self._connect()) as db:
+                return self._run(db, progress)
+        finally:
+            self._running.release()
+
+    # === Run ===
+
+    def _run(self, db, progress):
+        run = (db.execute("SELECT value FROM meta WHERE key = 'runs'").fetchone() or (0,))[0] + 1
+        counts = {'files': 0, 'examined': 0, 'linked': 0, 'bytes_saved': 0, 'mismatched': 0, 'errors': 0}
+        settled_before = time.time() - SETTLE_SECONDS
+
+        databases = sorted(entry.name for entry in os.scandir(self.root)
+                           if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'))
+        if progress is not None:
+            progress.update(items_total=len(databases), items_done=0)
+
+        pending = 0
+        for db_name in databases:
+            if progress is not None:
+                progress.update(phase=f'Deduplicating {db_name}')
+            for path, name, st in self._attachments(os.path.join(self.root, db_name)):
+                counts['files'] += 1
+                pending += 1
+                if pending % PROGRESS_EVERY == 0 and progress is not None:
+                    progress.add(files_done=PROGRESS_EVERY)
+                if pending % COMMIT_EVERY == 0:
+                    db.commit()
+
+                row = db.execute("SELECT ino, size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+                if row == (st.st_ino, st.st_size, st.st_mtime_ns):
+                    db.execute("UPDATE files SET run = ? WHERE path = ?", (run, path))
+                    continue
+                if st.st_mtime > settled_before:
+                    continue
+
+                counts['examined'] += 1
+                try:
+                    st = self._dedup_file(db, path, name, st, counts, progress)
+                except OSError as e:
+                    counts['errors'] += 1
+                    logger.error(f"Error deduplicating {path}: {str(e)}")
+                    continue
+                db.execute("INSERT OR REPLACE INTO files (path, checksum, size, dev, ino, mtime_ns, run) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (path, name, st.st_size, st.st_dev, st.st_ino, st.st_mtime_ns, run))
+            if progress is not None:
+                progress.add(items_done=1)
+        if progress is not None:
+            progress.add(files_done=pending % PROGRESS_EVERY)
+
+        # Forget files that are gone, and canonical copies that no longer match the index
+        db.execute("DELETE FROM files WHERE run <> ?", (run,))
+        db.execute("""
+            DELETE FROM blobs WHERE NOT EXISTS (
+                SELECT 1 FROM files WHERE files.path = blobs.path AND files.ino = blobs.ino
+            )
+        """)
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('runs', ?)", (run,))
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_run_at', ?)", (int(time.time()),))
+        db.commit()
+        return counts
+
+    def _dedup_file(self, db, path, checksum, st, counts, progress):
+        """Link ``path`` to the canonical copy of its blob, or make it the canonical copy; returns its new stat"""
+        blob = db.execute("SELECT ino, path FROM blobs WHERE checksum = ? AND size = ? AND dev = ?",
+                          (checksum, st.st_size, st.st_dev)).fetchone()
+        canonical = None
+        if blob:
+            try:
+                canonical_st = os.stat(blob[1], follow_symlinks=False)
+                if (canonical_st.st_ino, canonical_st.st_size) == (blob[0], st.st_size):
+                    canonical = blob[1]
+            except FileNotFoundError:
+                pass
+
+        if canonical is None:
+            self._elect(db, path, checksum, st)
+            return st
+        if canonical_st.st_ino == st.st_ino:
+            return st
+        if not filecmp.cmp(canonical, path, shallow=False):
+            counts['mismatched'] += 1
+            logger.warning(f"Not linking {path}: contents differ from {canonical} despite the same name")
+            return st
+
+        # Link next to the target and rename over it, so the path never disappears
+        tmp_path = os.path.join(os.path.dirname(path), f".{checksum}.{uuid.uuid4().hex[:8]}.dedup")
+        try:
+            os.link(canonical, tmp_path)
+        except OSError as e:
+            if e.errno != errno.EMLINK:
+                raise
+            # The canonical inode is out of links; this copy takes over for later duplicates
+            self._elect(db, path, checksum, st)
+            return st
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+
+        counts['linked'] += 1
+        # Space is only freed when the replaced copy had no other links
+        if st.st_nlink == 1:
+            counts['bytes_saved'] += st.st_size
+            if progress is not None:
+                progress.add(bytes_saved=st.st_size)
+        return os.stat(path, follow_symlinks=False)
+
+    @staticmethod
+    def _elect(db, path, checksum, st):
+        db.execute("INSERT OR REPLACE INTO blobs (checksum, size, dev, ino, path) VALUES (?, ?, ?, ?, ?)",
+                   (checksum, st.st_size, st.st_dev, st.st_ino, path))
+
+    @staticmethod
+    def _attachments(db_dir):
+        """Yield (path, checksum, stat) for the attachment files of one database filestore"""
+        try:
+            buckets = [entry for entry in os.scandir(db_dir)
+                       if entry.is_dir(follow_symlinks=False) and len(entry.name) == 2]
+        except OSError as e:
+            logger.error(f"Error scanning {db_dir}: {str(e)}")
+            return
+        for bucket in buckets:
+            try:
+                with os.scandir(bucket.path) as entries:
+                    for entry in entries:
+                        if not ATTACHMENT_NAME.match(entry.name) or not entry.is_file(follow_symlinks=False):
+                            continue
+                        try:
+                            yield entry.path, entry.name, entry.stat(follow_symlinks=False)
+                        except FileNotFoundError:
+                            continue
+            except OSError as e:
+                logger.error(f"Error scanning {bucket.path}: {str(e)}")
+
+    def _connect(self):
+        db = sqlite3.connect(self.index_path)
+        db.executescript(SCHEMA)
+        return db
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# Dropping databases: one termination pass for any number of targets, then DROP DATABASE
+
+import logging
+import time
+
+from psycopg2 import errors
+
+from src.pg_pool import pg_manager, MAINTENANCE_DB
+
+logger = logging.getLogger(__name__)
+
+# Clients may reconnect between the termination pass and DROP; retry that many times
+DROP_ATTEMPTS = 3
+DROP_RETRY_DELAY = 0.5
+
+TERMINATE_QUERY = """
+    SELECT pg_terminate_backend(pid)
+    FROM pg_stat_activity
+    WHERE datname = ANY(%s) AND pid <> pg_backend_pid()
+"""
+
+
+def terminate_sessions(db_names, conn_params):
+    """Close our pooled connections to ``db_names`` and terminate all other sessions in one query.
+
+    Returns the number of sessions terminated.
+    """
+    db_names = list(db_names)
+    for db_name in db_names:
+        pg_manager.close_pool(db_name)
+    with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+        cursor = conn.cursor()
+        cursor.execute(TERMINATE_QUERY, (db_names,))
+        terminated = cursor.rowcount
+        cursor.close()
+    return terminated
+
+
+def drop_database(db_name, conn_params):
+    """DROP a database whose sessions were already terminated, re-terminating stragglers"""
+    with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+        cursor = conn.cursor()
+        try:
+            for attempt in range(1, DROP_ATTEMPTS + 1):
+                try:
+                    cursor.execute(f'DROP DATABASE IF EXISTS "{db_name}"')
+                    return
+                except errors.ObjectInUse:
+                    if attempt == DROP_ATTEMPTS:
+                        raise
+                    logger.warning(f"{db_name} is still in use, retrying drop ({attempt}/{DROP_ATTEMPTS})")
+                    pg_manager.close_pool(db_name)
+                    cursor.execute(TERMINATE_QUERY, ([db_name],))
+                    time.sleep(DROP_RETRY_DELAY)
+        finally:
+            cursor.close()
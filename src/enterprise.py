@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Odoo Enterprise license extension
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from src.pg_pool import pg_manager
+
+logger = logging.getLogger(__name__)
+
+# Days added to the current expiration date
+EXTENSION_DAYS = 20
+# Each extension is a couple of tiny statements, so this is mostly round-trip bound
+DEFAULT_MAX_WORKERS = 8
+# Per-database limit so a locked ir_config_parameter can't stall the batch
+STATEMENT_TIMEOUT_MS = 10000
+
+EXPIRATION_KEY = 'database.expiration_date'
+
+
+def extend_license(db_name, conn_params, days=EXTENSION_DAYS):
+    """Push the expiration date of one database ``days`` into the future.
+
+    Runs in a single transaction and returns a result dict with the old and
+    new dates; errors are reported in the result rather than raised.
+    """
+    try:
+        with pg_manager.connection(db_name, conn_params, statement_timeout=STATEMENT_TIMEOUT_MS) as conn:
+            conn.autocommit = False
+            with conn.cursor() as cursor:
+                # Lock the row so concurrent extensions of the same database don't both add 20 days to the same date
+                cursor.execute("""
+                    SELECT value FROM ir_config_parameter
+                    WHERE key = %s
+                    FOR UPDATE
+                """, (EXPIRATION_KEY,))
+                row = cursor.fetchone()
+
+                old_date = "Unknown"
+                current_date = datetime.now()
+                if row:
+                    old_date = row[0]
+                    try:
+                        current_date = datetime.strptime(row[0], "%Y-%m-%d")
+                    except (TypeError, ValueError):
+                        # If date format is wrong, use today
+                        pass
+
+                new_date_str = (current_date + timedelta(days=days)).strftime("%Y-%m-%d")
+
+                if row:
+                    cursor.execute("""
+                        UPDATE ir_config_parameter
+                        SET value = %s
+                        WHERE key = %s
+                    """, (new_date_str, EXPIRATION_KEY))
+                else:
+                    cursor.execute("""
+                        INSERT INTO ir_config_parameter (key, value)
+                        VALUES (%s, %s)
+                    """, (EXPIRATION_KEY, new_date_str))
+            conn.commit()
+
+        return {
+            'database': db_name,
+            'old_date': old_date,
+            'new_date': new_date_str,
+            'status': 'success'
+        }
+    except Exception as e:
+        logger.error(f"Error extending license for {db_name}: {str(e)}")
+        return {
+            'database': db_name,
+            'status': 'error',
+            'message': str(e)
+        }
+
+
+def extend_licenses(db_names, conn_params, days=EXTENSION_DAYS, max_workers=DEFAULT_MAX_WORKERS):
+    """Extend many databases concurrently, yielding each result as it finishes"""
+    if not db_names:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(db_names)),
+                            thread_name_prefix='license-extend') as executor:
+        futures = [executor.submit(extend_license, name, conn_params, days) for name in db_names]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# Filestore garbage collection: unreferenced attachment files, found by a sorted merge, moved to the trash
+
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import nullcontext
+
+from src.integrity import diff_filestore
+from src.pg_pool import pg_manager
+
+logger = logging.getLogger(__name__)
+
+# Only files laid out like Odoo attachments are ever collected
+ATTACHMENT_PATH = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{40}$')
+# Files younger than this may belong to a transaction that hasn't committed yet
+GRACE_SECONDS = 3600
+# Waiting for the lock gives up after this; once taken it is held only while one batch is re-checked and moved
+LOCK_TIMEOUT = '10s'
+# Candidates re-checked and moved per lock, which bounds how long attachment writes are held back
+MOVE_BATCH = 500
+# Candidates listed in the report; beyond that they are only counted
+MAX_LISTED = 200
+STAGING_PREFIX = '.gc-'
+
+
+def collect_garbage(db_name, conn_params, filestore_path, trash, dry_run=True, grace_seconds=GRACE_SECONDS,
+                    progress=None):
+    """Find (and unless ``dry_run``, trash) filestore files no attachment of ``db_name`` references.
+
+    The attachment table and the filestore are merged in one sorted pass
+    without locking, see ``diff_filestore``. For a real run, candidates are
+    then re-checked in batches of MOVE_BATCH while ``ir_attachment`` is
+    locked in SHARE mode, like Odoo's own garbage collector does, so no
+    attachment can start referencing a file while it is being moved.
+    Attachment writes are held back for one batch at a time, never for the
+    whole pass. Candidates are renamed into a hidden staging directory,
+    which is then handed to ``trash`` as a single entry. Returns the counts.
+    """
+    root = os.path.realpath(filestore_path)
+    counts = {'candidates': 0, 'reclaimable_bytes': 0, 'shared_bytes': 0, 'recent': 0, 'rescued': 0,
+              'ignored': 0, 'errors': 0}
+    staging = os.path.join(root, f"{STAGING_PREFIX}{uuid.uuid4().hex[:8]}")
+    _trash_leftovers(root, db_name, trash)
+
+    def record(store_fname, st):
+        # Hardlinked copies (see dedup) free nothing while another database still uses them
+        reclaimable = st.st_size if st.st_nlink == 1 else 0
+        counts['candidates'] += 1
+        counts['reclaimable_bytes'] += reclaimable
+        counts['shared_bytes'] += st.st_size - reclaimable
+        if progress is not None:
+            result = {'path': store_fname, 'size': st.st_size, 'shared': st.st_nlink > 1,
+                      'modified': st.st_mtime}
+            if counts['candidates'] <= MAX_LISTED:
+                progress.add_result(result, candidates=1, reclaimable_bytes=reclaimable)
+            else:
+                progress.add(candidates=1, reclaimable_bytes=reclaimable)
+
+    with pg_manager.connection(db_name, conn_params) as conn, \
+            (nullcontext() if dry_run else pg_manager.connection(db_name, conn_params)) as lock_conn:
+        # Judged against the time the attachment snapshot is taken
+        cutoff = time.time() - grace_seconds
+        pending = []
+
+        if progress is not None:
+            progress.update(phase='Looking for unreferenced files' if dry_run else 'Moving unreferenced files to the trash')
+        for status, store_fname, _checksum in diff_filestore(conn, root):
+            if status != 'unreferenced':
+                if progress is not None:
+                    progress.add(files_done=1)
+                continue
+            if not ATTACHMENT_PATH.match(store_fname):
+                counts['ignored'] += 1
+                continue
+            path = os.path.join(root, store_fname)
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError as e:
+                counts['errors'] += 1
+                logger.error(f"Error collecting {path}: {str(e)}")
+                continue
+            if st.st_mtime > cutoff:
+                counts['recent'] += 1
+                continue
+
+            if dry_run:
+                record(store_fname, st)
+                continue
+            pending.append((store_fname, st))
+            if len(pending) >= MOVE_BATCH:
+                _move_batch(lock_conn, root, staging, pending, record, counts)
+                pending = []
+        if pending:
+            _move_batch(lock_conn, root, staging, pending, record, counts)
+
+    if not dry_run and os.path.isdir(staging):
+        trash.move(staging, f"{db_name}-gc", size=counts['reclaimable_bytes'])
+    logger.info(f"Filestore garbage collection of {db_name} ({'dry run' if dry_run else 'trashed'}): {counts}")
+    return counts
+
+
+def _move_batch(conn, root, staging, batch, record, counts):
+    """Under a short SHARE lock, move the files of ``batch`` that are still unreferenced into ``staging``"""
+    conn.autocommit = False
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        cursor.execute("LOCK TABLE ir_attachment IN SHARE MODE")
+        cursor.execute("SELECT store_fname FROM ir_attachment WHERE store_fname = ANY(%s)",
+                       ([store_fname for store_fname, _st in batch],))
+        referenced = {row[0] for row in cursor.fetchall()}
+        cursor.close()
+
+        for store_fname, st in batch:
+            # Referenced by an attachment created since the unlocked pass
+            if store_fname in referenced:
+                counts['rescued'] += 1
+                continue
+            path = os.path.join(root, store_fname)
+            try:
+                os.makedirs(os.path.join(staging, os.path.dirname(store_fname)), exist_ok=True)
+                os.rename(path, os.path.join(staging, store_fname))
+            except OSError as e:
+                counts['errors'] += 1
+                logger.error(f"Error collecting {path}: {str(e)}")
+                continue
+            record(store_fname, st)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+
+def _trash_leftovers(root, db_name, trash):
+    """Hand staging directories of an interrupted run to the trash"""
+    try:
+        names = [name for name in os.listdir(root) if name.startswith(STAGING_PREFIX)]
+    except FileNotFoundError:
+        return
+    for name in names:
+        trash.move(os.path.join(root, name), f"{db_name}-gc")
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# Incremental size index for Odoo filestores
+
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# inotify constants (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+# Full scandir reconciliation interval (seconds); shorter when inotify is unavailable
+RECONCILE_INTERVAL = 900
+FALLBACK_RECONCILE_INTERVAL = 120
+# Coalesce bursts of events before rescanning the touched directories
+RESCAN_DELAY = 0.5
+PERSIST_INTERVAL = 30
+
+
+class _Inotify:
+    """Minimal ctypes binding for Linux inotify"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yield (wd, mask, name) for all queued events"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FilestoreIndex:
+    """Keeps per-directory and per-database byte/file totals for a filestore root.
+
+    Totals are updated incrementally from inotify events (only the touched
+    directories are rescanned) and fully reconciled with a scandir walk on a
+    fixed interval. Per-database totals are persisted so a restart can answer
+    immediately while the first reconciliation runs.
+    """
+
+    def __init__(self, root, state_path=None, reconcile_interval=RECONCILE_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.state_path = state_path
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._dirs = {}       # directory path -> [bytes, files] of the files directly inside it
+        self._databases = {}  # database name -> [bytes, files]
+        self._wd_paths = {}   # watch descriptor -> directory path
+        self._path_wds = {}   # directory path -> watch descriptor
+        self._dirty = set()
+        self._dirty_since = None
+        self._inotify = None
+        self._watch_limited = False
+        self._thread = None
+        self._stop = threading.Event()
+        self.ready = False
+        self.last_reconciled = None
+        self._changed = False
+        self._load_state()
+
+    # === Queries ===
+
+    def size(self, db_name):
+        """Get the filestore size of a database in bytes, or None if unknown"""
+        totals = self._databases.get(db_name)
+        return totals[0] if totals else None
+
+    def totals(self, db_name):
+        """Get (bytes, files) for a database, or None if unknown"""
+        totals = self._databases.get(db_name)
+        return tuple(totals) if totals else None
+
+    def databases(self):
+        """Get a {database: (bytes, files)} copy of all totals"""
+        with self._lock:
+            return {name: tuple(totals) for name, totals in self._databases.items()}
+
+    # === Lifecycle ===
+
+    def ensure_started(self):
+        """Start the background watcher once"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='filestore-index', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+    def reconcile(self):
+        """Rebuild all totals from a full scandir walk"""
+        dirs = {}
+        self._scan_tree(self.root, dirs)
+
+        with self._lock:
+            self._dirs = dirs
+            self._databases = self._sum_databases(dirs)
+            self._dirty.clear()
+            self._dirty_since = None
+            self.ready = True
+            self.last_reconciled = time.time()
+            self._changed = True
+
+        # Watch directories that appeared without us seeing an event
+        if self._inotify:
+            for path in dirs:
+                if path not in self._path_wds:
+                    self._watch(path)
+
+    # === Background loop ===
+
+    def _run(self):
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable, filestore index falls back to periodic scans: {str(e)}")
+
+        if self._inotify:
+            self._watch(self.root)
+        self._safe_reconcile()
+        next_reconcile = time.monotonic() + self._reconcile_interval()
+        last_persist = time.monotonic()
+
+        while not self._stop.is_set():
+            readable = []
+            if self._inotify:
+                readable, _, _ = select.select([self._inotify.fd], [], [], RESCAN_DELAY)
+                if readable:
+                    self._handle_events(self._inotify.read_events())
+            else:
+                self._stop.wait(1.0)
+
+            now = time.monotonic()
+            if self._dirty and (not readable or now - self._dirty_since > 4 * RESCAN_DELAY):
+                self._rescan_dirty()
+            if now >= next_reconcile:
+                self._safe_reconcile()
+                next_reconcile = now + self._reconcile_interval()
+            if self._changed and now - last_persist > PERSIST_INTERVAL:
+                self._save_state()
+                last_persist = now
+
+    def _reconcile_interval(self):
+        if self._inotify is None or self._watch_limited:
+            return min(self.reconcile_interval, FALLBACK_RECONCILE_INTERVAL)
+        return self.reconcile_interval
+
+    def _safe_reconcile(self):
+        try:
+            self.reconcile()
+            self._save_state()
+        except Exception as e:
+            logger.error(f"Filestore index reconciliation failed: {str(e)}")
+
+    def _handle_events(self, events):
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed, reconciling filestore index")
+                self._safe_reconcile()
+                continue
+            if mask & IN_IGNORED:
+                path = self._wd_paths.pop(wd, None)
+                if path is not None and self._path_wds.get(path) == wd:
+                    del self._path_wds[path]
+                continue
+
+            parent = self._wd_paths.get(wd)
+            if parent is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                self._forget_tree(parent)
+                continue
+
+            path = os.path.join(parent, name)
+            if self._hidden(path):
+                continue
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._forget_tree(path)
+            else:
+                if not self._dirty:
+                    self._dirty_since = time.monotonic()
+                self._dirty.add(parent)
+
+    def _rescan_dirty(self):
+        dirty, self._dirty = self._dirty, set()
+        self._dirty_since = None
+        for path in dirty:
+            totals = self._scan_dir(path)
+            if totals is not None:
+                with self._lock:
+                    self._set_dir_totals(path, totals)
+
+    # === Tree bookkeeping ===
+
+    def _add_tree(self, path):
+        dirs = {}
+        if self._inotify:
+            self._watch(path)
+        self._scan_tree(path, dirs)
+        if self._inotify:
+            for sub in dirs:
+                if sub not in self._path_wds:
+                    self._watch(sub)
+        with self._lock:
+            for sub, totals in dirs.items():
+                self._set_dir_totals(sub, totals)
+
+    def _forget_tree(self, path):
+        prefix = path + os.sep
+        with self._lock:
+            # Deepest first, so the database entry goes away with its root directory
+            subs = [p for p in self._dirs if p == path or p.startswith(prefix)]
+            for sub in sorted(subs, key=len, reverse=True):
+                self._set_dir_totals(sub, None)
+        # Watches follow moved directories, so drop them explicitly
+        for sub in [p for p in self._path_wds if p == path or p.startswith(prefix)]:
+            wd = self._path_wds.pop(sub)
+            self._wd_paths.pop(wd, None)
+            if self._inotify:
+                try:
+                    self._inotify.rm_watch(wd)
+                except OSError:
+                    pass
+
+    def _set_dir_totals(self, path, totals):
+        """Replace one directory's totals and apply the delta to its database (lock held)"""
+        old = self._dirs.pop(path, None) or [0, 0]
+        new = list(totals) if totals else [0, 0]
+        if totals:
+            self._dirs[path] = new
+        db_name = self._db_of(path)
+        if db_name is None:
+            return
+        db_totals = self._databases.setdefault(db_name, [0, 0])
+        db_totals[0] += new[0] - old[0]
+        db_totals[1] += new[1] - old[1]
+        if path == os.path.join(self.root, db_name) and not totals:
+            self._databases.pop(db_name, None)
+        self._changed = True
+
+    def _watch(self, path):
+        if self._watch_limited:
+            return
+        try:
+            wd = self._inotify.add_watch(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                self._watch_limited = True
+                logger.warning("inotify watch limit reached (fs.inotify.max_user_watches); "
+                               "filestore index falls back to periodic scans for new directories")
+            elif e.errno != errno.ENOENT:
+                logger.error(f"Could not watch {path}: {str(e)}")
+            return
+        self._wd_paths[wd] = path
+        self._path_wds[path] = wd
+
+    def _hidden(self, path):
+        """Hidden top-level directories (like the trash) are not filestores"""
+        return os.path.dirname(path) == self.root and os.path.basename(path).startswith('.')
+
+    def _db_of(self, path):
+        rel = os.path.relpath(path, self.root)
+        if rel == os.curdir or rel.startswith(os.pardir):
+            return None
+        return rel.split(os.sep, 1)[0]
+
+    def _sum_databases(self, dirs):
+        databases = {}
+        for path, (size, files) in dirs.items():
+            db_name = self._db_of(path)
+            if db_name is None:
+                continue
+            totals = databases.setdefault(db_name, [0, 0])
+            totals[0] += size
+            totals[1] += files
+        # Empty database directories still count as present
+        for path in dirs:
+            if os.path.dirname(path) == self.root:
+                databases.setdefault(os.path.basename(path), [0, 0])
+        return databases
+
+    @staticmethod
+    def _scan_dir(path):
+        """Sum the files directly inside ``path``; None if it disappeared"""
+        size = files = 0
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            size += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except FileNotFoundError:
+                        pass
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except PermissionError:
+            pass
+        return [size, files]
+
+    def _scan_tree(self, path, dirs):
+        """Recursively fill ``dirs`` with per-directory totals below ``path``"""
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            size = files = 0
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self._hidden(entry.path):
+                                    stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                size += entry.stat(follow_symlinks=False).st_size
+                                files += 1
+                        except FileNotFoundError:
+                            pass
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except PermissionError:
+                pass
+            dirs[current] = [size, files]
+
+    # === Persistence ===
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state.get('root') == self.root:
+                self._databases = {name: list(totals) for name, totals in state.get('databases', {}).items()}
+                self.last_reconciled = state.get('last_reconciled')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable filestore index state: {str(e)}")
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = {
+                'root': self.root,
+                'last_reconciled': self.last_reconciled,
+                'databases': {name: list(totals) for name, totals in self._databases.items()},
+            }
+            self._changed = False
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"Could not persist filestore index: {str(e)}")
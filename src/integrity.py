@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# Filestore integrity check: ir_attachment rows merged against the filestore, hashes verified in threads
+
+import hashlib
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import errors
+
+from src.pg_pool import pg_manager
+
+logger = logging.getLogger(__name__)
+
+# Sorted byte-wise so it merges with a sorted directory walk in one pass
+ATTACHMENT_QUERY = """
+    SELECT store_fname, checksum
+    FROM ir_attachment
+    WHERE store_fname IS NOT NULL AND store_fname <> ''
+    ORDER BY store_fname COLLATE "C"
+"""
+FETCH_SIZE = 2000
+READ_SIZE = 1024 * 1024
+# Hashing is IO bound; more threads than cores keeps the disk queue full
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+# Hashes in flight per worker; bounds memory whatever the attachment count
+QUEUE_PER_WORKER = 4
+# Problems listed per kind; beyond that they are only counted
+MAX_LISTED = 200
+# Odoo's garbage collector marker directory, not attachments
+SKIPPED_DIRS = {'checklist'}
+SHA1 = re.compile(r'^[0-9a-f]{40}$')
+
+
+class FilestoreCheckError(Exception):
+    """Raised when a database can't be checked"""
+
+
+def _sha1_file(path):
+    digest = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def walk_sorted(root, prefix=''):
+    """Yield relative file paths under ``root`` in the byte order of the full path.
+
+    Directories sort as ``name/``, which keeps the walk in the same order as
+    ``ORDER BY store_fname COLLATE "C"`` while listing one directory at a time.
+    """
+    try:
+        with os.scandir(root) as scan:
+            entries = [(entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry)
+                       for entry in scan if not entry.name.startswith('.')]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda item: item[0].encode('utf-8', 'surrogateescape'))
+    for key, entry in entries:
+        if key.endswith('/'):
+            if not prefix and entry.name in SKIPPED_DIRS:
+                continue
+            yield from walk_sorted(entry.path, prefix + key)
+        elif entry.is_file(follow_symlinks=False):
+            yield prefix + entry.name
+
+
+def stream_attachments(conn):
+    """Stream (store_fname, checksum) with a server-side cursor, one row per distinct file.
+
+    Runs in the caller's transaction, which is left open; it ends and
+    autocommit is restored when the connection is released.
+    """
+    # Named cursors need a transaction
+    conn.autocommit = False
+    cursor = conn.cursor(name='filestore_integrity')
+    cursor.itersize = FETCH_SIZE
+    try:
+        try:
+            cursor.execute(ATTACHMENT_QUERY)
+        except errors.UndefinedTable:
+            raise FilestoreCheckError('Not an Odoo database (no ir_attachment table)')
+        previous = None
+        for store_fname, checksum in cursor:
+            # Several attachments may share one file
+            if store_fname != previous:
+                yield store_fname, checksum
+                previous = store_fname
+    finally:
+        cursor.close()
+
+
+def diff_filestore(conn, root):
+    """Merge the attachments of ``conn``'s database with the files under ``root``.
+
+    Yields ``(status, store_fname, checksum)`` in store_fname order, where
+    status is 'present', 'missing' (referenced, no file) or 'unreferenced'
+    (file, no attachment; checksum is None). Both sides are streamed in the
+    same order, so memory stays flat for millions of attachments.
+    """
+    files = walk_sorted(root)
+    on_disk = next(files, None)
+    for store_fname, checksum in stream_attachments(conn):
+        key = store_fname.encode('utf-8', 'surrogateescape')
+        while on_disk is not None and on_disk.encode('utf-8', 'surrogateescape') < key:
+            yield 'unreferenced', on_disk, None
+            on_disk = next(files, None)
+        if on_disk == store_fname:
+            yield 'present', store_fname, checksum
+            on_disk = next(files, None)
+        else:
+            yield 'missing', store_fname, checksum
+    while on_disk is not None:
+        yield 'unreferenced', on_disk, None
+        on_disk = next(files, None)
+
+
+def check_filestore(db_name, conn_params, filestore_path, progress=None, verify=True, workers=DEFAULT_WORKERS):
+    """Compare the attachments of ``db_name`` with its filestore directory.
+
+    Reports missing files (referenced but absent), corrupt files (SHA-1
+    differs from the attachment checksum) and unreferenced files. Problems
+    are added to ``progress`` as results, up to MAX_LISTED per kind;
+    returns the counts.
+    """
+    counts = {'referenced': 0, 'verified': 0, 'missing': 0, 'corrupt': 0, 'unreferenced': 0}
+
+    def report(kind, path, **details):
+        counts[kind] += 1
+        if progress is None:
+            return
+        if counts[kind] <= MAX_LISTED:
+            progress.add_result({'kind': kind, 'path': path, **details}, **{kind: 1})
+        else:
+            progress.add(**{kind: 1})
+
+    def finish_hash(store_fname, expected, future):
+        try:
+            actual, size = future.result()
+        except OSError as e:
+            report('corrupt', store_fname, message=str(e))
+            return
+        counts['verified'] += 1
+        if progress is not None:
+            progress.add(files_done=1, bytes_done=size)
+        if actual != expected:
+            report('corrupt', store_fname, expected=expected, actual=actual, size=size)
+
+    root = os.path.realpath(filestore_path)
+    pending = deque()
+
+    with pg_manager.connection(db_name, conn_params) as conn, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix='integrity') as executor:
+        if progress is not None:
+            progress.update(phase='Checking attachments')
+        for status, store_fname, checksum in diff_filestore(conn, root):
+            if status == 'unreferenced':
+                report('unreferenced', store_fname)
+                continue
+            counts['referenced'] += 1
+            if status == 'missing':
+                report('missing', store_fname)
+                continue
+
+            expected = checksum or os.path.basename(store_fname)
+            if not verify or not SHA1.match(expected):
+                continue
+            path = os.path.join(root, store_fname)
+            pending.append((store_fname, expected, executor.submit(_sha1_file, path)))
+            # Results are handled in submission order; the queue never grows past a few per worker
+            while len(pending) > workers * QUEUE_PER_WORKER:
+                finish_hash(*pending.popleft())
+
+        while pending:
+            finish_hash(*pending.popleft())
+
+    logger.info(f"Filestore check of {db_name}: {counts}")
+    return counts
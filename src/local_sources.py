@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Backups that already sit on this machine: whitelisted directories, browsed and read in place
+
+import os
+
+BACKUP_EXTENSIONS = ('.zip', '.dump', '.tar.zst')
+# Used until the restore_source_dirs setting has been saved
+DEFAULT_SOURCE_DIRS = '~/Downloads'
+
+
+class SourceError(Exception):
+    """Raised for paths outside the whitelisted directories or that aren't backups"""
+
+
+def source_roots(setting_value):
+    """Whitelisted directories (one per line in the restore_source_dirs setting), resolved"""
+    if setting_value is None:
+        setting_value = DEFAULT_SOURCE_DIRS
+    roots = []
+    for line in setting_value.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        root = os.path.realpath(os.path.expanduser(line))
+        if os.path.isdir(root) and root not in roots:
+            roots.append(root)
+    return roots
+
+
+def _inside(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def resolve(path, roots, directory=False):
+    """Resolve ``path`` (symlinks included) and check it lies in one of ``roots``.
+
+    Returns the real path of a backup file, or of a directory with ``directory=True``.
+    """
+    if not path:
+        raise SourceError('No path given')
+    real = os.path.realpath(os.path.expanduser(path))
+    if not any(_inside(real, root) for root in roots):
+        raise SourceError('Path is outside the allowed restore directories')
+    if directory:
+        if not os.path.isdir(real):
+            raise SourceError('Directory not found')
+    elif not os.path.isfile(real):
+        raise SourceError('File not found')
+    elif not real.lower().endswith(BACKUP_EXTENSIONS):
+        raise SourceError('Only .zip, .tar.zst and .dump backups can be restored')
+    return real
+
+
+def list_directory(path, roots):
+    """List subdirectories and backup files of a whitelisted directory"""
+    real = resolve(path, roots, directory=True)
+    entries = []
+    with os.scandir(real) as scan:
+        for entry in scan:
+            if entry.name.startswith('.'):
+                continue
+            # Symlinks leading out of the whitelist would only fail when opened
+            if entry.is_symlink() and not any(_inside(os.path.realpath(entry.path), root) for root in roots):
+                continue
+            try:
+                if entry.is_dir():
+                    entries.append({'name': entry.name, 'path': entry.path, 'type': 'directory'})
+                elif entry.is_file() and entry.name.lower().endswith(BACKUP_EXTENSIONS):
+                    stat = entry.stat()
+                    entries.append({'name': entry.name, 'path': entry.path, 'type': 'file',
+                                    'size': stat.st_size, 'modified': stat.st_mtime})
+            except OSError:
+                continue
+    entries.sort(key=lambda entry: (entry['type'] != 'directory', entry['name'].lower()))
+    return {
+        'path': real,
+        # Never offer to go above a whitelisted root
+        'parent': None if real in roots else os.path.dirname(real),
+        'entries': entries,
+    }
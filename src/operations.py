@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# Long-running operations tracked in the background with live progress counters
+
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Finished operations are kept this long (seconds) so late subscribers still see the outcome
+RETENTION = 3600
+
+
+class Operation:
+    """A background job with progress counters that subscribers can wait on.
+
+    Counters are free-form (bytes_done, bytes_total, files_done, ...); bulk
+    jobs also record per-item results. Every change bumps ``version`` and
+    wakes waiting subscribers.
+    """
+
+    def __init__(self, kind, title):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.title = title
+        self.state = 'running'
+        self.phase = 'Starting'
+        self.message = None
+        self.counters = {}
+        self.results = []
+        self.started_at = time.time()
+        self.finished_at = None
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.state != 'running'
+
+    def add(self, **counts):
+        """Increment counters"""
+        with self._changed:
+            for key, value in counts.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self._bump()
+
+    def add_result(self, result, **counts):
+        """Record a per-item result (e.g. one database of a bulk job) and increment counters"""
+        with self._changed:
+            self.results.append(result)
+            for key, value in counts.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self._bump()
+
+    def update(self, phase=None, **counters):
+        """Set the current phase and/or counters to absolute values"""
+        with self._changed:
+            if phase is not None:
+                self.phase = phase
+            self.counters.update(counters)
+            self._bump()
+
+    def finish(self, message=None):
+        self._end('success', message)
+
+    def fail(self, message):
+        self._end('error', message)
+
+    def wait(self, version, timeout=None):
+        """Block until the operation changes past ``version``; returns the current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def join(self, timeout=None):
+        """Block until the operation has finished; returns whether it did"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+
+    def to_dict(self):
+        """Current state, with throughput and ETA derived from the counters"""
+        with self._changed:
+            counters = dict(self.counters)
+            data = {
+                'id': self.id,
+                'kind': self.kind,
+                'title': self.title,
+                'state': self.state,
+                'phase': self.phase,
+                'message': self.message,
+                'counters': counters,
+                'results': list(self.results),
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'version': self.version,
+            }
+
+        elapsed = max((self.finished_at or time.time()) - self.started_at, 0.001)
+        bytes_done = counters.get('bytes_done', 0)
+        data['elapsed'] = elapsed
+        data['bytes_per_second'] = bytes_done / elapsed
+        data['files_per_second'] = counters.get('files_done', 0) / elapsed
+
+        # Progress follows TOC entries once pg_restore runs, items for bulk jobs, bytes otherwise
+        if counters.get('toc_total'):
+            done, total = counters.get('toc_done', 0), counters['toc_total']
+        elif counters.get('items_total'):
+            done, total = counters.get('items_done', 0), counters['items_total']
+        else:
+            done, total = bytes_done, counters.get('bytes_total', 0)
+        if self.state == 'success':
+            data['percent'] = 100.0
+        elif total:
+            data['percent'] = min(100.0, done * 100.0 / total)
+        else:
+            data['percent'] = None
+        data['eta'] = (total - done) / (done / elapsed) if total and 0 < done < total and not self.finished_at else None
+        return data
+
+    def _end(self, state, message):
+        with self._changed:
+            self.state = state
+            self.message = message
+            self.finished_at = time.time()
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self._changed.notify_all()
+
+
+class OperationRegistry:
+    """Starts operations on background threads and keeps them for lookup"""
+
+    def __init__(self, retention=RETENTION):
+        self.retention = retention
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def start(self, kind, title, target, *args, **kwargs):
+        """Run ``target(operation, *args, **kwargs)`` in the background.
+
+        The return value of ``target`` becomes the success message; an
+        exception marks the operation as failed.
+        """
+        operation = Operation(kind, title)
+        with self._lock:
+            self._prune()
+            self._operations[operation.id] = operation
+
+        def run():
+            try:
+                operation.finish(target(operation, *args, **kwargs))
+            except Exception as e:
+                logger.error(f"Operation {title} failed: {str(e)}")
+                operation.fail(str(e))
+
+        threading.Thread(target=run, name=f"operation-{kind}", daemon=True).start()
+        return operation
+
+    def get(self, operation_id):
+        with self._lock:
+            return self._operations.get(operation_id)
+
+    def list(self):
+        with self._lock:
+            return sorted(self._operations.values(), key=lambda op: op.started_at, reverse=True)
+
+    def _prune(self):
+        now = time.time()
+        for operation_id, operation in list(self._operations.items()):
+            if operation.finished_at and now - operation.finished_at > self.retention:
+                del self._operations[operation_id]
+
+
+# Shared registry used by the routes and the progress API
+operations = OperationRegistry()
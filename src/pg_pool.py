@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# Pooled PostgreSQL connections, one pool per target database
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_DB = 'postgres'
+CONNECT_TIMEOUT = 5
+
+# Pool limits
+DEFAULT_MAX_CONN_PER_DB = 8        # hard cap per database; callers wait when it is reached
+DEFAULT_MAX_CONNECTIONS = 32       # soft cap across all pools; idle pools are evicted to honour it
+DEFAULT_MAX_POOLS = 64             # LRU cap on the number of per-database pools
+DEFAULT_WAIT_TIMEOUT = 30          # seconds to wait for a free connection
+IDLE_CONNECTION_TIMEOUT = 300      # idle connections older than this are closed
+HEALTH_CHECK_AFTER = 30            # idle connections older than this are pinged before reuse
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became available in time"""
+
+
+def connect_kwargs(conn_params, dbname):
+    """Build psycopg2.connect() arguments, leaving out an empty password (peer auth)"""
+    kwargs = {
+        'dbname': dbname,
+        'user': conn_params['user'],
+        'host': conn_params['host'],
+        'port': conn_params['port'],
+    }
+    if conn_params.get('password'):
+        kwargs['password'] = conn_params['password']
+    return kwargs
+
+
+class PooledConnection:
+    """Proxy around a pooled psycopg2 connection.
+
+    Behaves like the underlying connection, except that close() (or leaving a
+    ``with`` block) hands the connection back to its pool instead of closing it.
+    Like psycopg2, leaving a ``with`` block commits an open transaction, or
+    rolls it back when the block raised.
+    """
+
+    def __init__(self, manager, pool, conn):
+        object.__setattr__(self, '_manager', manager)
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_released', False)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    @property
+    def dbname(self):
+        return self._pool.dbname
+
+    def close(self):
+        """Return the connection to its pool"""
+        self._release(discard=False)
+
+    def discard(self):
+        """Close the connection for good instead of returning it to the pool"""
+        self._release(discard=True)
+
+    def _release(self, discard):
+        if self._released:
+            return
+        object.__setattr__(self, '_released', True)
+        self._manager._release(self._pool, self._conn, discard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if (exc_type is None and not self._released and not self._conn.closed
+                and self._conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE):
+            try:
+                self._conn.commit()
+            except Exception:
+                self._release(discard=True)
+                raise
+        # Releasing rolls back whatever is still open; connection-level failures leave the session in an unknown state
+        self._release(discard=isinstance(exc_value, psycopg2.OperationalError))
+        return False
+
+
+class _DatabasePool:
+    """Connections to one database; guarded by the manager lock"""
+
+    def __init__(self, dbname, maxconn, lock):
+        self.dbname = dbname
+        self.maxconn = maxconn
+        self.idle = deque()  # (connection, released_at)
+        self.in_use = 0
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.available = threading.Condition(lock)
+
+    @property
+    def size(self):
+        return len(self.idle) + self.in_use
+
+
+class PgConnectionManager:
+    """Keeps one connection pool per target database.
+
+    Pools are created lazily, kept in LRU order and evicted when idle, so the
+    maintenance database and the databases in active use stay warm while the
+    total number of backends stays bounded.
+    """
+
+    def __init__(self, maxconn_per_db=DEFAULT_MAX_CONN_PER_DB, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_pools=DEFAULT_MAX_POOLS, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        self.maxconn_per_db = maxconn_per_db
+        self.max_connections = max_connections
+        self.max_pools = max_pools
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._pools = OrderedDict()
+        self._params_key = None
+        self._counters = {
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+            'waits': 0,
+            'pools_evicted': 0,
+        }
+
+    def getconn(self, dbname, conn_params, statement_timeout=None):
+        """Check out a connection to ``dbname``; close() the result to return it"""
+        params_key = tuple(sorted(conn_params.items()))
+        now = time.monotonic()
+        conn = None
+        released_at = None
+
+        with self._lock:
+            # New credentials invalidate every pool opened with the old ones
+            if params_key != self._params_key:
+                self._close_all_locked()
+                self._params_key = params_key
+
+            pool = self._pools.get(dbname)
+            if pool is None:
+                pool = _DatabasePool(dbname, self.maxconn_per_db, self._lock)
+                self._pools[dbname] = pool
+            self._pools.move_to_end(dbname)
+            pool.last_used = now
+            self._reap_locked(now)
+
+            deadline = now + self.wait_timeout
+            while True:
+                if pool.idle:
+                    conn, released_at = pool.idle.pop()
+                    pool.in_use += 1
+                    break
+                if pool.size < pool.maxconn:
+                    # Reserve the slot now, connect outside the lock
+                    pool.in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No connection to {dbname} available after {self.wait_timeout}s")
+                self._counters['waits'] += 1
+                pool.available.wait(remaining)
+
+            self._enforce_limits_locked(keep=pool)
+
+        # Ping connections that sat idle for a while before handing them out
+        if conn is not None and (conn.closed or now - released_at > HEALTH_CHECK_AFTER):
+            if not self._is_healthy(conn):
+                with self._lock:
+                    self._counters['health_check_failures'] += 1
+                self._close_quietly(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT, **connect_kwargs(conn_params, dbname))
+                conn.autocommit = True
+            except Exception:
+                with self._lock:
+                    pool.in_use -= 1
+                    pool.available.notify()
+                raise
+            with self._lock:
+                self._counters['connections_opened'] += 1
+        else:
+            with self._lock:
+                self._counters['connections_reused'] += 1
+
+        proxy = PooledConnection(self, pool, conn)
+        if statement_timeout is not None:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = %s", (int(statement_timeout),))
+            except Exception:
+                proxy.discard()
+                raise
+        return proxy
+
+    def connection(self, dbname, conn_params, statement_timeout=None):
+        """Alias of getconn() that reads well in ``with`` statements"""
+        return self.getconn(dbname, conn_params, statement_timeout=statement_timeout)
+
+    def close_pool(self, dbname):
+        """Close all idle connections to ``dbname`` (e.g. before DROP or TEMPLATE use)"""
+        with self._lock:
+            pool = self._pools.pop(dbname, None)
+            if pool:
+                self._close_pool_locked(pool)
+
+    def close_all(self):
+        """Close every pooled connection"""
+        with self._lock:
+            self._close_all_locked()
+
+    def stats(self):
+        """Return pool statistics for monitoring"""
+        now = time.monotonic()
+        with self._lock:
+            pools = [{
+                'database': pool.dbname,
+                'idle': len(pool.idle),
+                'in_use': pool.in_use,
+                'max': pool.maxconn,
+                'idle_seconds': round(now - pool.last_used, 1),
+            } for pool in self._pools.values()]
+            return {
+                'pools': pools,
+                'total_connections': sum(p['idle'] + p['in_use'] for p in pools),
+                'max_connections': self.max_connections,
+                'max_pools': self.max_pools,
+                **self._counters,
+            }
+
+    # === Internal helpers (call with the lock held where noted) ===
+
+    def _release(self, pool, conn, discard):
+        if not discard:
+            discard = not self._reset_session(conn)
+
+        with self._lock:
+            pool.in_use -= 1
+            pool.last_used = time.monotonic()
+            if discard or pool.closed:
+                self._counters['connections_discarded'] += 1
+                self._close_quietly(conn)
+            else:
+                pool.idle.append((conn, pool.last_used))
+            pool.available.notify()
+
+    def _reset_session(self, conn):
+        """Bring a connection back to a clean autocommit state; False if it is unusable"""
+        if conn.closed:
+            return False
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if not conn.autocommit:
+                conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute("RESET statement_timeout")
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding pooled connection: {str(e)}")
+            return False
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _reap_locked(self, now):
+        """Close connections and pools that have been idle too long"""
+        for dbname, pool in list(self._pools.items()):
+            while pool.idle and now - pool.idle[0][1] > IDLE_CONNECTION_TIMEOUT:
+                conn, _ = pool.idle.popleft()
+                self._close_quietly(conn)
+            if pool.size == 0 and now - pool.last_used > IDLE_CONNECTION_TIMEOUT:
+                del self._pools[dbname]
+
+    def _enforce_limits_locked(self, keep):
+        """Evict least recently used idle pools until pool and connection limits are met"""
+        total = sum(pool.size for pool in self._pools.values())
+        for dbname, pool in list(self._pools.items()):
+            if len(self._pools) <= self.max_pools and total <= self.max_connections:
+                break
+            if pool is keep or pool.in_use:
+                continue
+            total -= len(pool.idle)
+            del self._pools[dbname]
+            self._close_pool_locked(pool)
+            self._counters['pools_evicted'] += 1
+
+    def _close_pool_locked(self, pool):
+        pool.closed = True
+        while pool.idle:
+            conn, _ = pool.idle.pop()
+            self._close_quietly(conn)
+        pool.available.notify_all()
+
+    def _close_all_locked(self):
+        for pool in self._pools.values():
+            self._close_pool_locked(pool)
+        self._pools.clear()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# Shared manager for the application
+pg_manager = PgConnectionManager()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Record counts for Odoo databases, estimated from the catalog or counted exactly
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql, errors
+
+from src.pg_pool import pg_manager
+
+logger = logging.getLogger(__name__)
+
+MODES = ('estimate', 'exact')
+
+# Seconds a computed count is served from the cache
+DEFAULT_TTL = {'estimate': 60, 'exact': 600}
+# Parallel COUNT(*) workers per database; stays below the per-database pool cap
+DEFAULT_MAX_WORKERS = 4
+# Per-table limit for exact counts; slower tables fall back to the estimate
+STATEMENT_TIMEOUT_MS = 15000
+
+# Odoo model tables (ir_* and res_*) with the planner's row estimate. reltuples
+# is -1 (or 0 on older servers) until the table has been analyzed, in which
+# case the live tuple counter from the statistics collector is used instead.
+ESTIMATE_QUERY = r"""
+    SELECT
+        c.relname,
+        CASE WHEN c.reltuples > 0 THEN c.reltuples::bigint
+             ELSE COALESCE(s.n_live_tup, 0)
+        END
+    FROM
+        pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE
+        n.nspname = 'public'
+        AND c.relkind IN ('r', 'p')
+        AND (c.relname LIKE 'ir\_%' OR c.relname LIKE 'res\_%')
+    ORDER BY
+        c.relname
+"""
+
+
+class RecordCounter:
+    """Counts records in Odoo model tables, caching results per database and mode"""
+
+    def __init__(self, ttl=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.max_workers = max_workers
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def count(self, db_name, conn_params, mode='estimate', refresh=False):
+        """Return the record count of ``db_name``.
+
+        The result is a dict with the total, a per-table breakdown (largest
+        first), the mode used and whether it came from the cache.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Invalid mode: {mode}")
+
+        key = (db_name, mode)
+        if not refresh:
+            with self._lock:
+                cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl[mode]:
+                return dict(cached[1], cached=True)
+
+        estimates = self._estimate(db_name, conn_params)
+        if mode == 'exact':
+            tables = self._count_exact(db_name, conn_params, estimates)
+        else:
+            tables = [{'table': name, 'count': count, 'exact': False} for name, count in estimates]
+
+        tables.sort(key=lambda table: table['count'], reverse=True)
+        result = {
+            'record_count': sum(table['count'] for table in tables),
+            'mode': mode,
+            'tables': tables,
+            'counted_at': time.time(),
+        }
+        with self._lock:
+            self._cache[key] = (time.monotonic(), result)
+        return dict(result, cached=False)
+
+    def invalidate(self, db_name):
+        """Forget cached counts for a database (after a drop or restore)"""
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == db_name]:
+                del self._cache[key]
+
+    def _estimate(self, db_name, conn_params):
+        with pg_manager.connection(db_name, conn_params) as conn:
+            cursor = conn.cursor()
+            cursor.execute(ESTIMATE_QUERY)
+            rows = cursor.fetchall()
+            cursor.close()
+        return [(name, int(count)) for name, count in rows]
+
+    def _count_exact(self, db_name, conn_params, estimates):
+        if not estimates:
+            return []
+
+        def count_table(table_name, estimate):
+            try:
+                with pg_manager.connection(db_name, conn_params, statement_timeout=STATEMENT_TIMEOUT_MS) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(table_name)))
+                    count = cursor.fetchone()[0]
+                    cursor.close()
+                return {'table': table_name, 'count': count, 'exact': True}
+            except errors.QueryCanceled:
+                logger.warning(f"Counting {db_name}.{table_name} timed out; using the estimate")
+            except Exception as e:
+                logger.error(f"Error counting {db_name}.{table_name}: {str(e)}")
+            return {'table': table_name, 'count': estimate, 'exact': False}
+
+        # Start with the biggest tables so they don't end up running last
+        ordered = sorted(estimates, key=lambda row: row[1], reverse=True)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ordered)),
+                                thread_name_prefix='record-count') as executor:
+            return list(executor.map(lambda row: count_table(*row), ordered))
+
+
+# Shared counter used by the API
+record_counter = RecordCounter()
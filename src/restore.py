@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+# Streaming restore of Odoo backups into PostgreSQL and the filestore
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.fastcopy import CopyStats, parallel_for_each
+
+logger = logging.getLogger(__name__)
+
+# Buffer size for copying archive members
+CHUNK_SIZE = 1024 * 1024
+# Lines of psql error output kept for logging
+STDERR_TAIL_LINES = 50
+# Statements counted between progress updates
+STATEMENT_BATCH = 200
+# Threads writing filestore files out of the archive
+EXTRACT_WORKERS = 8
+
+FILESTORE_PREFIX = 'filestore/'
+LEGACY_FILESTORE_ZIP = 'filestore.zip'
+
+# Backups written as tar.zst carry a directory-format dump under dump/, after the filestore
+TAR_ZST_SUFFIX = '.tar.zst'
+TAR_DUMP_PREFIX = 'dump/'
+
+# pg_dump custom-format archives start with this magic; directory-format
+# dumps are recognized by their table of contents file
+PGDMP_MAGIC = b'PGDMP'
+DIRECTORY_TOC = 'toc.dat'
+
+# pg_restore --verbose lines that mark progress through the table of contents
+TOC_ITEM_PATTERN = re.compile(r'^pg_restore: (?:processing|finished) item (\d+)')
+TOC_STEP_PATTERN = re.compile(r'^pg_restore: (?:creating |processing data for table)')
+
+
+class RestoreError(Exception):
+    """Raised when a backup can't be restored"""
+
+
+def find_dump_member(archive):
+    """Find the dump in an Odoo backup zip.
+
+    Returns dump.sql, else the first top-level *.dump, else the folder
+    (with trailing slash) of a directory-format dump.
+    """
+    names = archive.namelist()
+    if 'dump.sql' in names:
+        return 'dump.sql'
+    for name in names:
+        if '/' not in name and name.lower().endswith('.dump'):
+            return name
+    for name in names:
+        folder, _, base = name.rpartition('/')
+        if base == DIRECTORY_TOC and folder and '/' not in folder and f"{folder}/" != FILESTORE_PREFIX:
+            return f"{folder}/"
+    return None
+
+
+def restore_jobs():
+    """Number of parallel pg_restore jobs: the CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def dump_format(path):
+    """Detect the format of a dump on disk: 'directory', 'custom' or 'plain'"""
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, DIRECTORY_TOC)):
+            return 'directory'
+        raise RestoreError(f"{path} is not a pg_dump directory (no {DIRECTORY_TOC})")
+    with open(path, 'rb') as f:
+        return 'custom' if f.read(len(PGDMP_MAGIC)) == PGDMP_MAGIC else 'plain'
+
+
+def has_filestore(archive):
+    """Whether the backup carries a filestore (directory entries or a legacy filestore.zip)"""
+    names = archive.namelist()
+    return LEGACY_FILESTORE_ZIP in names or any(name.startswith(FILESTORE_PREFIX) for name in names)
+
+
+def pg_command_env(conn_params):
+    """Connection arguments and environment for PostgreSQL client tools"""
+    args = ['-h', str(conn_params['host']), '-p', str(conn_params['port']), '-U', conn_params['user']]
+    env = os.environ.copy()
+    if conn_params.get('password'):
+        env['PGPASSWORD'] = conn_params['password']
+    return args, env
+
+
+class _ProgressReader:
+    """File object wrapper that reports the bytes read through it"""
+
+    def __init__(self, raw, progress):
+        self.raw = raw
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if data:
+            self.progress.add(bytes_done=len(data))
+        return data
+
+
+def _copy(source, target, progress=None):
+    """copyfileobj() that reports bytes copied"""
+    if progress is not None:
+        source = _ProgressReader(source, progress)
+    shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def _drain(stream, tail):
+    """Read a pipe to the end so the child never blocks on it, keeping the last lines"""
+    for line in iter(stream.readline, b''):
+        tail.append(line.decode('utf-8', 'replace').rstrip())
+    stream.close()
+
+
+def _count_statements(stream, progress):
+    """Count the command tags psql prints, one per executed statement (COPY tags carry row counts).
+
+    Query output (e.g. SELECTs in the dump) arrives on the same stream; it is
+    counted loosely but never stops the draining, or psql would block on a full pipe.
+    """
+    statements = rows = 0
+    try:
+        for line in iter(stream.readline, b''):
+            statements += 1
+            parts = line.split()
+            if len(parts) == 2 and parts[0] == b'COPY' and parts[1].isdigit():
+                rows += int(parts[1])
+            if statements % STATEMENT_BATCH == 0:
+                progress.add(statements_done=statements, rows_done=rows)
+                statements = rows = 0
+        progress.add(statements_done=statements, rows_done=rows)
+    except Exception as e:
+        logger.warning(f"Stopped counting restore progress: {str(e)}")
+        for _ in iter(stream.readline, b''):
+            pass
+    finally:
+        stream.close()
+
+
+def stream_into_psql(source, db_name, conn_params, progress=None):
+    """Feed SQL from a file object into psql's stdin without staging it on disk"""
+    args, env = pg_command_env(conn_params)
+    # Without -q psql echoes a command tag per statement, which is what we count
+    quiet = [] if progress is not None else ['-q']
+    process = subprocess.Popen(
+        ['psql', '-X', *quiet, *args, '-d', db_name],
+        stdin=subprocess.PIPE, env=env, stderr=subprocess.PIPE,
+        stdout=subprocess.PIPE if progress is not None else subprocess.DEVNULL
+    )
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    drainers = [threading.Thread(target=_drain, args=(process.stderr, tail), daemon=True)]
+    if progress is not None:
+        drainers.append(threading.Thread(target=_count_statements, args=(process.stdout, progress), daemon=True))
+    for drainer in drainers:
+        drainer.start()
+
+    try:
+        _copy(source, process.stdin, progress)
+    except BrokenPipeError:
+        # psql died early; its exit status and stderr tell why
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+    returncode = process.wait()
+    for drainer in drainers:
+        drainer.join()
+
+    if tail:
+        logger.warning(f"psql reported errors restoring {db_name}:\n" + "\n".join(tail))
+    if returncode != 0:
+        raise RestoreError(f"psql exited with status {returncode}: {tail[-1] if tail else 'no output'}")
+
+
+def count_toc_entries(path):
+    """Number of entries in a dump's table of contents, as listed by pg_restore -l"""
+    result = subprocess.run(['pg_restore', '-l', path], capture_output=True, check=True)
+    return sum(1 for line in result.stdout.splitlines() if line.strip() and not line.startswith(b';'))
+
+
+def run_pg_restore(path, db_name, conn_params, jobs=None, progress=None):
+    """Restore a custom or directory-format dump with parallel pg_restore jobs"""
+    args, env = pg_command_env(conn_params)
+    jobs = jobs or restore_jobs()
+    verbose = []
+    if progress is not None:
+        progress.update(phase=f"Running pg_restore ({jobs} jobs)", toc_total=count_toc_entries(path), toc_done=0)
+        verbose = ['--verbose']
+
+    process = subprocess.Popen(
+        ['pg_restore', '--no-owner', f'--jobs={jobs}', *verbose, *args, '-d', db_name, path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env
+    )
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    items = set()
+    steps = 0
+    for raw_line in iter(process.stderr.readline, b''):
+        line = raw_line.decode('utf-8', 'replace').rstrip()
+        if not verbose:
+            tail.append(line)
+            continue
+        item = TOC_ITEM_PATTERN.match(line)
+        if item:
+            # Parallel mode names each TOC entry it starts and finishes
+            if item.group(1) not in items:
+                items.add(item.group(1))
+                progress.update(toc_done=len(items))
+        elif TOC_STEP_PATTERN.match(line):
+            steps += 1
+            if not items:
+                progress.update(toc_done=steps)
+        elif 'error' in line.lower() or 'warning' in line.lower():
+            tail.append(line)
+    process.stderr.close()
+    returncode = process.wait()
+
+    if tail:
+        logger.warning(f"pg_restore reported errors restoring {db_name}:\n" + "\n".join(tail))
+    # Like psql, pg_restore carries on past failing statements; it only exits
+    # with status 1 and "errors ignored on restore" in that case
+    if returncode != 0 and not any('errors ignored on restore' in line for line in tail):
+        raise RestoreError(f"pg_restore exited with status {returncode}: {tail[-1] if tail else 'no output'}")
+    logger.info(f"Restored {db_name} with pg_restore using {jobs} jobs")
+
+
+def restore_dump_file(path, db_name, conn_params, progress=None):
+    """Restore a dump on disk, routing custom/directory formats to pg_restore and plain SQL to psql"""
+    fmt = dump_format(path)
+    if fmt == 'plain':
+        if progress is not None:
+            progress.update(phase='Loading SQL dump', bytes_total=os.path.getsize(path))
+        with open(path, 'rb') as dump:
+            stream_into_psql(dump, db_name, conn_params, progress)
+    else:
+        run_pg_restore(path, db_name, conn_params, progress=progress)
+    return fmt
+
+
+def _restore_dump_member(archive, member, db_name, conn_params, work_dir, progress=None):
+    """Restore the dump member of a backup zip; returns its format"""
+    if member.endswith('/'):
+        # pg_restore reads directory-format dumps from disk
+        with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+            if progress is not None:
+                progress.update(phase='Unpacking directory dump')
+            extract_members(archive, temp_dir, member, progress, count_files=False)
+            run_pg_restore(temp_dir, db_name, conn_params, progress=progress)
+        return 'directory'
+
+    with archive.open(member) as dump:
+        if dump.peek(len(PGDMP_MAGIC)).startswith(PGDMP_MAGIC):
+            # Parallel pg_restore needs a seekable file, so custom-format dumps are copied out once
+            with tempfile.NamedTemporaryFile(dir=work_dir, suffix='.dump') as temp_file:
+                if progress is not None:
+                    progress.update(phase='Copying custom-format dump')
+                _copy(dump, temp_file, progress)
+                temp_file.flush()
+                run_pg_restore(temp_file.name, db_name, conn_params, progress=progress)
+            return 'custom'
+        if progress is not None:
+            progress.update(phase='Loading SQL dump')
+        stream_into_psql(dump, db_name, conn_params, progress)
+        return 'plain'
+
+
+def _safe_target(dest, relative):
+    """Resolve an archive path below ``dest``, refusing anything that escapes it"""
+    target = os.path.realpath(os.path.join(dest, relative))
+    if os.path.commonpath([target, dest]) != dest:
+        raise RestoreError(f"Refusing to extract {relative!r} outside {dest}")
+    return target
+
+
+def extract_members(archive, dest, prefix='', progress=None, count_files=True, workers=EXTRACT_WORKERS):
+    """Write archive entries below ``prefix`` straight into ``dest``; returns (files, bytes)"""
+    dest = os.path.realpath(dest)
+    stats = CopyStats()
+
+    def entries():
+        for info in archive.infolist():
+            if not info.filename.startswith(prefix):
+                continue
+            relative = info.filename[len(prefix):]
+            if not relative:
+                continue
+            target = _safe_target(dest, relative)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            yield info, target
+
+    def write(entry):
+        info, target = entry
+        with archive.open(info) as source, open(target, 'wb') as target_file:
+            _copy(source, target_file, progress)
+        stats.add('extract', info.file_size)
+        if progress is not None and count_files:
+            progress.add(files_done=1)
+
+    # Reads of the archive are serialized by ZipFile, but decompression and writes overlap
+    parallel_for_each(write, entries(), workers, 'restore-extract')
+    stats.finish()
+    if stats.files:
+        logger.info(f"Extracted {stats.files} files to {dest}: {stats.files_per_second:.0f} files/s, "
+                    f"{stats.bytes_per_second / 1048576:.1f} MB/s")
+    return stats.files, stats.bytes
+
+
+def extract_filestore(archive, dest, progress=None, work_dir=None):
+    """Restore the filestore of a backup into ``dest``, replacing what is there"""
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    os.makedirs(dest, exist_ok=True)
+
+    if LEGACY_FILESTORE_ZIP in archive.namelist():
+        # Older backups nest the filestore in its own zip. A zip member can't seek back without
+        # decompressing again from its start, so it is spooled to disk before the parallel extract.
+        with archive.open(LEGACY_FILESTORE_ZIP) as nested_file, \
+                tempfile.TemporaryFile(dir=work_dir) as spool:
+            shutil.copyfileobj(nested_file, spool, CHUNK_SIZE)
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as nested:
+                return extract_members(nested, dest, progress=progress)
+    return extract_members(archive, dest, FILESTORE_PREFIX, progress)
+
+
+def _archive_bytes(archive, dump_member):
+    """Uncompressed bytes a restore reads from the archive: the dump plus the filestore"""
+    return sum(
+        info.file_size for info in archive.infolist()
+        if info.filename == dump_member or info.filename == LEGACY_FILESTORE_ZIP
+        or (dump_member.endswith('/') and info.filename.startswith(dump_member))
+        or info.filename.startswith(FILESTORE_PREFIX)
+    )
+
+
+def restore_zip(archive, db_name, conn_params, filestore_path, work_dir=None, progress=None):
+    """Restore an Odoo backup zip in one pass over the archive.
+
+    A plain SQL dump is piped from its zip member into psql while the
+    filestore is written into ``filestore_path`` in parallel; nothing is
+    extracted to a temporary directory. Custom and directory-format dumps
+    go through parallel pg_restore, which needs them on disk in ``work_dir``.
+    Returns a dict with the dump format and filestore statistics.
+
+    ``progress`` (an Operation) receives bytes_done/bytes_total,
+    statements_done, toc_done/toc_total and files_done counters.
+    """
+    dump_member = find_dump_member(archive)
+    if not dump_member:
+        raise RestoreError('Invalid backup: No SQL dump file (dump.sql or *.dump) found in the backup file')
+    if progress is not None:
+        progress.update(bytes_total=_archive_bytes(archive, dump_member))
+
+    # ZipFile serializes access to the underlying file, so members can be read from two threads
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='restore-filestore') as executor:
+        filestore = executor.submit(extract_filestore, archive, filestore_path, progress, work_dir) \
+            if has_filestore(archive) else None
+        fmt = _restore_dump_member(archive, dump_member, db_name, conn_params, work_dir, progress)
+        files, total = filestore.result() if filestore else (0, 0)
+
+    return {'format': fmt, 'filestore_files': files, 'filestore_bytes': total}
+
+
+def _feed(source, sink, progress=None):
+    """Copy ``source`` into a child's stdin and close it; a child that exits early just ends the copy"""
+    try:
+        _copy(source, sink, progress)
+    except OSError:
+        pass
+    finally:
+        try:
+            sink.close()
+        except OSError:
+            pass
+
+
+def restore_tar_zst(path, db_name, conn_params, filestore_path, work_dir=None, progress=None):
+    """Restore a tar.zst backup in one pass over the archive.
+
+    zstd decompresses into a streamed tar: filestore files are written
+    straight into ``filestore_path`` and the directory-format dump that
+    follows them is unpacked into ``work_dir`` for parallel pg_restore.
+    Returns the same dict as restore_zip.
+    """
+    if not shutil.which('zstd'):
+        raise RestoreError('zstd is not installed; it is needed to restore .tar.zst backups')
+    if progress is not None:
+        # Progress follows the compressed bytes fed to zstd
+        progress.update(phase='Unpacking backup', bytes_total=os.path.getsize(path))
+
+    if os.path.exists(filestore_path):
+        shutil.rmtree(filestore_path)
+    os.makedirs(filestore_path, exist_ok=True)
+    filestore_dest = os.path.realpath(filestore_path)
+    files = total = 0
+
+    with open(path, 'rb') as source, tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        dump_dir = os.path.realpath(os.path.join(temp_dir, 'dump'))
+        os.makedirs(dump_dir)
+        zstd = subprocess.Popen(['zstd', '-d', '-q', '-c'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        feeder = threading.Thread(target=_feed, args=(source, zstd.stdin, progress), name='restore-zstd',
+                                  daemon=True)
+        feeder.start()
+        try:
+            with tarfile.open(fileobj=zstd.stdout, mode='r|') as archive:
+                for member in archive:
+                    if not member.isfile():
+                        continue
+                    if member.name.startswith(FILESTORE_PREFIX):
+                        target = _safe_target(filestore_dest, member.name[len(FILESTORE_PREFIX):])
+                    elif member.name.startswith(TAR_DUMP_PREFIX):
+                        target = _safe_target(dump_dir, member.name[len(TAR_DUMP_PREFIX):])
+                    else:
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with archive.extractfile(member) as data, open(target, 'wb') as target_file:
+                        shutil.copyfileobj(data, target_file, CHUNK_SIZE)
+                    if target.startswith(filestore_dest + os.sep):
+                        files += 1
+                        total += member.size
+                        if progress is not None:
+                            progress.add(files_done=1)
+            # Read past the tar padding so zstd can finish writing
+            for _ in iter(lambda: zstd.stdout.read(CHUNK_SIZE), b''):
+                pass
+        except tarfile.TarError as e:
+            zstd.kill()
+            raise RestoreError(f"The backup is not a valid tar.zst archive: {str(e)}")
+        except BaseException:
+            zstd.kill()
+            raise
+        finally:
+            zstd.stdout.close()
+            feeder.join()
+            zstd.wait()
+        if zstd.returncode != 0:
+            raise RestoreError(f"zstd exited with status {zstd.returncode}")
+
+        if not os.path.exists(os.path.join(dump_dir, DIRECTORY_TOC)):
+            raise RestoreError('Invalid backup: No database dump found in the tar.zst backup')
+        run_pg_restore(dump_dir, db_name, conn_params, progress=progress)
+
+    return {'format': 'directory', 'filestore_files': files, 'filestore_bytes': total}
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# Content-addressed restore cache: pristine template databases and filestores keyed by backup hash
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from psycopg2 import errors
+
+from src.clone import create_from_template
+from src.fastcopy import copy_tree
+from src.pg_pool import pg_manager, MAINTENANCE_DB
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PREFIX = 'restore_cache_'
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+# Remembered file hashes, so re-selecting an unchanged server-side backup skips hashing
+MAX_REMEMBERED_HASHES = 256
+
+
+def file_sha256(path, progress=None):
+    """SHA-256 of a file, reporting the hashed percentage as the operation phase"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256()
+    done = 0
+    reported_at = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+            done += len(block)
+            if progress is not None and time.monotonic() - reported_at > 0.5:
+                reported_at = time.monotonic()
+                progress.update(phase=f'Hashing backup ({done * 100 // max(size, 1)}%)')
+    return digest.hexdigest()
+
+
+def _tree_bytes(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class RestoreCache:
+    """LRU cache of pristine restores keyed by the SHA-256 of the backup.
+
+    After a backup is restored for the first time (before cron/mail/admin
+    changes are applied) a copy of the database is kept as a template
+    database that doesn't accept connections, and the filestore is copied
+    next to the cache index (hardlinks when possible, so it costs almost no
+    space). Restoring the same backup again clones the template and the
+    filestore instead of extracting and loading the archive. Entries are
+    evicted least recently used first once the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._index = self._load_index()
+
+    # === Keys ===
+
+    def key_for(self, path, progress=None):
+        """Cache key of a backup file; unchanged files are only hashed once"""
+        fingerprint = self._fingerprint(path)
+        with self._lock:
+            key = self._index['hashes'].get(fingerprint)
+        if key:
+            return key
+
+        key = file_sha256(path, progress)
+        self._remember(fingerprint, key)
+        return key
+
+    def remember(self, path, sha256):
+        """Record the SHA-256 of a backup hashed elsewhere (e.g. while it was uploaded)"""
+        self._remember(self._fingerprint(path), sha256)
+
+    @staticmethod
+    def _fingerprint(path):
+        stat = os.stat(path)
+        return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{stat.st_ino}"
+
+    def _remember(self, fingerprint, key):
+        with self._lock:
+            hashes = self._index['hashes']
+            hashes[fingerprint] = key
+            while len(hashes) > MAX_REMEMBERED_HASHES:
+                hashes.pop(next(iter(hashes)))
+            self._save_index()
+
+    @staticmethod
+    def template_name(key):
+        return f"{TEMPLATE_PREFIX}{key[:16]}"
+
+    def _filestore_path(self, key):
+        return os.path.join(self.root, key, 'filestore')
+
+    # === Lookup and store ===
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._index['entries'].values())
+        return {
+            'entries': len(entries),
+            'bytes': sum(entry['db_bytes'] + entry['filestore_bytes'] for entry in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def restore_from(self, key, target, conn_params, filestore_path, progress=None):
+        """Create ``target`` from the cached copy of ``key``; returns False on a cache miss"""
+        with self._lock:
+            entry = self._index['entries'].get(key)
+        if not entry:
+            return False
+
+        if progress is not None:
+            progress.update(phase='Creating database from the restore cache')
+        try:
+            create_from_template(entry['template'], target, conn_params)
+        except errors.InvalidCatalogName:
+            # Template dropped behind our back
+            logger.warning(f"Restore cache template {entry['template']} is gone, forgetting it")
+            self._forget(key)
+            return False
+
+        if entry['filestore_bytes'] or os.path.isdir(self._filestore_path(key)):
+            if progress is not None:
+                progress.update(phase='Copying cached filestore', bytes_total=entry['filestore_bytes'])
+            copy_tree(self._filestore_path(key), filestore_path, progress=progress)
+
+        with self._lock:
+            entry['last_used'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._save_index()
+        return True
+
+    def store(self, key, db_name, conn_params, filestore_path, source_name=None, progress=None):
+        """Keep a pristine copy of the freshly restored ``db_name``; errors are logged, not raised"""
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            if key in self._index['entries']:
+                return
+        template = self.template_name(key)
+
+        # A restore bigger than the whole cache would only push the cache past its limit
+        try:
+            with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT pg_database_size(%s)", (db_name,))
+                needed = cursor.fetchone()[0]
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error caching restore of {db_name}: {str(e)}")
+            return
+        if os.path.isdir(filestore_path):
+            needed += _tree_bytes(filestore_path)
+        if needed > self.max_bytes:
+            logger.info(f"Not caching restore of {db_name}: {needed} bytes exceed the cache limit of {self.max_bytes}")
+            return
+
+        if progress is not None:
+            progress.update(phase='Keeping a pristine copy for repeat restores')
+        try:
+            create_from_template(db_name, template, conn_params)
+            with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+                cursor = conn.cursor()
+                # A template nobody can connect to stays pristine and out of the database list
+                cursor.execute(f'ALTER DATABASE "{template}" WITH IS_TEMPLATE true ALLOW_CONNECTIONS false')
+                cursor.execute("SELECT pg_database_size(%s)", (template,))
+                db_bytes = cursor.fetchone()[0]
+                cursor.close()
+
+            filestore_bytes = 0
+            if os.path.isdir(filestore_path):
+                filestore_bytes = copy_tree(filestore_path, self._filestore_path(key)).bytes
+        except Exception as e:
+            logger.error(f"Error caching restore of {db_name}: {str(e)}")
+            self._drop_entry(key, template, conn_params)
+            return
+
+        with self._lock:
+            self._index['entries'][key] = {
+                'template': template,
+                'source_name': source_name,
+                'db_bytes': db_bytes,
+                'filestore_bytes': filestore_bytes,
+                'created_at': time.time(),
+                'last_used': time.time(),
+                'hits': 0,
+            }
+            self._save_index()
+        self._enforce_limit(conn_params, keep=key)
+
+    def evict(self, key, conn_params):
+        with self._lock:
+            entry = self._index['entries'].get(key)
+        if entry:
+            self._drop_entry(key, entry['template'], conn_params)
+            self._forget(key)
+
+    # === Housekeeping ===
+
+    def _enforce_limit(self, conn_params, keep=None):
+        with self._lock:
+            entries = sorted(self._index['entries'].items(), key=lambda item: item[1]['last_used'])
+        total = sum(entry['db_bytes'] + entry['filestore_bytes'] for _, entry in entries)
+        for key, entry in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            logger.info(f"Evicting restore cache entry {entry['template']} ({entry.get('source_name')})")
+            self.evict(key, conn_params)
+            total -= entry['db_bytes'] + entry['filestore_bytes']
+
+    def _drop_entry(self, key, template, conn_params):
+        try:
+            with pg_manager.connection(MAINTENANCE_DB, conn_params) as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f'ALTER DATABASE "{template}" WITH IS_TEMPLATE false')
+                except errors.InvalidCatalogName:
+                    pass
+                cursor.execute(f'DROP DATABASE IF EXISTS "{template}"')
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error dropping restore cache template {template}: {str(e)}")
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def _forget(self, key):
+        with self._lock:
+            self._index['entries'].pop(key, None)
+            self._save_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading restore cache index: {str(e)}")
+            index = {}
+        index.setdefault('entries', {})
+        index.setdefault('hashes', {})
+        return index
+
+    def _save_index(self):
+        """Write the index atomically (lock held)"""
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
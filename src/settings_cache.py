@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# In-process cache of application settings
+
+import logging
+import threading
+import time
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Setting row holding the version counter shared by all worker processes
+SETTINGS_VERSION_KEY = '_settings_version'
+# How often (seconds) a worker checks whether another worker changed the settings
+DEFAULT_REVALIDATE_INTERVAL = 2.0
+
+
+class _Snapshot:
+    """Immutable view of all settings at one version"""
+
+    __slots__ = ('version', 'values', 'checked_at')
+
+    def __init__(self, version, values, checked_at):
+        self.version = version
+        self.values = MappingProxyType(dict(values))
+        self.checked_at = checked_at
+
+
+class SettingsCache:
+    """Serves settings from an immutable in-memory snapshot.
+
+    The snapshot is replaced as a whole (a single attribute swap), so readers
+    never see a half-updated set of values. Writers call invalidate() after
+    committing; other worker processes notice the bumped version counter on
+    their next revalidation.
+    """
+
+    def __init__(self, load_settings, load_version, revalidate_interval=DEFAULT_REVALIDATE_INTERVAL):
+        self._load_settings = load_settings
+        self._load_version = load_version
+        self.revalidate_interval = revalidate_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get a setting value, falling back to ``default`` when it is not set"""
+        return self.snapshot().get(key, default)
+
+    def snapshot(self):
+        """Return the current read-only mapping of all settings"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is None or now - snapshot.checked_at > self.revalidate_interval:
+            snapshot = self._revalidate(snapshot, now)
+        return snapshot.values
+
+    def invalidate(self):
+        """Drop the snapshot so the next read reloads it"""
+        self._snapshot = None
+
+    def _revalidate(self, snapshot, now):
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            current = self._snapshot
+            if current is not None and current is not snapshot and now - current.checked_at <= self.revalidate_interval:
+                return current
+
+            version = self._load_version()
+            if current is not None and current.version == version:
+                current.checked_at = now
+                return current
+
+            values = self._load_settings()
+            fresh = _Snapshot(version, values, now)
+            self._snapshot = fresh
+            logger.debug(f"Loaded settings snapshot version {version}")
+            return fresh
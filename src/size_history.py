@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# On-disk time series of database and filestore sizes
+
+import logging
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.pg_pool import pg_manager
+
+logger = logging.getLogger(__name__)
+
+# Seconds between samples
+DEFAULT_INTERVAL = 900
+# Samples kept per database. When a file grows past this, its older half is
+# thinned out by pairs, so resolution decays with age and files stay bounded.
+MAX_POINTS = 384
+# Largest tables recorded with each sample
+TOP_TABLES = 5
+TABLE_NAME_BYTES = 32
+# Parallel top-table queries per pass
+DEFAULT_MAX_WORKERS = 8
+STATEMENT_TIMEOUT_MS = 10000
+
+# One fixed-width row per sample: timestamp, database bytes, filestore bytes
+# (-1 when unknown), then TOP_TABLES (name, total bytes) pairs
+ROW_FORMAT = '<Iqq' + f'{TABLE_NAME_BYTES}sq' * TOP_TABLES
+ROW = struct.Struct(ROW_FORMAT)
+FILE_SUFFIX = '.sizes'
+
+TOP_TABLES_QUERY = """
+    SELECT c.relname, pg_total_relation_size(c.oid) AS total
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'm')
+    ORDER BY total DESC
+    LIMIT %s
+"""
+
+
+def pack_sample(timestamp, db_bytes, filestore_bytes, top_tables):
+    """Encode one sample as a fixed-width row"""
+    fields = [int(timestamp), int(db_bytes or 0), -1 if filestore_bytes is None else int(filestore_bytes)]
+    top_tables = list(top_tables)[:TOP_TABLES]
+    top_tables += [('', 0)] * (TOP_TABLES - len(top_tables))
+    for name, size in top_tables:
+        fields += [name.encode()[:TABLE_NAME_BYTES], int(size)]
+    return ROW.pack(*fields)
+
+
+def unpack_sample(row):
+    """Decode a row from pack_sample() into a dict"""
+    values = ROW.unpack(row)
+    top_tables = []
+    for i in range(3, len(values), 2):
+        name = values[i].rstrip(b'\0').decode('utf-8', 'ignore')
+        if name:
+            top_tables.append((name, values[i + 1]))
+    return {
+        'timestamp': values[0],
+        'size_bytes': values[1],
+        'filestore_bytes': None if values[2] < 0 else values[2],
+        'top_tables': top_tables,
+    }
+
+
+def downsample(rows, max_points=MAX_POINTS):
+    """Thin out the older half of ``rows`` by keeping every second sample"""
+    if len(rows) <= max_points:
+        return rows
+    split = len(rows) - max_points // 2
+    # Keep the later sample of each older pair; the newest samples stay at full resolution
+    return rows[1:split:2] + rows[split:]
+
+
+class SizeHistory:
+    """Append-only size samples per database, one file per pg_database oid.
+
+    Samples are taken from the DatabaseSnapshot table (sizes) plus one catalog
+    query per database for its largest tables.
+    """
+
+    def __init__(self, root, app, model, get_conn_params, interval=DEFAULT_INTERVAL,
+                 max_points=MAX_POINTS, max_workers=DEFAULT_MAX_WORKERS):
+        self.root = root
+        self.app = app
+        self.model = model
+        self.get_conn_params = get_conn_params
+        self.interval = interval
+        self.max_points = max_points
+        self.max_workers = max_workers
+        self.last_sample = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        os.makedirs(root, exist_ok=True)
+
+    def ensure_started(self):
+        """Start the background sampler once"""
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='size-history', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def history(self, oid, since=None, points=None):
+        """Return the samples of one database, oldest first.
+
+        ``since`` drops samples before a unix timestamp and ``points`` keeps
+        only the most recent ones.
+        """
+        samples = [unpack_sample(row) for row in self._read_rows(oid)]
+        if since is not None:
+            samples = [sample for sample in samples if sample['timestamp'] >= since]
+        if points:
+            samples = samples[-points:]
+        return samples
+
+    def sparkline(self, oid, since=None, points=None):
+        """Return the history of one database as parallel arrays for charting"""
+        samples = self.history(oid, since, points)
+        return {
+            'timestamps': [sample['timestamp'] for sample in samples],
+            'size_bytes': [sample['size_bytes'] for sample in samples],
+            'filestore_bytes': [sample['filestore_bytes'] for sample in samples],
+            'top_tables': dict(samples[-1]['top_tables']) if samples else {},
+        }
+
+    def record(self, oid, db_bytes, filestore_bytes, top_tables, timestamp=None):
+        """Append one sample for a database, downsampling its file when it is full"""
+        row = pack_sample(timestamp or time.time(), db_bytes, filestore_bytes, top_tables)
+        path = self._path(oid)
+        with self._lock:
+            with open(path, 'ab') as f:
+                end = f.tell()
+                if end % ROW.size:
+                    # Drop a torn row left by an interrupted write
+                    f.truncate(end - end % ROW.size)
+                f.write(row)
+            if os.path.getsize(path) // ROW.size > self.max_points:
+                self._write_rows(path, downsample(self._read_rows(oid), self.max_points))
+
+    def sample(self):
+        """Record one sample for every database in the snapshot"""
+        with self.app.app_context():
+            snapshots = [(s.oid, s.name, s.size_bytes, s.filestore_bytes)
+                         for s in self.model.query.all()]
+            conn_params = self.get_conn_params()
+        if not snapshots:
+            return 0
+
+        now = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(snapshots)),
+                                thread_name_prefix='size-history') as executor:
+            top_tables = executor.map(lambda s: self._top_tables(s[1], conn_params), snapshots)
+            for (oid, name, size_bytes, filestore_bytes), tables in zip(snapshots, top_tables):
+                self.record(oid, size_bytes, filestore_bytes, tables, timestamp=now)
+
+        self._prune({snapshot[0] for snapshot in snapshots})
+        self.last_sample = now
+        return len(snapshots)
+
+    def _run(self):
+        while not self._stop.is_set():
+            interval = self.interval
+            try:
+                if not self.sample():
+                    # The snapshot isn't built yet; try again soon
+                    interval = min(interval, 60)
+            except Exception as e:
+                logger.error(f"Size history sampling failed: {str(e)}")
+            self._stop.wait(interval)
+
+    def _top_tables(self, db_name, conn_params):
+        try:
+            with pg_manager.connection(db_name, conn_params, statement_timeout=STATEMENT_TIMEOUT_MS) as conn:
+                cursor = conn.cursor()
+                cursor.execute(TOP_TABLES_QUERY, (TOP_TABLES,))
+                rows = cursor.fetchall()
+                cursor.close()
+            return rows
+        except Exception as e:
+            logger.error(f"Error reading table sizes of {db_name}: {str(e)}")
+            return []
+
+    def _prune(self, live_oids):
+        """Delete the history of databases that no longer exist"""
+        with self._lock:
+            for entry in os.scandir(self.root):
+                if not entry.name.endswith(FILE_SUFFIX):
+                    continue
+                try:
+                    oid = int(entry.name[:-len(FILE_SUFFIX)])
+                except ValueError:
+                    continue
+                if oid not in live_oids:
+                    os.remove(entry.path)
+
+    def _path(self, oid):
+        return os.path.join(self.root, f"{int(oid)}{FILE_SUFFIX}")
+
+    def _read_rows(self, oid):
+        try:
+            with open(self._path(oid), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        # Ignore a torn trailing row; the next record() truncates it
+        usable = len(data) - len(data) % ROW.size
+        return [data[i:i + ROW.size] for i in range(0, usable, ROW.size)]
+
+    def _write_rows(self, path, rows):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(rows))
+        os.replace(tmp_path, path)
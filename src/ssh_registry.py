@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# In-process registry of the SSH servers configured in config.d
+
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) every .conf file is stat'ed for in-place edits; the directory itself is checked on each read
+DEFAULT_REVALIDATE_INTERVAL = 2.0
+
+# Server list paging and ordering
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+SORT_KEYS = ('host', 'hostname', 'user', 'port')
+
+# Tags are kept in a comment ssh ignores: "# Tags: production, customer-x"
+TAGS_PREFIX = '# Tags:'
+
+
+def parse_tags(value):
+    """Split a comma separated tag list, dropping blanks and duplicates"""
+    tags = []
+    for tag in (value or '').split(','):
+        tag = tag.strip()
+        if tag and tag.lower() not in (t.lower() for t in tags):
+            tags.append(tag)
+    return tags
+
+
+def parse_ssh_config(content):
+    """Parse one config.d file; returns the server dict, or None without Host and HostName"""
+    host = None
+    hostname = None
+    user = None
+    port = "22"  # Default
+    key_file = None
+    tags = []
+
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith(TAGS_PREFIX):
+            tags = parse_tags(line[len(TAGS_PREFIX):])
+        elif line.startswith('Host '):
+            host = line.split(' ', 1)[1].strip()
+        elif line.startswith('HostName '):
+            hostname = line.split(' ', 1)[1].strip()
+        elif line.startswith('User '):
+            user = line.split(' ', 1)[1].strip()
+        elif line.startswith('Port '):
+            port = line.split(' ', 1)[1].strip()
+        elif line.startswith('IdentityFile '):
+            key_file = line.split(' ', 1)[1].strip()
+
+    if not (host and hostname):
+        return None
+    return {
+        'host': host,
+        'hostname': hostname,
+        'user': user or "",
+        'port': port,
+        'key_file': key_file or "",
+        'tags': tuple(tags)
+    }
+
+
+def _sort_key(field):
+    if field == 'port':
+        # Numeric ports first, in numeric order
+        return lambda server: (not server['port'].isdigit(), int(server['port']) if server['port'].isdigit() else 0,
+                               server['host'].lower())
+    return lambda server: (server[field].lower(), server['host'].lower())
+
+
+class _Snapshot:
+    """Immutable view of all servers with their lookup indexes"""
+
+    __slots__ = ('dir_mtime', 'files', 'servers', 'by_host', 'by_hostname', 'by_user', 'by_tag', 'search_text',
+                 'sorted_by', 'checked_at', 'swept_at')
+
+    def __init__(self, dir_mtime, files, now):
+        self.dir_mtime = dir_mtime
+        # file name -> ((mtime_ns, size), server or None)
+        self.files = files
+        servers = [server for _, server in (files[name] for name in sorted(files)) if server]
+        self.servers = tuple(MappingProxyType(server) for server in servers)
+
+        by_host, by_hostname, by_user, by_tag = {}, {}, {}, {}
+        # Lowercased alias, hostname, user and tags, matched by search()
+        self.search_text = {}
+        for server in self.servers:
+            # The first file (by name) defining an alias wins, like a linear scan did
+            by_host.setdefault(server['host'], server)
+            by_hostname.setdefault(server['hostname'], []).append(server)
+            by_user.setdefault(server['user'], []).append(server)
+            for tag in server['tags']:
+                by_tag.setdefault(tag.lower(), []).append(server)
+            self.search_text[id(server)] = '\n'.join(
+                (server['host'], server['hostname'], server['user']) + server['tags']).lower()
+        self.by_host = by_host
+        self.by_hostname = {key: tuple(value) for key, value in by_hostname.items()}
+        self.by_user = {key: tuple(value) for key, value in by_user.items()}
+        self.by_tag = {key: tuple(value) for key, value in by_tag.items()}
+        # (sort field, descending) -> servers in that order, built on first use
+        self.sorted_by = {}
+        self.checked_at = now
+        self.swept_at = now
+
+
+class SSHRegistry:
+    """Serves the servers of an SSH config.d directory from memory.
+
+    Each ``.conf`` file is parsed once and only re-parsed when its mtime or
+    size changes. The directory mtime (files added, removed or renamed) is
+    checked on every read; in-place edits are picked up by a stat sweep
+    every ``revalidate_interval`` seconds, or right away after invalidate().
+    Lookups by host alias, hostname, user and tag are dictionary lookups on
+    an immutable snapshot swapped in as a whole.
+    """
+
+    def __init__(self, config_dir, revalidate_interval=DEFAULT_REVALIDATE_INTERVAL):
+        self.config_dir = config_dir
+        self.revalidate_interval = revalidate_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    # === Queries ===
+
+    def servers(self):
+        """All servers (read-only dicts), ordered by config file name"""
+        return list(self._current().servers)
+
+    def get(self, host):
+        """The server with Host alias ``host``, or None"""
+        return self._current().by_host.get(host)
+
+    def by_hostname(self, hostname):
+        return list(self._current().by_hostname.get(hostname, ()))
+
+    def by_user(self, user):
+        return list(self._current().by_user.get(user, ()))
+
+    def tags(self):
+        """All tags in use, sorted case-insensitively"""
+        snapshot = self._current()
+        return sorted({tag for server in snapshot.servers for tag in server['tags']}, key=str.lower)
+
+    def search(self, query=None, tag=None, sort='host', descending=False, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """One page of servers matching ``query`` (substring of alias, hostname, user or a tag) and ``tag``.
+
+        Returns (servers, total). Orderings are computed once per snapshot, so
+        an unfiltered page is a slice whatever the number of servers.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Invalid sort field: {sort}")
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        snapshot = self._current()
+
+        ordered = snapshot.sorted_by.get((sort, descending))
+        if ordered is None:
+            ordered = tuple(sorted(snapshot.servers, key=_sort_key(sort), reverse=descending))
+            snapshot.sorted_by[(sort, descending)] = ordered
+
+        if tag:
+            members = {id(server) for server in snapshot.by_tag.get(tag.lower(), ())}
+            ordered = [server for server in ordered if id(server) in members]
+        if query:
+            terms = query.lower().split()
+            ordered = [server for server in ordered
+                       if all(term in snapshot.search_text[id(server)] for term in terms)]
+        return list(ordered[offset:offset + limit]), len(ordered)
+
+    def invalidate(self):
+        """Force a stat sweep on the next read; call after writing a config file"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            snapshot.swept_at = float('-inf')
+
+    # === Revalidation ===
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.config_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _current(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if (snapshot is None or snapshot.dir_mtime != self._dir_mtime()
+                or now - snapshot.swept_at > self.revalidate_interval):
+            snapshot = self._revalidate(snapshot, now)
+        return snapshot
+
+    def _revalidate(self, snapshot, now):
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            current = self._snapshot
+            if current is not None and current is not snapshot and now - current.swept_at <= self.revalidate_interval:
+                return current
+
+            dir_mtime = self._dir_mtime()
+            old_files = current.files if current is not None else {}
+            files = {}
+            changed = dir_mtime is None and bool(old_files)
+            if dir_mtime is not None:
+                with os.scandir(self.config_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith('.conf'):
+                            continue
+                        try:
+                            st = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        signature = (st.st_mtime_ns, st.st_size)
+                        previous = old_files.get(entry.name)
+                        if previous is not None and previous[0] == signature:
+                            files[entry.name] = previous
+                            continue
+                        files[entry.name] = (signature, self._parse(entry.path))
+                        changed = True
+                changed = changed or len(files) != len(old_files)
+
+            if current is not None and not changed:
+                current.dir_mtime = dir_mtime
+                current.checked_at = current.swept_at = now
+                return current
+
+            fresh = _Snapshot(dir_mtime, files, now)
+            self._snapshot = fresh
+            logger.debug(f"Loaded {len(fresh.servers)} SSH servers from {self.config_dir}")
+            return fresh
+
+    @staticmethod
+    def _parse(path):
+        try:
+            with open(path, 'r') as f:
+                return parse_ssh_config(f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            logger.error(f"Error reading SSH config {path}: {str(e)}")
+            return None
@@ -82,115 +82,112 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
-    // Copy SSH command to clipboard
-    const sshCommandButtons = document.querySelectorAll('.copy-ssh-command');
-    sshCommandButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const host = this.getAttribute('data-host');
-            
-            fetch(`/servers/generate_command/${host}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.command) {
-                        navigator.clipboard.writeText(data.command)
-                            .then(() => {
-                                // Change button text briefly
-                                const originalText = this.innerHTML;
-                                this.innerHTML = '<i class="fas fa-check"></i> Copied!';
-                                setTimeout(() => {
-                                    this.innerHTML = originalText;
-                                }, 2000);
-                            })
-                            .catch(err => {
-                                console.error('Could not copy text: ', err);
-                                alert('Failed to copy to clipboard. Try again or copy manually.');
-                            });
-                    } else {
-                        alert('Could not generate SSH command');
-                    }
-                })
-                .catch(error => {
-                    console.error('Error:', error);
-                    alert('An error occurred while generating the SSH command');
-                });
-        });
+    // Copy SSH command to clipboard (delegated, so rows loaded later are covered too)
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.copy-ssh-command');
+        if (!button) return;
+        const host = button.getAttribute('data-host');
+        
+        fetch(`/servers/generate_command/${host}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.command) {
+                    navigator.clipboard.writeText(data.command)
+                        .then(() => {
+                            // Change button text briefly
+                            const originalText = button.innerHTML;
+                            button.innerHTML = '<i class="fas fa-check"></i> Copied!';
+                            setTimeout(() => {
+                                button.innerHTML = originalText;
+                            }, 2000);
+                        })
+                        .catch(err => {
+                            console.error('Could not copy text: ', err);
+                            alert('Failed to copy to clipboard. Try again or copy manually.');
+                        });
+                } else {
+                    alert('Could not generate SSH command');
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert('An error occurred while generating the SSH command');
+            });
     });
-    
-    // Connect to SSH server using terminal
-    const connectButtons = document.querySelectorAll('.connect-ssh-server');
-    connectButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const host = this.getAttribute('data-host');
-            const button = this;
-            button.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i> Connecting...';
-            button.disabled = true;
-            
-            fetch(`/servers/generate_command/${host}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.command) {
-                        const command = data.command;
-                        // Create a form to submit the command as POST
-                        const form = document.createElement('form');
-                        form.method = 'post';
-                        form.action = `/servers/connect/${host}`;
-                        form.style.display = 'none';
-                        
-                        // Add the command
-                        const commandInput = document.createElement('input');
-                        commandInput.type = 'hidden';
-                        commandInput.name = 'command';
-                        commandInput.value = command;
-                        form.appendChild(commandInput);
-                        
-                        // Add server information for enhanced UI
-                        const serverHostInput = document.createElement('input');
-                        serverHostInput.type = 'hidden';
-                        serverHostInput.name = 'server_host';
-                        serverHostInput.value = data.host || host;
-                        form.appendChild(serverHostInput);
-                        
-                        const authTypeInput = document.createElement('input');
-                        authTypeInput.type = 'hidden';
-                        authTypeInput.name = 'auth_type';
-                        authTypeInput.value = data.auth_type || 'key';
-                        form.appendChild(authTypeInput);
-                        
-                        if (data.user) {
-                            const userInput = document.createElement('input');
-                            userInput.type = 'hidden';
-                            userInput.name = 'user';
-                            userInput.value = data.user;
-                            form.appendChild(userInput);
-                        }
-                        
-                        if (data.hostname) {
-                            const hostnameInput = document.createElement('input');
-                            hostnameInput.type = 'hidden';
-                            hostnameInput.name = 'hostname';
-                            hostnameInput.value = data.hostname;
-                            form.appendChild(hostnameInput);
-                        }
-                        
-                        document.body.appendChild(form);
-                        form.submit();
-                    } else {
-                        // Reset button if error
-                        button.innerHTML = '<i class="fas fa-terminal me-1"></i> Connect';
-                        button.disabled = false;
-                        alert('Error connecting to SSH server: ' + (data.error || 'Unknown error'));
+
+    // Connect to SSH server using terminal (delegated, so rows loaded later are covered too)
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.connect-ssh-server');
+        if (!button) return;
+        const host = button.getAttribute('data-host');
+        button.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i> Connecting...';
+        button.disabled = true;
+        
+        fetch(`/servers/generate_command/${host}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.command) {
+                    const command = data.command;
+                    // Create a form to submit the command as POST
+                    const form = document.createElement('form');
+                    form.method = 'post';
+                    form.action = `/servers/connect/${host}`;
+                    form.style.display = 'none';
+                    
+                    // Add the command
+                    const commandInput = document.createElement('input');
+                    commandInput.type = 'hidden';
+                    commandInput.name = 'command';
+                    commandInput.value = command;
+                    form.appendChild(commandInput);
+                    
+                    // Add server information for enhanced UI
+                    const serverHostInput = document.createElement('input');
+                    serverHostInput.type = 'hidden';
+                    serverHostInput.name = 'server_host';
+                    serverHostInput.value = data.host || host;
+                    form.appendChild(serverHostInput);
+                    
+                    const authTypeInput = document.createElement('input');
+                    authTypeInput.type = 'hidden';
+                    authTypeInput.name = 'auth_type';
+                    authTypeInput.value = data.auth_type || 'key';
+                    form.appendChild(authTypeInput);
+                    
+                    if (data.user) {
+                        const userInput = document.createElement('input');
+                        userInput.type = 'hidden';
+                        userInput.name = 'user';
+                        userInput.value = data.user;
+                        form.appendChild(userInput);
                     }
-                })
-                .catch(error => {
+                    
+                    if (data.hostname) {
+                        const hostnameInput = document.createElement('input');
+                        hostnameInput.type = 'hidden';
+                        hostnameInput.name = 'hostname';
+                        hostnameInput.value = data.hostname;
+                        form.appendChild(hostnameInput);
+                    }
+                    
+                    document.body.appendChild(form);
+                    form.submit();
+                } else {
                     // Reset button if error
                     button.innerHTML = '<i class="fas fa-terminal me-1"></i> Connect';
                     button.disabled = false;
-                    console.error('Error:', error);
-                    alert('Error connecting to SSH server');
-                });
-        });
+                    alert('Error connecting to SSH server: ' + (data.error || 'Unknown error'));
+                }
+            })
+            .catch(error => {
+                // Reset button if error
+                button.innerHTML = '<i class="fas fa-terminal me-1"></i> Connect';
+                button.disabled = false;
+                console.error('Error:', error);
+                alert('Error connecting to SSH server');
+            });
     });
-    
+
     // Confirm database drop
     const confirmDropForm = document.getElementById('confirm-drop-form');
     if (confirmDropForm) {
@@ -206,7 +203,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const refreshDbButton = document.getElementById('refresh-db-list');
     if (refreshDbButton) {
         refreshDbButton.addEventListener('click', function() {
-            window.location.reload();
+            // Refresh the metadata snapshot on the server, then re-render the list
+            refreshDbButton.disabled = true;
+            refreshDbButton.querySelector('i').classList.add('fa-spin');
+            fetch('/databases/refresh', { method: 'POST' })
+                .finally(() => window.location.reload());
         });
     }
 });
@@ -3,32 +3,11 @@
  * Handles displaying and updating progress bars for long-running operations
  */
 
-// Configure the progress bar simulation
-const progressConfig = {
-    'extend-enterprise': {
-        steps: ['Scanning databases', 'Identifying Enterprise databases', 'Updating expiration dates', 'Finalizing'],
-        durations: [2000, 2000, 3000, 1000]
-    },
-    'drop-database': {
-        steps: ['Terminating connections', 'Removing database', 'Removing filestore', 'Finalizing'],
-        durations: [1500, 2000, 2500, 1000]
-    },
-    'restore-database': {
-        steps: ['Extracting backup', 'Creating database', 'Importing data', 'Restoring filestore', 'Applying settings', 'Finalizing'],
-        durations: [3000, 1500, 5000, 4000, 2000, 1000]
-    }
-};
-
 /**
- * Initialize a progress bar for a specific operation
- * @param {string} operationType - The type of operation (extend-enterprise, drop-database, restore-database)
- * @param {string} formId - The ID of the form that triggers the operation
+ * Get (or create) the progress container shown below a form
+ * @param {HTMLFormElement} form - The form that triggers the operation
  */
-function initOperationProgress(operationType, formId) {
-    const form = document.getElementById(formId);
-    if (!form) return;
-    
-    // Create progress bar container if it doesn't exist
+function getProgressContainer(form) {
     let progressContainer = document.querySelector('.operation-progress');
     if (!progressContainer) {
         progressContainer = document.createElement('div');
@@ -36,88 +15,310 @@ function initOperationProgress(operationType, formId) {
         progressContainer.innerHTML = `
             <div class="operation-status"></div>
             <div class="progress">
-                <div class="progress-bar progress-bar-striped progress-bar-animated" 
+                <div class="progress-bar progress-bar-striped progress-bar-animated"
                      role="progressbar" aria-valuenow="0" aria-valuemin="0" aria-valuemax="100"
                      style="width: 0%">0%</div>
             </div>
         `;
         form.parentNode.insertBefore(progressContainer, form.nextSibling);
     }
-    
-    // Handle form submission
-    form.addEventListener('submit', function(e) {
-        // Don't prevent form submission - we want the actual operation to proceed
-        // Just start showing the progress bar as visual feedback
-        
-        const progressBar = document.querySelector('.progress-bar');
-        const statusText = document.querySelector('.operation-status');
-        const config = progressConfig[operationType];
-        
-        if (!config) return;
-        
-        // Hide the form and show the progress
-        form.style.display = 'none';
-        progressContainer.style.display = 'block';
-        
-        let currentStep = 0;
-        let totalSteps = config.steps.length;
-        let progressPerStep = 100 / totalSteps;
-        
-        // Update progress for each step
-        function updateProgress() {
-            if (currentStep >= totalSteps) return;
-            
-            // Update status text
-            statusText.textContent = config.steps[currentStep];
-            
-            // Calculate progress percentage
-            let startProgress = currentStep * progressPerStep;
-            let endProgress = (currentStep + 1) * progressPerStep;
-            let duration = config.durations[currentStep];
-            let startTime = Date.now();
-            
-            // Animate progress within the step
-            function animateStep() {
-                let elapsed = Date.now() - startTime;
-                let progress = Math.min(elapsed / duration, 1);
-                let currentProgress = startProgress + (progress * (endProgress - startProgress));
-                
-                // Update progress bar
-                progressBar.style.width = currentProgress + '%';
-                progressBar.setAttribute('aria-valuenow', currentProgress);
-                progressBar.textContent = Math.round(currentProgress) + '%';
-                
-                if (progress < 1) {
-                    requestAnimationFrame(animateStep);
-                } else {
-                    // Move to next step
-                    currentStep++;
-                    if (currentStep < totalSteps) {
-                        setTimeout(updateProgress, 200); // Short delay between steps
-                    }
-                }
+    if (!progressContainer.querySelector('.operation-details')) {
+        const details = document.createElement('div');
+        details.className = 'operation-details small text-muted';
+        progressContainer.appendChild(details);
+    }
+    return progressContainer;
+}
+
+/**
+ * Set the progress bar to a percentage, or an indeterminate full bar when percent is null
+ */
+function setProgress(progressContainer, percent, statusText, detailsText) {
+    const progressBar = progressContainer.querySelector('.progress-bar');
+    const shown = percent === null ? 100 : percent;
+    progressBar.style.width = shown + '%';
+    progressBar.setAttribute('aria-valuenow', shown);
+    progressBar.textContent = percent === null ? '' : Math.floor(percent) + '%';
+    if (statusText !== undefined) {
+        progressContainer.querySelector('.operation-status').textContent = statusText;
+    }
+    if (detailsText !== undefined) {
+        progressContainer.querySelector('.operation-details').textContent = detailsText;
+    }
+}
+
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let value = bytes;
+    let unit = 0;
+    while (value >= 1024 && unit < units.length - 1) {
+        value /= 1024;
+        unit++;
+    }
+    return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+}
+
+function formatDuration(seconds) {
+    seconds = Math.round(seconds);
+    if (seconds < 60) return `${seconds}s`;
+    if (seconds < 3600) return `${Math.floor(seconds / 60)}m ${seconds % 60}s`;
+    return `${Math.floor(seconds / 3600)}h ${Math.floor(seconds % 3600 / 60)}m`;
+}
+
+/**
+ * Describe an operation's counters, throughput and ETA in one line
+ * @param {Object} operation - Operation state from /api/operations/<id>
+ */
+function describeOperation(operation) {
+    const counters = operation.counters;
+    const parts = [];
+    if (counters.bytes_total) {
+        parts.push(`${formatBytes(counters.bytes_done || 0)} of ${formatBytes(counters.bytes_total)} read`);
+    }
+    if (counters.bytes_out) {
+        parts.push(`${formatBytes(counters.bytes_out)} written`);
+    }
+    if (operation.bytes_per_second) {
+        parts.push(`${formatBytes(operation.bytes_per_second)}/s`);
+    }
+    if (counters.toc_total) {
+        parts.push(`${counters.toc_done || 0} of ${counters.toc_total} TOC entries`);
+    }
+    if (counters.statements_done) {
+        parts.push(`${counters.statements_done.toLocaleString()} statements`);
+    }
+    if (counters.rows_done) {
+        parts.push(`${counters.rows_done.toLocaleString()} rows`);
+    }
+    if (counters.files_done) {
+        parts.push(`${counters.files_done.toLocaleString()} files (${Math.round(operation.files_per_second)}/s)`);
+    }
+    if (counters.bytes_saved) {
+        parts.push(`${formatBytes(counters.bytes_saved)} freed`);
+    }
+    if (operation.eta) {
+        parts.push(`about ${formatDuration(operation.eta)} left`);
+    }
+    return parts.join(' · ');
+}
+
+/**
+ * Follow a background operation over server-sent events
+ * @param {string} eventsUrl - The operation's event stream URL
+ * @param {HTMLElement} progressContainer - Container holding the progress bar
+ * @param {Function} onFinish - Called with the final operation state
+ */
+function trackOperation(eventsUrl, progressContainer, onFinish) {
+    const source = new EventSource(eventsUrl);
+    source.onmessage = function(event) {
+        const operation = JSON.parse(event.data);
+        setProgress(progressContainer, operation.percent, operation.phase, describeOperation(operation));
+        if (operation.state !== 'running') {
+            source.close();
+            const progressBar = progressContainer.querySelector('.progress-bar');
+            progressBar.classList.remove('progress-bar-animated', 'progress-bar-striped', 'bg-danger');
+            progressBar.classList.add(operation.state === 'success' ? 'bg-success' : 'bg-danger');
+            progressContainer.querySelector('.spinner-border')?.remove();
+            setProgress(progressContainer, operation.state === 'success' ? 100 : operation.percent,
+                        operation.message || operation.state,
+                        `${describeOperation(operation)} · took ${formatDuration(operation.elapsed)}`);
+            if (onFinish) onFinish(operation);
+        }
+    };
+    source.onerror = function() {
+        // EventSource reconnects on its own; only give up once the stream is closed for good
+        if (source.readyState === EventSource.CLOSED) {
+            setProgress(progressContainer, null, 'Lost connection to the server', '');
+        }
+    };
+    return source;
+}
+
+// Retries per chunk before a chunked upload gives up (it can still be resumed later)
+const UPLOAD_RETRIES = 5;
+
+function describeTransfer(done, total, rate) {
+    const eta = rate ? (total - done) / rate : 0;
+    return `${formatBytes(done)} of ${formatBytes(total)} · ${formatBytes(rate)}/s · about ${formatDuration(eta)} left`;
+}
+
+/**
+ * Send form data and follow the operation the endpoint starts
+ * @param {HTMLFormElement} form - Form whose endpoint returns {operation_id, events_url}
+ * @param {FormData} formData - Data to send
+ * @param {HTMLElement} progressContainer - Container holding the progress bar
+ * @param {string} sendingText - Status shown while the data is being sent
+ * @param {Function} onFinish - Called with the final operation state
+ * @param {Function} onAccepted - Called once the endpoint has accepted the request
+ */
+function sendTrackedForm(form, formData, progressContainer, sendingText, onFinish, onAccepted) {
+    const xhr = new XMLHttpRequest();
+    const startedAt = Date.now();
+    xhr.open('POST', form.action);
+    xhr.setRequestHeader('Accept', 'application/json');
+    xhr.upload.onprogress = function(event) {
+        if (!event.lengthComputable) return;
+        const rate = event.loaded / Math.max((Date.now() - startedAt) / 1000, 0.001);
+        setProgress(progressContainer, event.loaded * 100 / event.total, sendingText,
+                    describeTransfer(event.loaded, event.total, rate));
+    };
+    xhr.onload = function() {
+        let data = {};
+        try {
+            data = JSON.parse(xhr.responseText);
+        } catch (e) {
+            data = {success: false, message: `Server returned ${xhr.status}`};
+        }
+        if (!data.success) {
+            setProgress(progressContainer, null, data.message || 'Upload failed', '');
+            form.style.display = '';
+            return;
+        }
+        if (onAccepted) onAccepted(data);
+        setProgress(progressContainer, 0, 'Starting', '');
+        trackOperation(data.events_url, progressContainer, onFinish);
+    };
+    xhr.onerror = function() {
+        setProgress(progressContainer, null, 'Upload failed', '');
+        form.style.display = '';
+    };
+    xhr.send(formData);
+}
+
+async function sha256Hex(blob) {
+    // crypto.subtle only exists in secure contexts (https or localhost); chunks go unchecked otherwise
+    if (!window.crypto || !window.crypto.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+}
+
+async function fetchUploadJson(url, options) {
+    const response = await fetch(url, options);
+    let data;
+    try {
+        data = await response.json();
+    } catch (e) {
+        data = {success: false, message: `Server returned ${response.status}`};
+    }
+    data.status = response.status;
+    return data;
+}
+
+function chunkedUploadKey(file) {
+    return `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+/**
+ * Upload a file in checksummed chunks, resuming where an earlier attempt stopped
+ * @param {File} file - The file to upload
+ * @param {Function} onProgress - Called with (bytes done, total bytes, bytes per second)
+ * @returns {Promise<string>} The upload id to submit instead of the file
+ */
+async function uploadInChunks(file, onProgress) {
+    const key = chunkedUploadKey(file);
+    let upload = null;
+    const previousId = localStorage.getItem(key);
+    if (previousId) {
+        const data = await fetchUploadJson(`/api/uploads/${previousId}`);
+        if (data.success) upload = data;
+    }
+    if (!upload) {
+        upload = await fetchUploadJson('/api/uploads', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size})
+        });
+        if (!upload.success) throw new Error(upload.message);
+        localStorage.setItem(key, upload.upload_id);
+    }
+
+    let offset = upload.offset;
+    const resumedAt = offset;
+    const startedAt = Date.now();
+    while (offset < file.size) {
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        const checksum = await sha256Hex(chunk);
+        const headers = {'Content-Type': 'application/octet-stream'};
+        if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+        for (let attempt = 1; ; attempt++) {
+            let result;
+            try {
+                result = await fetchUploadJson(`/api/uploads/${upload.upload_id}?offset=${offset}`,
+                                               {method: 'PUT', headers: headers, body: chunk});
+            } catch (e) {
+                result = {success: false, message: e.message};
+            }
+            if (result.success || (result.status === 409 && result.offset !== undefined)) {
+                // On 409 the server already has more (or less) than we thought: continue from its offset
+                offset = result.offset;
+                break;
+            }
+            if (result.status === 404) localStorage.removeItem(key);
+            if (attempt >= UPLOAD_RETRIES || result.status === 404 || result.status === 413) {
+                throw new Error(result.message || 'Upload failed');
             }
-            
-            animateStep();
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
         }
-        
-        // Start progress animation
-        updateProgress();
+        onProgress(offset, file.size, (offset - resumedAt) / Math.max((Date.now() - startedAt) / 1000, 0.001));
+    }
+    return upload.upload_id;
+}
+
+/**
+ * Submit a form with real upload progress, then follow the operation it starts.
+ * Forms with data-chunked-upload="<file input name>" send that file in resumable
+ * chunks first and submit only its upload id.
+ * @param {HTMLFormElement} form - Form whose endpoint returns {operation_id, events_url}
+ * @param {string} sendingText - Status shown while the form is being sent
+ * @param {Function} onFinish - Called with the final operation state
+ */
+function submitTrackedOperation(form, sendingText, onFinish) {
+    const progressContainer = getProgressContainer(form);
+    form.style.display = 'none';
+    progressContainer.style.display = 'block';
+    setProgress(progressContainer, 0, sendingText, '');
+
+    const fileInput = form.dataset.chunkedUpload && form.elements[form.dataset.chunkedUpload];
+    if (!fileInput || !fileInput.files.length || !window.fetch) {
+        sendTrackedForm(form, new FormData(form), progressContainer, sendingText, onFinish);
+        return;
+    }
+
+    const file = fileInput.files[0];
+    uploadInChunks(file, function(done, total, rate) {
+        setProgress(progressContainer, done * 100 / total, sendingText, describeTransfer(done, total, rate));
+    }).then(function(uploadId) {
+        const formData = new FormData(form);
+        formData.delete(fileInput.name);
+        formData.append('upload_id', uploadId);
+        sendTrackedForm(form, formData, progressContainer, 'Submitting', onFinish,
+                        () => localStorage.removeItem(chunkedUploadKey(file)));
+    }).catch(function(error) {
+        setProgress(progressContainer, null, `Upload interrupted: ${error.message}. Submit again to resume.`, '');
+        form.style.display = '';
     });
 }
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
-    // Check which operation page we're on
-    if (document.getElementById('extend-enterprise-form')) {
-        initOperationProgress('extend-enterprise', 'extend-enterprise-form');
-    }
-    
-    if (document.getElementById('drop-database-form')) {
-        initOperationProgress('drop-database', 'drop-database-form');
-    }
-    
-    if (document.getElementById('restore-database-form')) {
-        initOperationProgress('restore-database', 'restore-database-form');
-    }
+    // Restores, clones and drops run in the background and report real progress
+    // (license extension reports progress from its own result stream)
+    if (!window.EventSource) return;
+    document.querySelectorAll('form[data-tracked-operation]').forEach(form => {
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            if (!form.checkValidity()) {
+                form.classList.add('was-validated');
+                return;
+            }
+            submitTrackedOperation(form, form.dataset.trackedOperation, function(operation) {
+                if (operation.state === 'success') {
+                    setTimeout(() => { window.location.href = form.dataset.doneUrl || '/databases'; }, 1500);
+                } else {
+                    form.style.display = '';
+                }
+            });
+        });
+    });
 });
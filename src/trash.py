@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# Instant filestore removal: rename into a trash area and reclaim the space in the background
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import platform
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Hidden directory inside the filestore root, so a rename never crosses filesystems
+TRASH_DIRNAME = '.trash'
+
+# ioprio_set(2): the idle class only gets disk time nobody else wants
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'aarch64': 30,
+    'armv7l': 314,
+    'i386': 289,
+    'i686': 289,
+    'ppc64le': 273,
+    's390x': 282,
+}
+
+# Pause briefly after every batch of unlinks so metadata-heavy deletes don't starve other IO
+BATCH_FILES = 500
+BATCH_PAUSE = 0.05
+# Reclaimed entries stay visible this long (seconds) so the UI can show them as done
+RETENTION = 600
+
+
+def set_idle_io_priority():
+    """Put the calling thread in the idle IO class and at the lowest CPU priority.
+
+    Returns whether the IO priority could be set (Linux only).
+    """
+    tid = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+    except (AttributeError, OSError):
+        pass
+
+    syscall_nr = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if syscall_nr is None:
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        # IOPRIO_WHO_PROCESS with a thread id only affects that thread
+        if libc.syscall(syscall_nr, IOPRIO_WHO_PROCESS, tid, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) != 0:
+            err = ctypes.get_errno()
+            logger.warning(f"Could not set idle IO priority for filestore reclamation: {os.strerror(err)}")
+            return False
+    except OSError as e:
+        logger.warning(f"Could not set idle IO priority for filestore reclamation: {str(e)}")
+        return False
+    return True
+
+
+def _freed_bytes(st):
+    """Space unlinking a file gives back; nothing while another hardlink (see dedup) keeps it"""
+    return st.st_size if st.st_nlink == 1 else 0
+
+
+class TrashEntry:
+    """A trashed directory waiting to be (or being) reclaimed"""
+
+    def __init__(self, path, label, bytes_total=None):
+        self.path = path
+        self.label = label
+        self.bytes_total = bytes_total
+        self.bytes_done = 0
+        self.files_done = 0
+        self.state = 'queued'
+        self.error = None
+        self.trashed_at = time.time()
+        self.finished_at = None
+
+    @property
+    def reclaimable_bytes(self):
+        if self.state in ('reclaimed', 'error') or self.bytes_total is None:
+            return 0
+        return max(self.bytes_total - self.bytes_done, 0)
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'state': self.state,
+            'bytes_total': self.bytes_total,
+            'bytes_done': self.bytes_done,
+            'files_done': self.files_done,
+            'reclaimable_bytes': self.reclaimable_bytes,
+            'percent': min(100.0, self.bytes_done * 100.0 / self.bytes_total) if self.bytes_total else None,
+            'error': self.error,
+            'trashed_at': self.trashed_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class FilestoreTrash:
+    """Removes filestores by renaming them into ``<root>/.trash``.
+
+    The rename is instant whatever the filestore size; a single background
+    thread with idle IO priority then deletes the trashed trees one after
+    the other. Leftovers from a previous run are picked up on start.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.trash_dir = os.path.join(root, TRASH_DIRNAME)
+        self.idle_io = None
+        self._entries = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_started(self):
+        """Start the reclaim thread once, queueing whatever is already in the trash"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    os.makedirs(self.trash_dir, exist_ok=True)
+                    for name in sorted(os.listdir(self.trash_dir)):
+                        self._enqueue(TrashEntry(os.path.join(self.trash_dir, name), name.rsplit('-', 1)[0]))
+                    self._thread = threading.Thread(target=self._run, name='filestore-trash', daemon=True)
+                    self._thread.start()
+
+    def move(self, path, label=None, size=None):
+        """Move ``path`` into the trash and queue it for reclamation.
+
+        ``size`` (bytes, if known) is reported as reclaimable right away.
+        Returns the TrashEntry, or None if ``path`` doesn't exist.
+        """
+        if not os.path.exists(path):
+            return None
+        self.ensure_started()
+        label = label or os.path.basename(path)
+        target = os.path.join(self.trash_dir, f"{label}-{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(path, target)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EBUSY):
+                raise
+            # A mount point can't be renamed; delete it in place on this thread instead
+            logger.warning(f"Cannot move {path} to the trash ({os.strerror(e.errno)}), deleting it in place")
+            shutil.rmtree(path)
+            return None
+
+        entry = TrashEntry(target, label, size)
+        with self._lock:
+            self._enqueue(entry)
+        return entry
+
+    def status(self):
+        """Reclaimable bytes and per-entry progress"""
+        with self._lock:
+            self._prune()
+            entries = [entry.to_dict() for entry in self._entries]
+        return {
+            'reclaimable_bytes': sum(entry['reclaimable_bytes'] for entry in entries),
+            'pending': sum(1 for entry in entries if entry['state'] in ('queued', 'measuring', 'reclaiming')),
+            'idle_io': self.idle_io,
+            'entries': entries,
+        }
+
+    def _enqueue(self, entry):
+        """Track and queue an entry (lock held)"""
+        self._entries.append(entry)
+        self._queue.put(entry)
+
+    def _prune(self):
+        now = time.time()
+        self._entries = [entry for entry in self._entries
+                         if not entry.finished_at or now - entry.finished_at < RETENTION]
+
+    def _run(self):
+        self.idle_io = set_idle_io_priority()
+        while True:
+            entry = self._queue.get()
+            try:
+                self._reclaim(entry)
+                entry.state = 'reclaimed'
+            except Exception as e:
+                logger.error(f"Error reclaiming {entry.path}: {str(e)}")
+                entry.state = 'error'
+                entry.error = str(e)
+            entry.finished_at = time.time()
+
+    def _reclaim(self, entry):
+        if entry.bytes_total is None:
+            entry.state = 'measuring'
+            entry.bytes_total = self._measure(entry.path)
+        entry.state = 'reclaiming'
+
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(entry.path, topdown=False):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    size = _freed_bytes(os.lstat(path))
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                entry.bytes_done += size
+                entry.files_done += 1
+                removed += 1
+                if removed % BATCH_FILES == 0:
+                    time.sleep(BATCH_PAUSE)
+            for dirname in dirnames:
+                path = os.path.join(dirpath, dirname)
+                if os.path.islink(path):
+                    os.unlink(path)
+                else:
+                    os.rmdir(path)
+        if os.path.isdir(entry.path):
+            os.rmdir(entry.path)
+        logger.info(f"Reclaimed {entry.bytes_done} bytes ({entry.files_done} files) from {entry.label}")
+
+    @staticmethod
+    def _measure(path):
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += _freed_bytes(os.lstat(os.path.join(dirpath, filename)))
+                except FileNotFoundError:
+                    pass
+        return total
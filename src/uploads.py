@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# Resumable chunked uploads assembled by append, with per-chunk SHA-256 checks
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Clients send chunks of this size; well below MAX_CONTENT_LENGTH
+CHUNK_SIZE = 16 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+# Unfinished uploads are deleted after this many seconds without a chunk
+STALE_AFTER = 24 * 3600
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """Uploads received as sequential chunks and appended to ``<id>.part``.
+
+    Each upload keeps its metadata in ``<id>.json`` next to the data, so an
+    interrupted client (or a restarted server) can ask for the current
+    offset and resume from there. A chunk is only accepted at the current
+    offset; a chunk whose SHA-256 doesn't match is cut off again.
+
+    The SHA-256 of the whole file is computed as chunks arrive, so callers
+    that need it (the restore cache) don't have to read the file again. It
+    is kept in memory only; an upload resumed after a restart has none.
+    """
+
+    def __init__(self, upload_dir, chunk_size=CHUNK_SIZE):
+        self.upload_dir = upload_dir
+        self.chunk_size = chunk_size
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # upload id -> (bytes hashed, running SHA-256 of the file)
+        self._digests = {}
+
+    def create(self, filename, size):
+        """Start an upload of ``size`` bytes; returns its state"""
+        if not filename:
+            raise UploadError('Missing file name')
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('Invalid file size')
+        self._prune()
+
+        state = {
+            'upload_id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'offset': 0,
+            'chunk_size': self.chunk_size,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+        }
+        open(self._data_path(state['upload_id']), 'wb').close()
+        self._save(state)
+        self._digests[state['upload_id']] = (0, hashlib.sha256())
+        return state
+
+    def status(self, upload_id):
+        """Current state; ``offset`` only counts verified chunks, so resuming there is always safe"""
+        return self._load(upload_id)
+
+    def append(self, upload_id, offset, stream, length, sha256=None):
+        """Append ``length`` bytes from ``stream`` at ``offset``; returns the new state.
+
+        The chunk is streamed to disk while it is hashed, never held in memory.
+        """
+        if length is None or length <= 0:
+            raise UploadError('Empty chunk')
+        if length > MAX_CHUNK_SIZE:
+            raise UploadError(f'Chunk larger than {MAX_CHUNK_SIZE} bytes', status=413)
+
+        with self._lock(upload_id):
+            state = self.status(upload_id)
+            if offset != state['offset']:
+                raise UploadError(f"Expected offset {state['offset']}", status=409, offset=state['offset'])
+            if offset + length > state['size']:
+                raise UploadError('Chunk goes past the end of the file')
+
+            digest = hashlib.sha256()
+            # Extended on a copy, so a rejected chunk leaves the file hash where it was
+            running = self._digests.get(upload_id)
+            file_digest = running[1].copy() if running and running[0] == offset else None
+            received = 0
+            with open(self._data_path(upload_id), 'r+b') as data:
+                data.seek(offset)
+                try:
+                    while received < length:
+                        block = stream.read(min(READ_SIZE, length - received))
+                        if not block:
+                            break
+                        data.write(block)
+                        digest.update(block)
+                        if file_digest is not None:
+                            file_digest.update(block)
+                        received += len(block)
+                    if received != length:
+                        raise UploadError(f'Chunk truncated: {received} of {length} bytes received')
+                    if sha256 and digest.hexdigest() != sha256.lower():
+                        raise UploadError('Chunk checksum mismatch', status=422, offset=offset)
+                except BaseException:
+                    # Drop the partial chunk so the client can resend it from the same offset
+                    data.truncate(offset)
+                    raise
+                data.truncate(offset + length)
+
+            if file_digest is not None:
+                self._digests[upload_id] = (offset + length, file_digest)
+            else:
+                self._digests.pop(upload_id, None)
+            state['offset'] = offset + length
+            state['updated_at'] = time.time()
+            self._save(state)
+            return state
+
+    def complete(self, upload_id, dest_path):
+        """Move a fully received upload to ``dest_path`` and forget it.
+
+        The returned state has the file's ``sha256`` when it was hashed on arrival, else None.
+        """
+        with self._lock(upload_id):
+            state = self.status(upload_id)
+            if state['offset'] != state['size']:
+                raise UploadError(f"Upload incomplete: {state['offset']} of {state['size']} bytes received",
+                                  status=409, offset=state['offset'])
+            os.replace(self._data_path(upload_id), dest_path)
+            os.remove(self._meta_path(upload_id))
+            running = self._digests.pop(upload_id, None)
+            state['sha256'] = running[1].hexdigest() if running and running[0] == state['size'] else None
+        self._forget_lock(upload_id)
+        return state
+
+    def abort(self, upload_id):
+        with self._lock(upload_id):
+            self._load(upload_id)
+            for path in (self._data_path(upload_id), self._meta_path(upload_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._digests.pop(upload_id, None)
+        self._forget_lock(upload_id)
+
+    # === Storage ===
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.json")
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.upload_dir, f"{upload_id}.part")
+
+    def _load(self, upload_id):
+        # Upload ids are generated by us; anything else is not a known upload
+        if not upload_id or not upload_id.isalnum():
+            raise UploadError('Upload not found', status=404)
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload not found', status=404)
+
+    def _save(self, state):
+        path = self._meta_path(state['upload_id'])
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    def _lock(self, upload_id):
+        with self._locks_lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _forget_lock(self, upload_id):
+        with self._locks_lock:
+            self._locks.pop(upload_id, None)
+
+    def _prune(self):
+        now = time.time()
+        for name in os.listdir(self.upload_dir):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            try:
+                state = self._load(upload_id)
+                if now - state['updated_at'] > STALE_AFTER:
+                    logger.info(f"Removing stale upload {state['filename']} ({upload_id})")
+                    self.abort(upload_id)
+            except (UploadError, OSError, ValueError) as e:
+                logger.error(f"Error pruning upload {upload_id}: {str(e)}")